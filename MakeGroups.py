@@ -7,22 +7,115 @@ Fonctions pour charger, répartir, enregistrer, et gérer l'historique de groupe
 from pathlib import Path
 import pandas as pd
 import os
+import io
+import json
+import hashlib
 import unicodedata
 import re
+import shutil
 import random
+import time
+import bisect
+import threading
+import functools
+from collections.abc import Sequence
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import wait as attendre_futures
+from MakeGroups_Trace import tracer
+
+class OperationAnnulee(Exception):
+    """
+    Levée par un rappel de progression pour interrompre une opération longue (ex : bouton « Annuler »).
+    """
 
 # ==============================================================================
 # 0. Lecture et normalisation des fichiers d'élèves
 # ==============================================================================
 
-def read_csv_utf8_fallback(path):
+DOSSIER_CACHE = os.path.join(Path.home(), ".makegroups", "cache")
+TAILLE_MAX_CACHE = 200 * 1024 * 1024  # octets ; les entrées les moins récemment utilisées sont évincées
+
+def detecter_encodage(contenu):
     """
-    Tente de lire un CSV en UTF-8, puis latin1 si une erreur Unicode survient.
+    Détecte l'encodage d'un CSV à partir de ses octets, avant toute analyse :
+    UTF-8 (avec ou sans BOM) si le contenu est décodable, sinon latin1.
     """
+    if contenu.startswith(b'\xef\xbb\xbf'):
+        return 'utf-8-sig'
     try:
-        return pd.read_csv(path, encoding='utf-8')
+        contenu.decode('utf-8')
+        return 'utf-8'
     except UnicodeDecodeError:
-        return pd.read_csv(path, encoding='latin1')
+        return 'latin1'
+
+def read_csv_utf8_fallback(path, contenu=None):
+    """
+    Lit un CSV en UTF-8, ou en latin1 si le contenu n'est pas de l'UTF-8 valide.
+    L'encodage est détecté une fois sur les octets : le fichier n'est analysé qu'une fois.
+    contenu : octets du fichier s'ils sont déjà lus (voir charger_fichier).
+    """
+    if contenu is None:
+        with open(path, 'rb') as f:
+            contenu = f.read()
+    return pd.read_csv(io.BytesIO(contenu), encoding=detecter_encodage(contenu))
+
+def _chemin_cache(path, contenu):
+    """
+    Fichier de cache d'un fichier élèves : clé = chemin, taille, date de modification et empreinte du contenu.
+    """
+    infos = os.stat(path)
+    empreinte = hashlib.blake2b(contenu, digest_size=16).hexdigest()
+    cle = f"{os.path.abspath(path)}|{infos.st_size}|{infos.st_mtime_ns}|{empreinte}"
+    return os.path.join(DOSSIER_CACHE, hashlib.blake2b(cle.encode('utf-8'), digest_size=16).hexdigest() + ".pkl")
+
+def _lire_cache(chemin):
+    """
+    Objet enregistré dans une entrée du cache, ou None si elle est absente ou illisible.
+    """
+    if not os.path.exists(chemin):
+        return None
+    try:
+        objet = pd.read_pickle(chemin)
+        os.utime(chemin)  # entrée récemment utilisée
+        return objet
+    except Exception:
+        return None
+
+def _ecrire_cache(chemin, objet):
+    """
+    Enregistre une entrée du cache (écriture atomique), puis évince au besoin les plus anciennes.
+    """
+    try:
+        os.makedirs(DOSSIER_CACHE, exist_ok=True)
+        temporaire = f"{chemin}.{os.getpid()}.tmp"
+        pd.to_pickle(objet, temporaire)
+        os.replace(temporaire, chemin)
+        _evincer_cache()
+    except OSError:
+        pass  # Le cache est facultatif (dossier non accessible en écriture, disque plein...)
+
+def _evincer_cache():
+    """
+    Supprime les entrées les moins récemment utilisées tant que le cache dépasse TAILLE_MAX_CACHE.
+    """
+    entrees = [e for e in os.scandir(DOSSIER_CACHE) if e.name.endswith(".pkl")]
+    entrees.sort(key=lambda e: e.stat().st_mtime)
+    total = sum(e.stat().st_size for e in entrees)
+    for e in entrees:
+        if total <= TAILLE_MAX_CACHE:
+            break
+        total -= e.stat().st_size
+        os.remove(e.path)
+
+def vider_cache():
+    """
+    Supprime toutes les entrées du cache (fichiers élèves et résultats de génération).
+    """
+    if os.path.isdir(DOSSIER_CACHE):
+        for e in os.scandir(DOSSIER_CACHE):
+            if e.name.endswith(".pkl"):
+                os.remove(e.path)
 
 def normaliser_colonnes(df):
     """
@@ -35,25 +128,29 @@ def normaliser_colonnes(df):
     mapping = {col: mapped_col.strip().capitalize() for col, mapped_col in mapping.items()}
     return df.rename(columns=mapping)
 
-def charger_fichier(path):
+@tracer
+def charger_fichier(path, cache=True):
     """
     Charge un fichier d'élèves (CSV ou Excel) dans un DataFrame pandas.
-    - Accepte : .csv, .xlsx, .xls
+    - Accepte : .csv, .xlsx, .xls
     - Normalise les colonnes pour garantir 'Nom', 'Prenom', 'Classe', 'Niveau'
     - Remplit les valeurs manquantes par '' (chaine vide)
     - Renvoie le DataFrame prêt à l'emploi
+    - Le DataFrame normalisé est mis en cache (format binaire, voir DOSSIER_CACHE) :
+      la réouverture d'un fichier inchangé ne le relit pas
 
     Paramètres :
         path (str) : chemin du fichier à charger
+        cache (bool) : utiliser le cache des fichiers élèves
 
     Exceptions :
         ValueError si le format de fichier est incorrect ou si les colonnes sont absentes
     """
     ext = Path(path).suffix.lower()
     open_funcs = {
-        '.csv': read_csv_utf8_fallback,
-        '.xlsx': pd.read_excel,
-        '.xls': pd.read_excel,
+        '.csv': functools.partial(read_csv_utf8_fallback, path),
+        '.xlsx': lambda contenu: pd.read_excel(io.BytesIO(contenu)),
+        '.xls': lambda contenu: pd.read_excel(io.BytesIO(contenu)),
     }
     if ext not in open_funcs:
         raise ValueError(
@@ -61,7 +158,19 @@ def charger_fichier(path):
             "Formats acceptés : .csv, .xlsx, .xls"
         )
     try:
-        df = open_funcs[ext](path)
+        with open(path, 'rb') as f:
+            contenu = f.read()
+    except OSError as e:
+        raise ValueError(f"Erreur lors de la lecture du fichier {os.path.basename(path)} :\n{e}")
+
+    chemin_cache = _chemin_cache(path, contenu) if cache else None
+    if chemin_cache:
+        df = _lire_cache(chemin_cache)
+        if df is not None:
+            return df
+
+    try:
+        df = open_funcs[ext](contenu)
     except Exception as e:
         raise ValueError(f"Erreur lors de la lecture du fichier {os.path.basename(path)} :\n{e}")
     df = normaliser_colonnes(df)
@@ -72,8 +181,119 @@ def charger_fichier(path):
             f"Colonnes trouvées : {list(df.columns)}"
         )
     df.fillna('', inplace=True)
+
+    if chemin_cache:
+        _ecrire_cache(chemin_cache, df)
     return df
 
+COLONNES_ECOLE = ("Ecole", "Etablissement", "College", "Uai", "Rne")  # après normaliser_colonnes
+TAILLE_BLOC_EXPORT = 50_000  # lignes lues à la fois par partitionner_export
+
+def _regle_lots(regle):
+    """
+    Vérifie la règle de regroupement des classes en lots et la renvoie sous forme de fonction
+    (bloc normalisé -> Series des noms de lot), ou None sans règle. Un lot regroupe des classes entières
+    (le niveau d'un élève sert à la répartition dans les groupes, pas au découpage) :
+    - "prefixe:N" : un lot par début de nom de classe (ex : "prefixe:1" regroupe 601, 602... en "6")
+    - dict {classe: lot} (classes absentes : lot "autres") ou fonction classe -> lot
+    """
+    if regle is None:
+        return None
+    if isinstance(regle, str) and regle.startswith("prefixe:") and regle[len("prefixe:"):].isdigit():
+        longueur = int(regle[len("prefixe:"):])
+        return lambda bloc: bloc['Classe'].str.strip().str[:longueur]
+    if isinstance(regle, dict):
+        lots = {str(classe).strip(): str(lot) for classe, lot in regle.items()}
+        return lambda bloc: bloc['Classe'].str.strip().map(lots).fillna("autres")
+    if callable(regle):
+        return lambda bloc: bloc['Classe'].str.strip().map(lambda classe: str(regle(classe)))
+    raise ValueError(
+        f"Règle de lots non prise en charge : {regle}\n"
+        "Règles acceptées : prefixe:N, dictionnaire {classe: lot} ou fonction"
+    )
+
+@tracer
+def partitionner_export(path, dossier_sortie, regle=None, colonne_ecole=None, taille_bloc=TAILLE_BLOC_EXPORT):
+    """
+    Découpe un grand export CSV (plusieurs établissements) en fichiers élèves par lot, sans le charger
+    en entier : le fichier est lu par blocs de taille_bloc lignes, chaque bloc est normalisé
+    (normaliser_colonnes) puis ajouté aux fichiers CSV de ses lots. La mémoire utilisée ne dépend
+    que de taille_bloc, pas de la taille de l'export.
+    - Un lot par établissement (colonne colonne_ecole, par défaut la première de COLONNES_ECOLE présente),
+      éventuellement subdivisé par la règle de lots (voir _regle_lots)
+    - Les fichiers sont écrits dans un dossier temporaire puis déplacés une fois l'export entièrement lu :
+      un découpage interrompu ne laisse aucun fichier partiel
+    - Chaque fichier produit se charge directement avec charger_fichier
+    Renvoie {nom du lot: chemin du fichier}.
+    """
+    if Path(path).suffix.lower() != '.csv':
+        raise ValueError("Le découpage par blocs ne prend en charge que les exports CSV (.csv).")
+    lots_classes = _regle_lots(regle)
+    with open(path, 'rb') as f:
+        debut = f.read(3)
+    # L'encodage ne peut être vérifié qu'en lisant : UTF-8 d'abord, latin1 si un bloc n'est pas décodable
+    encodages = ['utf-8-sig'] if debut == b'\xef\xbb\xbf' else ['utf-8', 'latin1']
+    for encodage in encodages:
+        temporaire = os.path.join(dossier_sortie, f".decoupage_{os.getpid()}")
+        os.makedirs(temporaire, exist_ok=True)
+        try:
+            fichiers = _decouper_blocs(path, encodage, temporaire, lots_classes, colonne_ecole, taille_bloc)
+        except UnicodeDecodeError:
+            shutil.rmtree(temporaire, ignore_errors=True)
+            if encodage == encodages[-1]:
+                raise
+            continue
+        except BaseException:
+            shutil.rmtree(temporaire, ignore_errors=True)
+            raise
+        chemins = {}
+        for lot, nom in fichiers.items():
+            chemins[lot] = os.path.join(dossier_sortie, nom)
+            os.replace(os.path.join(temporaire, nom), chemins[lot])
+        shutil.rmtree(temporaire, ignore_errors=True)
+        return chemins
+
+def _decouper_blocs(path, encodage, dossier, lots_classes, colonne_ecole, taille_bloc):
+    """
+    Lit l'export par blocs et ajoute les lignes de chaque lot à son fichier CSV.
+    Renvoie {nom du lot: nom du fichier}.
+    """
+    fichiers = {}
+    lecteur = pd.read_csv(path, encoding=encodage, dtype=str, keep_default_na=False, chunksize=taille_bloc)
+    for bloc in lecteur:
+        bloc = normaliser_colonnes(bloc)
+        if not fichiers:
+            expected = {'Nom', 'Prenom', 'Classe', 'Niveau'}
+            if not expected.issubset(bloc.columns):
+                raise ValueError(
+                    f"Le fichier doit contenir les colonnes suivantes : {expected}\n"
+                    f"Colonnes trouvées : {list(bloc.columns)}"
+                )
+            if colonne_ecole is None:
+                colonne_ecole = next((c for c in COLONNES_ECOLE if c in bloc.columns), None)
+            if colonne_ecole is None and lots_classes is None:
+                raise ValueError(
+                    "Aucune colonne d'établissement trouvée "
+                    f"({', '.join(COLONNES_ECOLE)}) : indiquez une règle de lots."
+                )
+        parties = []
+        if colonne_ecole is not None:
+            parties.append(bloc[colonne_ecole].str.strip())
+        if lots_classes is not None:
+            parties.append(lots_classes(bloc))
+        cles = parties[0] if len(parties) == 1 else parties[0] + "_" + parties[1]
+        for lot, lignes in bloc.groupby(cles.to_numpy(), sort=False):
+            lot = str(lot)
+            nouveau = lot not in fichiers
+            if nouveau:
+                nom = re.sub(r"[^\w\-]+", "_", lot).strip("_") or "sans_nom"
+                while nom + ".csv" in fichiers.values():
+                    nom += "_"
+                fichiers[lot] = nom + ".csv"
+            with open(os.path.join(dossier, fichiers[lot]), 'a', encoding='utf-8', newline='') as f:
+                lignes.to_csv(f, header=nouveau, index=False)
+    return fichiers
+
 # ==============================================================================
 # 1. Fonctions de gestion des groupes et périodes
 # ==============================================================================
@@ -96,14 +316,16 @@ def repartir_niveau(nb_eleves, nb_groupes, alternance_start=0):
         repartition[(i + alternance_start) % nb_groupes] += 1
     return repartition
 
-def generer_repartition_auto(df, nb_groupes):
+@tracer
+def generer_repartition_auto(df, nb_groupes, decalage=0):
     """
     Génère une répartition équilibrée automatique par niveau avec alternance.
+    decalage : surplus décalé d'autant de groupes (ex : quotas d'une période avancée dans le plan de l'année).
     """
     niveaux = compter_niveaux(df)
     repartition = {}
     for i, (niveau, total) in enumerate(niveaux.items()):
-        repartition[niveau] = repartir_niveau(total, nb_groupes, alternance_start=i)
+        repartition[niveau] = repartir_niveau(total, nb_groupes, alternance_start=i + decalage)
     return repartition
 
 def verifier_coherence_repartition(repartition, niveaux, nb_groupes):
@@ -132,114 +354,1332 @@ def normalize_str(s):
     s = unicodedata.normalize('NFKD', s).encode('ascii', 'ignore').decode('utf-8')
     return s.lower().strip()
 
-def detecter_prochaine_periode(df):
+def colonnes_periodes(df):
     """
-    Détecte la prochaine période à créer à partir des colonnes du DataFrame,
-    robustement (casse, accents, espaces...).
+    Retourne {colonne: numéro de période} pour les colonnes "Groupe Période X"
+    du DataFrame, robustement (casse, accents, espaces...).
     """
-    periodes = []
+    colonnes = {}
     for col in df.columns:
-        col_norm = normalize_str(col)
+        col_norm = normalize_str(str(col))
         m = re.search(r"groupe\s*periode\s*(\d+)", col_norm)
         if m:
-            periodes.append(int(m.group(1)))
+            colonnes[col] = int(m.group(1))
+    return colonnes
+
+CLES_IDENTITE = ['Nom', 'Prenom', 'Classe']
+
+@functools.lru_cache(maxsize=1 << 16)
+def normaliser_texte(texte):
+    """
+    Forme normalisée d'un nom, prénom ou nom de classe, pour reconnaître un élève d'un export à l'autre :
+    sans accents, en minuscules, tirets et apostrophes remplacés par des espaces, espaces réduits
+    (ex : " Élodie-Anne " et "elodie anne"). Mémorisée : chaque texte distinct n'est traité qu'une fois.
+    """
+    texte = normalize_str(texte)
+    return " ".join(re.sub(r"[-'’]", " ", texte).split())
+
+def normaliser_colonne(valeurs):
+    """
+    normaliser_texte appliquée à une colonne : une seule normalisation par valeur distincte.
+    """
+    codes, distinctes = pd.factorize(pd.Series(valeurs).astype(str), use_na_sentinel=False)
+    normalisees = np.array([normaliser_texte(v) for v in distinctes], dtype=object)
+    return normalisees[codes]
+
+def hacher_identites(noms, prenoms, classes, rangs):
+    """
+    Identifiant entier (64 bits) de chaque identité normalisée (nom, prénom, classe, rang) :
+    sert de clé aux recherches et fusions d'historique à la place des chaînes.
+    """
+    cles = pd.DataFrame({'nom': noms, 'prenom': prenoms, 'classe': classes, 'rang': np.asarray(rangs, dtype=np.int64)})
+    return pd.util.hash_pandas_object(cles, index=False).to_numpy().view(np.int64)
+
+def identites(df):
+    """
+    Index des identités des élèves, aligné sur l'index de df, calculé en une passe :
+    - nom, prenom, classe : valeurs normalisées (voir normaliser_texte)
+    - rang : numéro d'ordre parmi les homonymes (même identité normalisée) d'une même classe
+    - niveau, homonyme (vrai si l'identité normalisée est partagée par plusieurs lignes)
+    - id : identifiant entier haché (voir hacher_identites)
+    """
+    cles = pd.DataFrame({
+        'nom': normaliser_colonne(df['Nom']),
+        'prenom': normaliser_colonne(df['Prenom']),
+        'classe': normaliser_colonne(df['Classe']),
+    }, index=df.index)
+    groupes = cles.groupby(['nom', 'prenom', 'classe'], sort=False)
+    cles['rang'] = groupes.cumcount()
+    cles['niveau'] = df['Niveau'].astype(str).str.strip()
+    cles['homonyme'] = groupes['nom'].transform('size').to_numpy() > 1
+    cles['id'] = hacher_identites(cles['nom'], cles['prenom'], cles['classe'], cles['rang'])
+    return cles
+
+def homonymes(df):
+    """
+    Homonymes du fichier élèves (même nom, prénom et classe une fois normalisés) : ils ne sont
+    distingués que par leur ordre dans le fichier (voir identites), à garder d'une période à l'autre.
+    Renvoie la liste des "Prenom Nom (Classe) ×N", dans l'ordre du fichier.
+    """
+    cles = identites(df)
+    lignes = df[cles['homonyme'].to_numpy()]
+    nombres = cles[cles['homonyme']].groupby(['nom', 'prenom', 'classe'], sort=False).size()
+    premieres = lignes[(cles.loc[cles['homonyme'], 'rang'] == 0).to_numpy()]
+    return [
+        f"{ligne['Prenom']} {ligne['Nom']} ({ligne['Classe']}) ×{n}"
+        for (_, ligne), n in zip(premieres.iterrows(), nombres)
+    ]
+
+def detecter_prochaine_periode(df):
+    """
+    Détecte la prochaine période à créer à partir des colonnes du DataFrame,
+    robustement (casse, accents, espaces...).
+    """
+    periodes = colonnes_periodes(df).values()
     if periodes:
         return max(periodes) + 1
     else:
         return 1
 
-def ajouter_groupes_au_df(df_original, groupes, chemin_csv, dossier_parent):
+@tracer
+def ajouter_groupes_au_df(df_original, groupes, chemin_csv, dossier_parent, base_historique=None, periode=None,
+                          format=None, nb_threads=None, progression=None):
     """
     Ajoute une nouvelle colonne "Groupe Période X" au DataFrame original
     et sauvegarde le fichier dans un dossier du type "<nom_classes>_PériodeX".
+    groupes : GroupesAffectes de df_original (voir generer_groupes), ou liste de DataFrames
+    conservant l'index des lignes de df_original.
+    format : si donné, les fichiers de groupes (voir sauvegarder_groupes) sont écrits avec le fichier élèves,
+    en une seule passe : si une écriture échoue, aucun fichier de la période n'est créé ni remplacé.
+    Si une base d'historique est fournie (voir MakeGroups_Historique), la période y est ajoutée
+    une fois les fichiers écrits ; la colonne n'est ajoutée à df_original qu'après l'écriture.
+    periode : période à (ré)écrire (ex : mise à jour, voir reaffecter_groupes) ; par défaut la prochaine.
     Retourne (chemin_dossier, nom_classes, periode)
     """
-    periode = detecter_prochaine_periode(df_original)
+    if periode is None:
+        periode = detecter_prochaine_periode(df_original)
+        if base_historique is not None:
+            periode = max(periode, base_historique.prochaine_periode(df_original))
     nouvelle_colonne = f"Groupe Période {periode}"
-    df_original[nouvelle_colonne] = ""
 
-    for i, groupe in enumerate(groupes):
-        for _, eleve in groupe.iterrows():
-            masque = (
-                (df_original['Nom'] == eleve['Nom']) &
-                (df_original['Prenom'] == eleve['Prenom']) &
-                (df_original['Classe'] == eleve['Classe'])
-            )
-            df_original.loc[masque, nouvelle_colonne] = i + 1
+    # Numéro de groupe de chaque ligne, lu directement dans l'affectation (les homonymes restent distincts)
+    numeros = _affectation_des_groupes(df_original, groupes) + 1
+    colonne = numeros.astype(object)
+    colonne[numeros == 0] = ""
+    colonne = pd.Series(colonne, index=df_original.index, dtype=object)
 
     nom_classes = extraire_nom_classes(df_original)
+    fichiers = {} if format is None else fichiers_groupes(groupes, nom_classes, periode, format)
+    fichiers[f"{nom_classes}_Période{periode}.xlsx"] = {"Feuil1": df_original.assign(**{nouvelle_colonne: colonne})}
     nom_dossier = f"{nom_classes}_Période{periode}"
     dossier_complet = os.path.join(dossier_parent, nom_dossier)
-    os.makedirs(dossier_complet, exist_ok=True)
-    base_path = os.path.join(dossier_complet, f"{nom_classes}_Période{periode}")
-    df_original.to_excel(f"{base_path}.xlsx", index=False)
+    ecrire_fichiers(dossier_complet, fichiers, nb_threads, progression)
+
+    df_original[nouvelle_colonne] = colonne
+    if base_historique is not None:
+        base_historique.enregistrer_periode(df_original, periode, nouvelle_colonne)
     return dossier_complet, nom_classes, periode
 
-def sauvegarder_groupes(groupes, dossier_sortie, nom_classes, periode):
+FORMATS_EXPORT = ("xlsx", "classeur", "csv", "parquet")
+
+def _chemin_manifeste(dossier):
+    """
+    Manifeste des exports d'un dossier, gardé dans le cache (voir DOSSIER_CACHE) plutôt que dans
+    le dossier de période ouvert par les enseignants ; clé = chemin absolu du dossier.
+    """
+    cle = os.path.normcase(os.path.abspath(dossier))
+    nom = hashlib.blake2b(cle.encode('utf-8'), digest_size=16).hexdigest() + ".json"
+    return os.path.join(DOSSIER_CACHE, "exports", nom)
+
+def _signature_fichier(chemin):
+    """
+    (taille, date de modification) d'un fichier, ou None s'il n'existe pas.
+    """
+    try:
+        infos = os.stat(chemin)
+    except OSError:
+        return None
+    return [infos.st_size, infos.st_mtime_ns]
+
+def _empreinte_feuilles(feuilles):
+    """
+    Empreinte du contenu à écrire (noms de feuilles, colonnes, valeurs), indépendante des métadonnées
+    du fichier (un classeur Excel réécrit à l'identique change d'octets à cause de sa date de modification).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for nom, df in feuilles.items():
+        h.update(json.dumps([str(nom)] + [str(c) for c in df.columns]).encode('utf-8'))
+        h.update(pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+def _classeur_lecture_seule(feuilles, chemin):
+    """
+    Écrit un classeur Excel en mode « write-only » d'openpyxl (écriture en flux, une feuille par DataFrame).
+    """
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    for nom, df in feuilles.items():
+        ws = wb.create_sheet(title=str(nom)[:31])
+        ws.append([str(c) for c in df.columns])
+        for ligne in df.to_numpy(dtype=object).tolist():
+            ws.append(ligne)
+    wb.save(chemin)
+
+def _ecrire_fichier(feuilles, chemin, ext):
+    """
+    Écrit un fichier selon l'extension donnée : .xlsx (une feuille par DataFrame), .csv ou .parquet (un seul DataFrame).
+    """
+    if ext == ".xlsx":
+        _classeur_lecture_seule(feuilles, chemin)
+        return
+    (df,) = feuilles.values()
+    if ext == ".csv":
+        df.to_csv(chemin, index=False, encoding='utf-8-sig')
+    elif ext == ".parquet":
+        try:
+            # Colonnes mixtes (ex : "Groupe Période X" vides ou numériques) : texte
+            mixtes = {c: str for c in df.columns if df[c].dtype == object}
+            df.astype(mixtes).to_parquet(chemin, index=False)
+        except ImportError as e:
+            raise ValueError(f"L'export Parquet nécessite le module pyarrow :\n{e}")
+    else:
+        raise ValueError(f"Format d'export non pris en charge : {ext}")
+
+@tracer
+def ecrire_fichiers(dossier, fichiers, nb_threads=None, progression=None):
+    """
+    Écrit plusieurs fichiers dans un dossier, de façon atomique et sans travail inutile :
+    - fichiers : {nom_fichier: {nom_feuille: DataFrame}} (format déduit de l'extension)
+    - un fichier dont le contenu n'a pas changé depuis le dernier export, et qui n'a pas été modifié
+      depuis sur le disque, n'est pas réécrit (empreintes conservées dans le cache, voir _chemin_manifeste)
+    - les fichiers sont d'abord écrits en parallèle (pool de threads) dans des fichiers temporaires,
+      puis renommés seulement si tous ont réussi : un export interrompu ne laisse pas de fichier à moitié écrit
+    - progression(fraction) est appelé après chaque fichier écrit (depuis les threads du pool)
+    Renvoie la liste des chemins réellement (ré)écrits.
+    """
+    cree = not os.path.isdir(dossier)
+    os.makedirs(dossier, exist_ok=True)
+    chemin_manifeste = _chemin_manifeste(dossier)
+    try:
+        with open(chemin_manifeste, encoding='utf-8') as f:
+            manifeste = json.load(f)
+    except (OSError, ValueError):
+        manifeste = {}
+
+    empreintes = {nom: _empreinte_feuilles(feuilles) for nom, feuilles in fichiers.items()}
+    a_ecrire = [
+        nom for nom in fichiers
+        if manifeste.get(nom) != [empreintes[nom], _signature_fichier(os.path.join(dossier, nom))]
+    ]
+    temporaires = {nom: os.path.join(dossier, f"{nom}.{os.getpid()}.tmp") for nom in a_ecrire}
+    verrou, ecrits = threading.Lock(), [0]
+
+    def ecrire(nom):
+        _ecrire_fichier(fichiers[nom], temporaires[nom], Path(nom).suffix.lower())
+        if progression is not None:
+            with verrou:
+                ecrits[0] += 1
+                fraction = ecrits[0] / len(a_ecrire)
+            progression(fraction)
+
+    try:
+        with ThreadPoolExecutor(max_workers=nb_threads) as pool:
+            list(pool.map(ecrire, a_ecrire))
+    except BaseException:
+        for temporaire in temporaires.values():
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+        if cree:
+            # Pas de dossier de période vide laissé derrière un export échoué
+            shutil.rmtree(dossier, ignore_errors=True)
+        raise
+    for nom, temporaire in temporaires.items():
+        os.replace(temporaire, os.path.join(dossier, nom))
+
+    manifeste.update({nom: [empreintes[nom], _signature_fichier(os.path.join(dossier, nom))] for nom in a_ecrire})
+    try:
+        os.makedirs(os.path.dirname(chemin_manifeste), exist_ok=True)
+        temporaire = f"{chemin_manifeste}.{os.getpid()}.tmp"
+        with open(temporaire, 'w', encoding='utf-8') as f:
+            json.dump(manifeste, f, ensure_ascii=False, indent=1)
+        os.replace(temporaire, chemin_manifeste)
+    except OSError:
+        pass  # Comme le cache : sans manifeste, le prochain export réécrit simplement tous les fichiers
+    return [os.path.join(dossier, nom) for nom in a_ecrire]
+
+def fichiers_groupes(groupes, nom_classes, periode, format="xlsx"):
+    """
+    Fichiers de groupes à écrire, {nom_fichier: {nom_feuille: DataFrame}} (voir ecrire_fichiers).
+    Formats :
+    - "xlsx" : un fichier Excel par groupe, <nom_classes>_GroupeX_PériodeY.xlsx
+    - "classeur" : un seul classeur <nom_classes>_Groupes_PériodeY.xlsx, une feuille "Groupe X" par groupe
+    - "csv" / "parquet" : un fichier par groupe, <nom_classes>_GroupeX_PériodeY.csv / .parquet
+    """
+    if format not in FORMATS_EXPORT:
+        raise ValueError(
+            f"Format d'export non pris en charge : {format}\n"
+            f"Formats acceptés : {', '.join(FORMATS_EXPORT)}"
+        )
+    if format == "classeur":
+        return {
+            f"{nom_classes}_Groupes_Période{periode}.xlsx": {f"Groupe {i}": g for i, g in enumerate(groupes, 1)}
+        }
+    return {
+        f"{nom_classes}_Groupe{i}_Période{periode}.{format}": {f"Groupe {i}": g}
+        for i, g in enumerate(groupes, 1)
+    }
+
+@tracer
+def sauvegarder_groupes(groupes, dossier_sortie, nom_classes, periode, format="xlsx", nb_threads=None,
+                        progression=None):
     """
-    Sauvegarde chaque groupe dans un fichier Excel, dans le dossier donné.
-    Les noms suivent le schéma : <nom_classes>_GroupeX_PériodeY.xlsx
+    Sauvegarde les groupes dans le dossier donné, en une seule passe (voir ecrire_fichiers et fichiers_groupes).
+    Pour enregistrer une période (fichier élèves et groupes ensemble), voir ajouter_groupes_au_df(..., format=...).
+    Renvoie la liste des fichiers réellement (ré)écrits.
     """
-    for i, g in enumerate(groupes, 1):
-        base = os.path.join(dossier_sortie, f"{nom_classes}_Groupe{i}_Période{periode}")
-        os.makedirs(os.path.dirname(base), exist_ok=True)
-        g.to_excel(f"{base}.xlsx", index=False)
+    return ecrire_fichiers(dossier_sortie, fichiers_groupes(groupes, nom_classes, periode, format),
+                           nb_threads, progression)
 
 # ==============================================================================
 # 2. Attribution des groupes en évitant les répétitions (priorité à la nouveauté)
 # ==============================================================================
 
-def historique_groupes_par_eleve(df):
+def coder_eleves(df):
     """
-    Retourne pour chaque élève l'ensemble des groupes déjà faits (par période).
-    Renvoie : {(nom, prenom, classe): set(num_groupes)}
+    Codage entier des élèves : un élève est repéré par sa position dans df (0..n-1),
+    son niveau et sa classe par leur code dans les catégories triées.
+    Renvoie (codes_niveaux, niveaux, codes_classes, classes) ; code -1 pour une valeur manquante.
     """
-    histo = {}
-    # Colonnes type "Groupe Periode X" ou "Groupe Période X"
-    pattern = re.compile(r"groupe p[ée]riode ?(\d+)", re.IGNORECASE)
-    groupe_cols = [col for col in df.columns if pattern.match(normalize_str(col))]
-    for idx, row in df.iterrows():
-        key = (row['Nom'], row['Prenom'], row['Classe'])
-        groupes_faits = set()
-        for col in groupe_cols:
-            try:
-                val = int(row[col])
-                groupes_faits.add(val)
-            except Exception:
-                continue
-        histo[key] = groupes_faits
-    return histo
+    niveaux = pd.Categorical(df['Niveau'])
+    classes = pd.Categorical(df['Classe'])
+    return (np.asarray(niveaux.codes, dtype=np.intp), niveaux.categories,
+            np.asarray(classes.codes, dtype=np.intp), classes.categories)
+
+def _rangs_niveaux(codes_niveaux, niveaux, repartition):
+    """
+    Rang, dans la répartition, du niveau de chaque élève (-1 pour un niveau non réparti).
+    """
+    rangs = np.full(len(niveaux) + 1, -1, dtype=np.intp)  # dernière case : code -1 (niveau manquant)
+    for n, niveau in enumerate(repartition):
+        if niveau in niveaux:
+            rangs[niveaux.get_loc(niveau)] = n
+    return rangs[codes_niveaux]
+
+@tracer
+def historique_groupes_par_eleve(df, nb_groupes=None, base_historique=None, periode_max=None):
+    """
+    Retourne la matrice d'historique élèves × groupes, construite en une passe vectorisée :
+    la case (élève, g) compte le nombre de périodes passées dans le groupe g.
+    - Index : celui de df (une ligne par élève, homonymes distincts)
+    - Colonnes : 1..nb_groupes (par défaut, le plus grand numéro de groupe rencontré)
+    Les valeurs non numériques ou hors bornes sont ignorées.
+    Si une base d'historique est fournie, elle remplace les colonnes "Groupe Période X" de df.
+    periode_max : seules les périodes jusqu'à celle-ci sont comptées (par défaut, toutes).
+    """
+    if base_historique is not None:
+        return base_historique.matrice_historique(df, nb_groupes, periode_max=periode_max)
+    groupe_cols = [c for c, p in colonnes_periodes(df).items() if periode_max is None or p <= periode_max]
+    valeurs = df[groupe_cols].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    if nb_groupes is None:
+        nb_groupes = int(np.nanmax(valeurs)) if groupe_cols and not np.isnan(valeurs).all() else 0
+    lignes, cols = np.nonzero((valeurs >= 1) & (valeurs <= nb_groupes) & (valeurs == np.floor(valeurs)))
+    matrice = np.zeros((len(df), nb_groupes), dtype=np.int16)
+    np.add.at(matrice, (lignes, valeurs[lignes, cols].astype(np.intp) - 1), 1)
+    return pd.DataFrame(matrice, index=df.index, columns=range(1, nb_groupes + 1))
 
 def choisir_groupe_possible(histo_eleve, quotas_restants, nb_groupes):
     """
     Retourne la liste des groupes possibles pour un élève : d’abord les groupes JAMAIS faits,
     puis ceux déjà faits (si besoin). Prend en compte les quotas restants.
+    histo_eleve est la ligne de l'élève dans la matrice d'historique (compteurs par groupe).
     """
-    groupes_jamais_faits = [g for g in range(1, nb_groupes + 1) if g not in histo_eleve and quotas_restants[g - 1] > 0]
-    if groupes_jamais_faits:
-        return groupes_jamais_faits
+    libres = np.asarray(quotas_restants[:nb_groupes]) > 0
+    jamais_faits = libres & (np.asarray(histo_eleve[:nb_groupes]) == 0)
+    if jamais_faits.any():
+        return list(np.flatnonzero(jamais_faits) + 1)
     # Sinon, retourne tous les groupes où il reste de la place
-    return [g for g in range(1, nb_groupes + 1) if quotas_restants[g - 1] > 0]
+    return list(np.flatnonzero(libres) + 1)
+
+@tracer
+def affecter_niveau_glouton(histo_niveau, quotas, rng=None):
+    """
+    Affectation aléatoire gloutonne d'un niveau (mode rapide, par défaut).
+    Les élèves sont pris dans un ordre aléatoire et placés dans un groupe jamais fait
+    s'il en reste un avec de la place, sinon dans n'importe quel groupe non plein.
+    rng : générateur numpy (np.random.default_rng(graine)) ; par défaut, tirage non reproductible.
+    Renvoie le numéro de groupe (0-based) de chaque élève, -1 si aucune place.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    alea = random.Random(int(rng.integers(2 ** 63)))  # tirages scalaires, plus rapides que numpy dans la boucle
+    nb_groupes = len(quotas)
+    affectation = np.full(len(histo_niveau), -1, dtype=np.intp)
+    quotas_restants = np.array(quotas)
+    for pos in rng.permutation(len(histo_niveau)):
+        groupes_possibles = choisir_groupe_possible(histo_niveau[pos], quotas_restants, nb_groupes)
+        if groupes_possibles:
+            grp = alea.choice(groupes_possibles)
+            affectation[pos] = grp - 1
+            quotas_restants[grp - 1] -= 1
+        else:
+            pass  # Sécurité
+    return affectation
+
+def _transport_cout_min(offres, demandes, couts):
+    """
+    Résout le problème de transport (types d'élèves -> groupes) à coût minimal
+    par plus courts chemins successifs. Le graphe résiduel est réduit aux groupes :
+    un arc g -> g' correspond au déplacement d'un élève déjà placé en g vers g'.
+    Renvoie la matrice des flux (types × groupes).
+    """
+    offres = np.array(offres, dtype=np.int64)
+    demandes = np.array(demandes, dtype=np.int64)
+    couts = np.asarray(couts, dtype=np.int64)
+    nb_types, nb_groupes = couts.shape
+    flux = np.zeros((nb_types, nb_groupes), dtype=np.int64)
+    infini = np.iinfo(np.int64).max // 4
+    # Variation de coût quand un élève de type t passe de g à g' : couts[t, g'] - couts[t, g]
+    deltas = couts[:, None, :] - couts[:, :, None]
+    while offres.sum() > 0 and demandes.sum() > 0:
+        # Entrée dans le graphe : le type disponible le moins cher pour chaque groupe
+        entree = np.where(offres[:, None] > 0, couts, infini)
+        type_entree = entree.argmin(axis=0)
+        dist = entree[type_entree, np.arange(nb_groupes)]
+        # Déplacements possibles entre groupes (seulement pour les types présents en g)
+        d = np.where((flux > 0)[:, :, None], deltas, infini)
+        type_depl = d.argmin(axis=0)
+        cout_depl = np.take_along_axis(d, type_depl[None], axis=0)[0]
+        pred = np.full(nb_groupes, -1)
+        for _ in range(nb_groupes):
+            candidats = np.where(cout_depl < infini, dist[:, None] + cout_depl, infini)
+            source = candidats.argmin(axis=0)
+            meilleur = candidats[source, np.arange(nb_groupes)]
+            ameliore = meilleur < dist
+            if not ameliore.any():
+                break
+            dist = np.where(ameliore, meilleur, dist)
+            pred = np.where(ameliore, source, pred)
+        cible = int(np.where(demandes > 0, dist, infini).argmin())
+        # Reconstruction du chemin : entrée -> g1 -> ... -> cible
+        chemin = [cible]
+        while pred[chemin[-1]] >= 0:
+            chemin.append(int(pred[chemin[-1]]))
+        chemin.reverse()
+        t0 = type_entree[chemin[0]]
+        quantite = min(offres[t0], demandes[cible])
+        for g, g_suiv in zip(chemin, chemin[1:]):
+            quantite = min(quantite, flux[type_depl[g, g_suiv], g])
+        flux[t0, chemin[0]] += quantite
+        for g, g_suiv in zip(chemin, chemin[1:]):
+            t = type_depl[g, g_suiv]
+            flux[t, g] -= quantite
+            flux[t, g_suiv] += quantite
+        offres[t0] -= quantite
+        demandes[cible] -= quantite
+    return flux
+
+@tracer
+def affecter_niveau_optimal(histo_niveau, quotas, rng=None):
+    """
+    Affectation optimale d'un niveau : minimise d'abord le nombre de répétitions
+    (élève placé dans un groupe déjà fait), puis le nombre total de passages
+    antérieurs dans les groupes choisis. Les élèves de même historique sont
+    interchangeables : le problème est résolu sur ces types (transport à coût minimal),
+    puis les élèves de chaque type sont répartis aléatoirement (rng, voir affecter_niveau_glouton).
+    Renvoie le numéro de groupe (0-based) de chaque élève, -1 si aucune place.
+    """
+    histo_niveau = np.asarray(histo_niveau, dtype=np.int64)
+    # Coût lexicographique : une répétition pèse plus que tous les passages cumulés
+    poids_repetition = len(histo_niveau) * int(histo_niveau.max(initial=0)) + 1
+    return _affecter_par_types((histo_niveau > 0) * poids_repetition + histo_niveau, quotas, rng)
+
+def _affecter_par_types(couts, quotas, rng=None):
+    """
+    Affectation à coût minimal d'élèves (une ligne de couts par élève : coût de chaque groupe)
+    respectant les quotas. Les élèves de même ligne de coûts sont interchangeables : le transport
+    est résolu sur ces types, puis les élèves de chaque type sont répartis aléatoirement.
+    Renvoie le numéro de groupe (0-based) de chaque élève, -1 si aucune place.
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    nb_eleves = len(couts)
+    affectation = np.full(nb_eleves, -1, dtype=np.intp)
+    if nb_eleves == 0:
+        return affectation
+    types, type_eleve = np.unique(couts, axis=0, return_inverse=True)
+    type_eleve = type_eleve.reshape(-1)
+    flux = _transport_cout_min(np.bincount(type_eleve, minlength=len(types)), quotas, types)
+    for t in range(len(types)):
+        eleves = rng.permutation(np.flatnonzero(type_eleve == t))
+        groupes = np.repeat(np.arange(len(quotas)), flux[t])
+        affectation[eleves[:len(groupes)]] = groupes
+    return affectation
 
-def generer_groupes(df, nb_groupes, repartition):
+def _compter_repetitions(histo, affectation):
+    """
+    Nombre d'élèves placés dans un groupe déjà fait (affectation : groupe 0-based par ligne, -1 si non placé).
+    """
+    places = np.flatnonzero(affectation >= 0)
+    return int((histo[places, affectation[places]] > 0).sum())
+
+class GroupesAffectes(Sequence):
+    """
+    Groupes d'une génération, sous forme compacte : le numéro de groupe (0-based, -1 si non placé)
+    de chaque élève, repéré par sa position dans df.
+    S'utilise comme la liste des DataFrames des groupes (len, groupes[i], itération),
+    mais chaque DataFrame n'est construit qu'à la demande (affichage, export), par df.iloc :
+    l'index d'origine est conservé et identifie l'élève jusqu'à l'enregistrement.
+    ordre : ordre des élèves dans chaque groupe (positions dans df, par défaut l'ordre de df).
+    Les colonnes sont celles de df à la génération : la colonne de période qu'ajouter_groupes_au_df
+    ajoute ensuite à df n'apparaît pas dans les groupes exportés.
+    """
+
+    def __init__(self, df, affectation, nb_groupes, ordre=None):
+        self.df = df
+        self.colonnes = df.columns
+        self.affectation = np.asarray(affectation, dtype=np.intp)
+        self.nb_groupes = nb_groupes
+        self.ordre = np.arange(len(df)) if ordre is None else np.asarray(ordre, dtype=np.intp)
+
+    def __len__(self):
+        return self.nb_groupes
+
+    def __getitem__(self, g):
+        if isinstance(g, slice):
+            return [self[i] for i in range(*g.indices(len(self)))]
+        if g < 0:
+            g += len(self)
+        if not 0 <= g < len(self):
+            raise IndexError(g)
+        groupe = self.df.iloc[self.positions(g)]
+        return groupe if groupe.columns.equals(self.colonnes) else groupe[self.colonnes]
+
+    @property
+    def nb_eleves(self):
+        return int((self.affectation >= 0).sum())
+
+    def positions(self, g):
+        """
+        Positions dans df des élèves du groupe g (0-based).
+        """
+        return self.ordre[self.affectation[self.ordre] == g]
+
+    def effectifs(self):
+        return np.bincount(self.affectation[self.affectation >= 0], minlength=self.nb_groupes)
+
+def _affectation_des_groupes(df, groupes):
+    """
+    Numéro de groupe (0-based, -1 si non placé) de chaque ligne de df.
+    groupes : GroupesAffectes de df, ou liste de DataFrames conservant l'index de df.
+    """
+    if isinstance(groupes, GroupesAffectes) and groupes.df.index.equals(df.index):
+        return groupes.affectation
+    affectation = np.full(len(df), -1, dtype=np.intp)
+    for i, groupe in enumerate(groupes):
+        positions = df.index.get_indexer(groupe.index)
+        affectation[positions[positions >= 0]] = i
+    return affectation
+
+METHODES_AFFECTATION = {
+    "glouton": affecter_niveau_glouton,
+    "optimal": affecter_niveau_optimal,
+}
+
+# À incrémenter à chaque changement des algorithmes d'affectation : invalide les résultats mémorisés
+VERSION_ALGORITHMES = 1
+
+def cle_resultat(df, histo, repartition, nb_groupes, methode, seed, **parametres):
+    """
+    Clé d'un résultat de génération : empreinte des élèves (identités et niveaux, dans l'ordre de df),
+    de la matrice d'historique, de la répartition, du nombre de groupes, de la méthode et de ses
+    paramètres, de la graine et de la version des algorithmes.
+    """
+    empreinte = hashlib.blake2b(digest_size=16)
+    empreinte.update(json.dumps({
+        "version": VERSION_ALGORITHMES,
+        "methode": methode,
+        "nb_groupes": nb_groupes,
+        "seed": seed,
+        "repartition": [[str(niveau), [int(q) for q in quotas]] for niveau, quotas in repartition.items()],
+        **parametres,
+    }, sort_keys=True, default=str).encode('utf-8'))
+    empreinte.update(pd.util.hash_pandas_object(df[CLES_IDENTITE + ['Niveau']], index=True).to_numpy().tobytes())
+    empreinte.update(np.ascontiguousarray(histo, dtype=np.int16).tobytes())
+    return empreinte.hexdigest()
+
+def _memoriser(cle, calcul):
+    """
+    Affectation mémorisée pour cette clé (voir cle_resultat), sinon calcul() puis mémorisation.
+    Sans clé (pas de graine : tirage non reproductible), calcule simplement.
+    """
+    if cle is None:
+        return calcul()
+    chemin = os.path.join(DOSSIER_CACHE, f"resultat_{cle}.pkl")
+    affectation = _lire_cache(chemin)
+    if affectation is None:
+        affectation = calcul()
+        _ecrire_cache(chemin, affectation)
+    return affectation
+
+@tracer
+def generer_groupes(df, nb_groupes, repartition, methode="glouton", avec_repetitions=False,
+                    base_historique=None, progression=None, seed=None, cache=True):
     """
     Répartition qui tente d'éviter de remettre un élève dans un groupe déjà fait (priorité à la nouveauté).
     Si impossible (tous déjà faits ou groupes pleins), complète quand même.
+    Travaille sur les codes entiers des élèves (voir coder_eleves) et renvoie un GroupesAffectes :
+    chaque groupe garde l'index des lignes de df (identité stable de l'élève).
+
+    Paramètres :
+        methode (str) : "glouton" (aléatoire, rapide), "optimal" (nombre minimal de répétitions),
+                        "optimise" (recherche locale sur la mixité, voir optimiser_groupes)
+                        ou "planifie" (première période du plan qui termine le tour des groupes,
+                        voir planifier_annee ; des quotas automatiques y sont décalés d'un groupe
+                        par période déjà faite, comme dans le plan)
+        avec_repetitions (bool) : si vrai, renvoie (groupes, nombre de répétitions)
+        base_historique : base SQLite d'historique (voir MakeGroups_Historique), à la place des colonnes de df
+        progression : rappel progression(fraction) appelé après chaque niveau ; il peut lever
+                      OperationAnnulee pour interrompre la génération
+        seed (int) : graine ; mêmes entrées et même graine = mêmes groupes (par défaut, tirage non reproductible)
+        cache (bool) : avec une graine, le résultat est mémorisé (voir DOSSIER_CACHE) et relu,
+                       sans recalcul, pour les mêmes entrées
+    """
+    if methode == "optimise":
+        return optimiser_groupes(df, nb_groupes, repartition, seed=seed, avec_repetitions=avec_repetitions,
+                                 base_historique=base_historique, progression=progression, cache=cache)
+    if methode != "planifie" and methode not in METHODES_AFFECTATION:
+        raise ValueError(
+            f"Méthode d'affectation inconnue : {methode}\n"
+            f"Méthodes acceptées : {', '.join(METHODES_AFFECTATION)}, optimise, planifie"
+        )
+    histo = historique_groupes_par_eleve(df, nb_groupes, base_historique).to_numpy()
+    parametres = {}
+    if methode == "planifie":
+        faites = detecter_prochaine_periode(df) - 1
+        if base_historique is not None:
+            faites = max(faites, base_historique.prochaine_periode(df) - 1)
+        parametres["faites"] = faites
+        auto = generer_repartition_auto(df, nb_groupes)
+        if {niveau: [int(v) for v in quotas] for niveau, quotas in repartition.items()} == auto:
+            # Sans ce décalage, le surplus reste dans les mêmes groupes et le tour ne se termine pas
+            repartition = generer_repartition_auto(df, nb_groupes, decalage=faites)
+
+    def calcul():
+        rng = np.random.default_rng(seed)
+        if methode == "planifie":
+            # Première période du plan qui termine le tour des groupes (voir planifier_annee)
+            restantes = max(1, nb_groupes - faites % nb_groupes)
+            return _planifier_rotation(df, histo, nb_groupes, restantes, repartition, progression, rng)[:, 0]
+        affecter_niveau = METHODES_AFFECTATION[methode]
+        codes_niveaux, niveaux, _, _ = coder_eleves(df)
+        rangs = _rangs_niveaux(codes_niveaux, niveaux, repartition)
+        # Positions des élèves regroupées par niveau (tri stable : ordre de df conservé dans chaque niveau)
+        ordre = np.argsort(rangs, kind="stable")
+        bornes = np.searchsorted(rangs[ordre], np.arange(len(repartition) + 1))
+        affectation = np.full(len(df), -1, dtype=np.intp)
+        for n, quotas in enumerate(repartition.values()):
+            positions = ordre[bornes[n]:bornes[n + 1]]
+            affectation[positions] = affecter_niveau(histo[positions], quotas, rng)
+            if progression is not None:
+                progression((n + 1) / len(repartition))
+        return affectation
+
+    cle = cle_resultat(df, histo, repartition, nb_groupes, methode, seed, **parametres) \
+        if cache and seed is not None else None
+    affectation = _memoriser(cle, calcul)
+    groupes = GroupesAffectes(df, affectation, nb_groupes)
+    if avec_repetitions:
+        return groupes, _compter_repetitions(histo, affectation)
+    return groupes
+
+# ==============================================================================
+# 3. Optimisation multi-critères (répétitions, mixité des classes, effectifs)
+# ==============================================================================
+
+POIDS_OBJECTIF = {
+    "repetitions": 10.0,   # élève placé dans un groupe déjà fait
+    "mixite": 1.0,         # écart² entre effectif de chaque classe dans un groupe et sa part attendue
+    "effectifs": 1.0,      # écart² des effectifs de groupe à la moyenne
+}
+
+def _evaluer(affectation, visite, classes, nb_groupes, nb_classes, poids):
+    """
+    Calcule l'objectif complet d'une affectation ainsi que les compteurs groupe × classe
+    nécessaires à son évaluation incrémentale.
+    """
+    comptes = np.zeros((nb_groupes, nb_classes))
+    np.add.at(comptes, (affectation, classes), 1)
+    tailles = comptes.sum(axis=1)
+    cibles = tailles[:, None] * (np.bincount(classes, minlength=nb_classes) / len(classes))
+    repetitions = int(visite[np.arange(len(affectation)), affectation].sum())
+    score = (poids["repetitions"] * repetitions
+             + poids["mixite"] * float(((comptes - cibles) ** 2).sum())
+             + poids["effectifs"] * float(((tailles - tailles.mean()) ** 2).sum()))
+    return score, comptes, cibles
+
+def _recherche_locale(visite, niveaux, classes, quotas, poids, graine, echeance):
+    """
+    Redémarrages successifs (jusqu'à l'échéance, en temps absolu) d'une recherche locale par échanges :
+    deux élèves d'un même niveau et de groupes différents échangent leur groupe si l'objectif baisse.
+    Les échanges respectent donc toujours les quotas de la répartition.
+    Renvoie (meilleur score, meilleure affectation, nombre de redémarrages).
     """
-    histo = historique_groupes_par_eleve(df)
-    groupes = [[] for _ in range(nb_groupes)]
-    for niveau, quotas in repartition.items():
-        eleves_niveau = df[df['Niveau'] == niveau].copy()
-        eleves_niveau = eleves_niveau.sample(frac=1, random_state=None).reset_index(drop=True)
-        quotas_restants = quotas.copy()
-        for _, eleve in eleves_niveau.iterrows():
-            key = (eleve['Nom'], eleve['Prenom'], eleve['Classe'])
-            histo_eleve = histo.get(key, set())
-            groupes_possibles = choisir_groupe_possible(histo_eleve, quotas_restants, nb_groupes)
-            if groupes_possibles:
-                grp = random.choice(groupes_possibles)
-                groupes[grp - 1].append(eleve)
-                quotas_restants[grp - 1] -= 1
+    rng = np.random.default_rng(graine)
+    alea = random.Random(graine)  # tirages scalaires, plus rapides que numpy dans la boucle
+    nb_eleves, nb_groupes = visite.shape
+    nb_classes = int(classes.max()) + 1 if nb_eleves else 0
+    membres = [np.flatnonzero(niveaux == n) for n in range(len(quotas))]
+    classes_l = classes.tolist()
+    visite_l = visite.astype(int).tolist()
+    p_rep, p_mix = poids["repetitions"], poids["mixite"]
+    meilleur = (np.inf, None)
+    redemarrages = 0
+    while True:
+        # Solution initiale : tirage aléatoire respectant les quotas de chaque niveau
+        affectation = np.zeros(nb_eleves, dtype=np.intp)
+        for n, eleves in enumerate(membres):
+            affectation[rng.permutation(eleves)] = np.repeat(np.arange(nb_groupes), quotas[n])
+        score, comptes, cibles = _evaluer(affectation, visite, classes, nb_groupes, nb_classes, poids)
+        ecarts = (comptes - cibles).tolist()
+        grp = affectation.tolist()
+        candidats = [m.tolist() for m in membres if len(m) > 1]
+        sans_amelioration, essais = 0, 0
+        limite = 20 * nb_eleves + 100
+        while candidats and sans_amelioration < limite:
+            essais += 1
+            if essais % 2048 == 0 and time.time() > echeance:
+                break
+            a, b = alea.sample(alea.choice(candidats), 2)
+            ga, gb = grp[a], grp[b]
+            if ga == gb:
+                sans_amelioration += 1
+                continue
+            delta = p_rep * (visite_l[a][gb] + visite_l[b][ga] - visite_l[a][ga] - visite_l[b][gb])
+            ca, cb = classes_l[a], classes_l[b]
+            if ca != cb:
+                # (x + d - t)² - (x - t)² = d * (2 (x - t) + d), avec d = ±1
+                delta += p_mix * (4 - 2 * ecarts[ga][ca] + 2 * ecarts[ga][cb]
+                                  - 2 * ecarts[gb][cb] + 2 * ecarts[gb][ca])
+            if delta < -1e-9:
+                grp[a], grp[b] = gb, ga
+                if ca != cb:
+                    ecarts[ga][ca] -= 1
+                    ecarts[ga][cb] += 1
+                    ecarts[gb][cb] -= 1
+                    ecarts[gb][ca] += 1
+                score += delta
+                sans_amelioration = 0
             else:
-                pass  # Sécurité
-    return [pd.DataFrame(g) for g in groupes]
+                sans_amelioration += 1
+        redemarrages += 1
+        if score < meilleur[0]:
+            meilleur = (score, np.array(grp, dtype=np.intp))
+        if time.time() > echeance:
+            break
+    return meilleur[0], meilleur[1], redemarrages
+
+@tracer
+def optimiser_groupes(df, nb_groupes, repartition, budget=3.0, seed=None, nb_processus=None,
+                      poids=None, avec_repetitions=False, base_historique=None, progression=None, cache=True):
+    """
+    Cherche, pendant `budget` secondes, la meilleure répartition selon un objectif combinant
+    répétitions, mixité des classes dans chaque groupe et équilibre des effectifs (voir POIDS_OBJECTIF).
+    Des recherches locales indépendantes (redémarrages + échanges) tournent en parallèle
+    dans un pool de processus ; la meilleure répartition trouvée est renvoyée.
+
+    Paramètres :
+        budget (float) : temps de calcul maximal, en secondes
+        seed (int) : graine ; chaque processus part de seed + k
+        nb_processus (int) : par défaut, le nombre de cœurs ; 1 = pas de pool
+        poids (dict) : remplace tout ou partie de POIDS_OBJECTIF
+        avec_repetitions (bool) : si vrai, renvoie (groupes, nombre de répétitions)
+        base_historique : base SQLite d'historique (voir MakeGroups_Historique), à la place des colonnes de df
+        progression : rappel progression(fraction du budget écoulée) ; il peut lever OperationAnnulee
+                      (les processus déjà lancés s'arrêtent d'eux-mêmes à l'échéance)
+        cache (bool) : avec une graine, le résultat est mémorisé et relu pour les mêmes entrées
+                       et les mêmes paramètres (voir generer_groupes)
+    """
+    poids = {**POIDS_OBJECTIF, **(poids or {})}
+    histo = historique_groupes_par_eleve(df, nb_groupes, base_historique).to_numpy()
+    visite = histo > 0
+    codes_niveaux, niveaux, classes, _ = coder_eleves(df)
+    # Seuls les élèves des niveaux répartis participent
+    niveaux_codes = _rangs_niveaux(codes_niveaux, niveaux, repartition)
+    quotas = [list(quotas_niveau) for quotas_niveau in repartition.values()]
+    positions = np.flatnonzero(niveaux_codes >= 0)
+    nb_processus = nb_processus or os.cpu_count() or 1
+    cle = cle_resultat(df, histo, repartition, nb_groupes, "optimise", seed, budget=budget,
+                       nb_processus=nb_processus, poids=poids) if cache and seed is not None else None
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+
+    def calcul():
+        echeance = time.time() + budget
+        args = (visite[positions], niveaux_codes[positions], classes[positions], quotas, poids)
+        if nb_processus == 1:
+            resultats = [_recherche_locale(*args, seed, echeance)]
+        else:
+            pool = ProcessPoolExecutor(max_workers=nb_processus)
+            try:
+                futures = [pool.submit(_recherche_locale, *args, seed + k, echeance) for k in range(nb_processus)]
+                while attendre_futures(futures, timeout=0.1).not_done:
+                    if progression is not None:
+                        progression(min(1.0, 1 - (echeance - time.time()) / budget) if budget > 0 else 1.0)
+                resultats = [f.result() for f in futures]
+            except BaseException:
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+            pool.shutdown()
+        _, meilleure, _ = min(resultats, key=lambda r: r[0])
+        affectation = np.full(len(df), -1, dtype=np.intp)
+        affectation[positions] = meilleure
+        return affectation
+
+    affectation = _memoriser(cle, calcul)
+    if progression is not None:
+        progression(1.0)
+    groupes = GroupesAffectes(df, affectation, nb_groupes)
+    if avec_repetitions:
+        return groupes, _compter_repetitions(histo, affectation)
+    return groupes
+
+# ==============================================================================
+# 4. Modèle éditable des groupes (récapitulatif)
+# ==============================================================================
+
+class ModeleGroupes:
+    """
+    Groupes éditables pour le récapitulatif : chaque groupe est une liste de positions d'élèves dans df,
+    triée par nom, avec des compteurs par niveau et par classe (tableaux groupes × codes) tenus à jour
+    à chaque déplacement. Un déplacement coûte une recherche dichotomique, sans recopie ni re-tri
+    de DataFrame ; aucun DataFrame de groupe n'est construit ici (voir groupes()).
+    """
+
+    def __init__(self, df, groupes, colonnes=("Nom", "Prenom", "Niveau")):
+        self.df = df
+        self.colonnes = list(colonnes)
+        self._niveau, niveaux, self._classe, classes = coder_eleves(df)
+        self.niveaux, self.classes = list(niveaux), list(classes)
+        affectation = _affectation_des_groupes(df, groupes)
+        nb_groupes = len(groupes)
+        # Clé de tri (nom, position dans df) : ordre stable entre homonymes
+        self._cle = list(zip(df['Nom'].astype(str).tolist(), range(len(df))))
+        self._valeurs = df[self.colonnes].to_numpy(dtype=object).tolist()
+        ordre = np.array(sorted(range(len(df)), key=self._cle.__getitem__), dtype=np.intp)
+        self.membres = [ordre[affectation[ordre] == g].tolist() for g in range(nb_groupes)]
+        self._cles_tri = [[self._cle[pos] for pos in m] for m in self.membres]
+        self.par_niveau = self._compter(affectation, self._niveau, len(self.niveaux), nb_groupes)
+        self.par_classe = self._compter(affectation, self._classe, len(self.classes), nb_groupes)
+
+    @staticmethod
+    def _compter(affectation, codes, nb_codes, nb_groupes):
+        comptes = np.zeros((nb_groupes, nb_codes), dtype=np.int64)
+        valides = (affectation >= 0) & (codes >= 0)
+        np.add.at(comptes, (affectation[valides], codes[valides]), 1)
+        return comptes
+
+    def __len__(self):
+        return len(self.membres)
+
+    def lignes(self, g):
+        """
+        Valeurs affichées (colonnes du modèle) des élèves du groupe g, dans l'ordre alphabétique.
+        """
+        return [self._valeurs[pos] for pos in self.membres[g]]
+
+    def ligne(self, pos):
+        return self._valeurs[pos]
+
+    def effectifs(self):
+        return [len(m) for m in self.membres]
+
+    def deplacer(self, src, position, dest):
+        """
+        Déplace l'élève à la position donnée du groupe src vers le groupe dest.
+        Renvoie (position de l'élève dans df, sa nouvelle position dans dest).
+        """
+        pos = self.membres[src].pop(position)
+        cle = self._cles_tri[src].pop(position)
+        nouvelle = bisect.bisect_left(self._cles_tri[dest], cle)
+        self.membres[dest].insert(nouvelle, pos)
+        self._cles_tri[dest].insert(nouvelle, cle)
+        for compteurs, code in ((self.par_niveau, self._niveau[pos]), (self.par_classe, self._classe[pos])):
+            if code >= 0:
+                compteurs[src, code] -= 1
+                compteurs[dest, code] += 1
+        return pos, nouvelle
+
+    def resume(self, g):
+        """
+        Ligne du tableau récapitulatif : groupe, effectif, effectif par niveau puis par classe.
+        """
+        return ([f"Groupe {g + 1}", len(self.membres[g])]
+                + self.par_niveau[g].tolist() + self.par_classe[g].tolist())
+
+    def groupes(self):
+        """
+        Groupes édités (GroupesAffectes, ordre alphabétique conservé dans chaque groupe),
+        pour ajouter_groupes_au_df et sauvegarder_groupes.
+        """
+        affectation = np.full(len(self.df), -1, dtype=np.intp)
+        for g, m in enumerate(self.membres):
+            affectation[m] = g
+        ordre = [pos for m in self.membres for pos in m]
+        return GroupesAffectes(self.df, affectation, len(self.membres), ordre)
+
+# ==============================================================================
+# 5. Mise à jour incrémentale d'une période (arrivées, départs, changements de niveau)
+# ==============================================================================
+
+def positions_precedentes(df_precedent, df):
+    """
+    Différence entre deux effectifs : pour chaque ligne de df, position du même élève
+    dans df_precedent (voir identites), -1 pour un élève arrivé.
+    """
+    positions = pd.Index(identites(df_precedent)['id']).get_indexer(identites(df)['id'])
+    return positions.astype(np.intp)
+
+def _quotas_proches(quotas, comptes):
+    """
+    Permutation des quotas la plus proche des effectifs actuels : les plus grands quotas
+    vont aux groupes les plus remplis, ce qui limite le nombre d'élèves à déplacer.
+    """
+    ajustes = np.empty(len(quotas), dtype=np.int64)
+    ajustes[np.argsort(-np.asarray(comptes), kind="stable")] = np.sort(quotas)[::-1]
+    return ajustes
+
+@tracer
+def reaffecter_groupes(df_precedent, df, nb_groupes, repartition=None, colonne=None, base_historique=None,
+                       avec_details=False, seed=None):
+    """
+    Met à jour les groupes d'une période après un changement d'effectif, sans tout regénérer :
+    les élèves restés dans le même niveau gardent leur groupe (modifications manuelles comprises),
+    seuls les élèves arrivés ou changés de niveau sont placés, en déplaçant le moins possible
+    d'élèves déjà placés pour respecter les quotas. Le placement ne porte que sur les élèves concernés.
+
+    Paramètres :
+        df_precedent : fichier de la période (avec sa colonne "Groupe Période X")
+        df : nouvel effectif
+        repartition : quotas par niveau ; par défaut ceux de repartir_niveau (voir generer_repartition_auto),
+                      dans la permutation la plus proche des groupes actuels
+        colonne : colonne des groupes à mettre à jour (par défaut, la dernière période de df_precedent)
+        base_historique : base SQLite d'historique, pour l'historique des élèves à placer
+        avec_details (bool) : si vrai, renvoie (groupes, détails) ; détails = nombres d'élèves
+                              arrivés, partis, changés de niveau, déplacés, et répétitions
+        seed (int) : graine des tirages (par défaut, non reproductible)
+    Renvoie un GroupesAffectes sur le nouvel effectif complété des périodes précédentes
+    (groupes.df), à enregistrer avec ajouter_groupes_au_df(groupes.df, groupes, ..., periode=...).
+    """
+    periodes = colonnes_periodes(df_precedent)
+    if colonne is None:
+        if not periodes:
+            raise ValueError("Aucune colonne « Groupe Période X » dans le fichier de la période à mettre à jour.")
+        colonne = max(periodes, key=periodes.get)
+    periode = periodes[colonne]
+
+    # Nouvel effectif, complété des périodes antérieures connues seulement dans df_precedent
+    precedent = positions_precedentes(df_precedent, df)
+    connus = precedent >= 0
+    df_maj = df.drop(columns=[c for c, p in colonnes_periodes(df).items() if p >= periode])
+    deja = set(colonnes_periodes(df_maj).values())
+    for col, p in sorted(periodes.items(), key=lambda item: item[1]):
+        if p < periode and p not in deja:
+            valeurs = np.full(len(df), "", dtype=object)
+            valeurs[connus] = df_precedent[col].to_numpy(dtype=object)[precedent[connus]]
+            df_maj[f"Groupe Période {p}"] = valeurs
+
+    # Groupe actuel des élèves restés dans le même niveau (0-based, -1 sinon)
+    anciens = pd.to_numeric(df_precedent[colonne], errors='coerce').to_numpy(dtype=float)
+    groupe = np.full(len(df), -1, dtype=np.intp)
+    groupe[connus] = np.nan_to_num(anciens[precedent[connus]], nan=0).astype(np.intp) - 1
+    niveaux_precedents = df_precedent['Niveau'].astype(str).str.strip().to_numpy(dtype=object)
+    meme_niveau = np.zeros(len(df), dtype=bool)
+    niveaux_actuels = df['Niveau'].astype(str).str.strip().to_numpy(dtype=object)
+    meme_niveau[connus] = niveaux_precedents[precedent[connus]] == niveaux_actuels[connus]
+    groupe[~meme_niveau | (groupe >= nb_groupes)] = -1
+
+    quotas_auto = repartition is None
+    if quotas_auto:
+        repartition = generer_repartition_auto(df, nb_groupes)
+    codes_niveaux, niveaux, _, _ = coder_eleves(df)
+    rangs = _rangs_niveaux(codes_niveaux, niveaux, repartition)
+    groupe[rangs < 0] = -1
+    rng = np.random.default_rng(seed)
+    deplaces = 0
+    a_placer = []  # (élèves à placer, places restantes par groupe), par niveau
+    for n, quotas in enumerate(repartition.values()):
+        du_niveau = rangs == n
+        places = np.flatnonzero(du_niveau & (groupe >= 0))
+        comptes = np.bincount(groupe[places], minlength=nb_groupes)
+        quotas = _quotas_proches(quotas, comptes) if quotas_auto else np.asarray(quotas, dtype=np.int64)
+        eleves = [np.flatnonzero(du_niveau & (groupe < 0))]
+        # Groupes trop remplis : on n'en retire, au hasard, que le surplus
+        for g in np.flatnonzero(comptes > quotas):
+            retires = rng.permutation(places[groupe[places] == g])[:comptes[g] - quotas[g]]
+            eleves.append(retires)
+            deplaces += len(retires)
+        eleves = np.concatenate(eleves)
+        restants = quotas - np.minimum(comptes, quotas)
+        if len(eleves):
+            a_placer.append((eleves, restants))
+
+    # Placement optimal des seuls élèves concernés, d'après leur historique
+    positions = np.concatenate([eleves for eleves, _ in a_placer]) if a_placer else np.array([], dtype=np.intp)
+    # La période réécrite, déjà dans la base, ne compte pas dans l'historique
+    histo = historique_groupes_par_eleve(df_maj.iloc[positions], nb_groupes, base_historique,
+                                         periode_max=periode - 1).to_numpy()
+    repetitions, debut = 0, 0
+    for eleves, restants in a_placer:
+        histo_niveau = histo[debut:debut + len(eleves)]
+        affectation = affecter_niveau_optimal(histo_niveau, restants, rng)
+        groupe[eleves] = affectation
+        repetitions += _compter_repetitions(histo_niveau, affectation)
+        debut += len(eleves)
+    groupes = GroupesAffectes(df_maj, groupe, nb_groupes)
+    if avec_details:
+        return groupes, {
+            "arrives": int((~connus).sum()),
+            "partis": len(df_precedent) - int(connus.sum()),
+            "changements_niveau": int((connus & ~meme_niveau).sum()),
+            "deplaces": deplaces,
+            "repetitions": repetitions,
+        }
+    return groupes
+
+# ==============================================================================
+# 6. Planification de l'année (rotation des groupes)
+# ==============================================================================
+
+def _planifier_rotation(df, histo, nb_groupes, nb_periodes, repartition, progression=None, rng=None):
+    """
+    Plan de rotation circulaire : l'élève qui commence dans le groupe s est ensuite
+    dans s+1, s+2... (modulo nb_groupes). Les effectifs de chaque période sont donc les quotas
+    de la première période décalés d'un groupe, comme l'alternance du surplus de repartir_niveau.
+    Le groupe de départ de chaque élève est choisi par transport à coût minimal :
+    d'abord le moins de périodes dans un groupe déjà fait, puis le moins de passages antérieurs.
+    Renvoie la matrice élèves × périodes des groupes (0-based, -1 pour un niveau non réparti).
+    """
+    codes_niveaux, niveaux, _, _ = coder_eleves(df)
+    rangs = _rangs_niveaux(codes_niveaux, niveaux, repartition)
+    plan = np.full((len(df), nb_periodes), -1, dtype=np.intp)
+    decalages = np.arange(nb_periodes)
+    for n, quotas in enumerate(repartition.values()):
+        positions = np.flatnonzero(rangs == n)
+        histo_niveau = np.asarray(histo[positions], dtype=np.int64)
+        visites = (histo_niveau > 0).astype(np.int64)
+        # Colonne s : total sur l'année si l'élève commence dans le groupe s
+        repetitions = np.zeros_like(histo_niveau)
+        passages = np.zeros_like(histo_niveau)
+        for p in range(nb_periodes):
+            repetitions += np.roll(visites, -p, axis=1)
+            passages += np.roll(histo_niveau, -p, axis=1)
+        poids_repetition = len(positions) * int(passages.max(initial=0)) + 1
+        depart = _affecter_par_types(repetitions * poids_repetition + passages, quotas, rng)
+        places = depart >= 0
+        plan[positions[places]] = (depart[places, None] + decalages) % nb_groupes
+        if progression is not None:
+            progression((n + 1) / len(repartition))
+    return plan
+
+@tracer
+def planifier_annee(df, nb_groupes, nb_periodes, repartition=None, base_historique=None, progression=None,
+                    seed=None):
+    """
+    Calcule en une passe les groupes de toutes les périodes restantes de l'année, niveau par niveau,
+    par rotation circulaire (carré latin) : chaque élève fait le tour des groupes sans répétition
+    tant que nb_periodes <= nb_groupes, en tenant compte de son historique.
+    repartition : quotas de la première période planifiée (par défaut generer_repartition_auto) ;
+    ceux des périodes suivantes en sont décalés d'un groupe à chaque période.
+    seed : graine du tirage entre élèves de même historique (par défaut, non reproductible).
+    Renvoie le plan : colonnes Nom, Prenom, Classe, Niveau puis "Groupe Période X" pour chaque
+    période planifiée (à partir de la prochaine), aligné sur l'index de df ; voir groupes_du_plan.
+    """
+    if repartition is None:
+        repartition = generer_repartition_auto(df, nb_groupes)
+    premiere = detecter_prochaine_periode(df)
+    if base_historique is not None:
+        premiere = max(premiere, base_historique.prochaine_periode(df))
+    histo = historique_groupes_par_eleve(df, nb_groupes, base_historique).to_numpy()
+    rotation = _planifier_rotation(df, histo, nb_groupes, nb_periodes, repartition, progression,
+                                   np.random.default_rng(seed))
+    plan = df[CLES_IDENTITE + ['Niveau']].copy()
+    for p in range(nb_periodes):
+        numeros = rotation[:, p] + 1
+        colonne = numeros.astype(object)
+        colonne[numeros == 0] = ""
+        plan[f"Groupe Période {premiere + p}"] = colonne
+    return plan
+
+def groupes_du_plan(df, plan, nb_groupes, periode=None):
+    """
+    Lit les groupes d'une période dans un plan (voir planifier_annee), pour les élèves de df
+    reconnus par leur identité ; un élève absent du plan n'est pas placé (voir reaffecter_groupes).
+    periode : par défaut, la prochaine période de df.
+    """
+    if periode is None:
+        periode = detecter_prochaine_periode(df)
+    colonnes = {p: col for col, p in colonnes_periodes(plan).items()}
+    if periode not in colonnes:
+        raise ValueError(
+            f"La période {periode} n'est pas dans le plan\n"
+            f"Périodes planifiées : {', '.join(str(p) for p in sorted(colonnes))}"
+        )
+    valeurs = pd.to_numeric(plan[colonnes[periode]], errors='coerce').to_numpy(dtype=float)
+    positions = positions_precedentes(plan, df)
+    affectation = np.full(len(df), -1, dtype=np.intp)
+    connus = positions >= 0
+    affectation[connus] = np.nan_to_num(valeurs[positions[connus]], nan=0).astype(np.intp) - 1
+    affectation[affectation >= nb_groupes] = -1
+    return GroupesAffectes(df, affectation, nb_groupes)
+
+# ==============================================================================
+# 7. Statistiques de rotation (couverture des groupes, répétitions, mixité)
+# ==============================================================================
+
+def _matrice_periodes(df, nb_groupes):
+    """
+    Groupes de chaque élève par période passée : (matrice élèves × périodes des groupes 0-based,
+    -1 si absent ou hors bornes, numéros des périodes triés).
+    """
+    periodes = sorted(colonnes_periodes(df).items(), key=lambda item: item[1])
+    valeurs = df[[col for col, _ in periodes]].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    valides = (valeurs >= 1) & (valeurs <= nb_groupes) & (valeurs == np.floor(valeurs))
+    groupes = np.where(valides, np.nan_to_num(valeurs, nan=0), 0).astype(np.intp) - 1
+    return groupes, [p for _, p in periodes]
+
+@tracer
+def statistiques_rotation(df, nb_groupes=None, nb_periodes=None, base_historique=None):
+    """
+    Statistiques de rotation calculées en une passe vectorisée sur les colonnes "Groupe Période X" :
+    - "eleves" : par élève, périodes faites, groupes distincts, répétitions, groupes restant à faire
+      et risque de ne pas finir le tour (plus de groupes à faire que de périodes restantes)
+    - "groupes" : par période et par groupe, effectif, répétitions, effectifs par niveau et par classe
+    - "periodes" : par période, élèves placés, répétitions et couverture moyenne atteinte
+    - "resume" : indicateurs globaux (dict)
+    nb_periodes : nombre de périodes de l'année (par défaut nb_groupes, un tour complet).
+    Si une base d'historique est fournie, ses périodes remplacent les colonnes de df (voir vers_df).
+    """
+    if base_historique is not None:
+        df = base_historique.vers_df(df)
+    histo = historique_groupes_par_eleve(df, nb_groupes).to_numpy()
+    nb_groupes = histo.shape[1]
+    nb_periodes = nb_groupes if nb_periodes is None else nb_periodes
+    groupes, periodes = _matrice_periodes(df, nb_groupes)
+    codes_niveaux, niveaux, codes_classes, classes = coder_eleves(df)
+
+    # --- Par élève
+    faites = histo.sum(axis=1)
+    distincts = (histo > 0).sum(axis=1)
+    restantes = max(nb_periodes - len(periodes), 0)
+    # Groupes à faire codés en masque binaire : peu de masques différents, mis en texte une seule fois
+    masques = (histo == 0).astype(np.int64) @ (np.int64(1) << np.arange(nb_groupes, dtype=np.int64))
+    codes_masques, uniques = pd.factorize(masques)
+    textes = np.array([", ".join(str(g + 1) for g in range(nb_groupes) if m >> g & 1) for m in uniques],
+                      dtype=object)
+    eleves = df[CLES_IDENTITE + ['Niveau']].copy()
+    eleves["Périodes faites"] = faites
+    eleves["Groupes distincts"] = distincts
+    eleves["Répétitions"] = faites - distincts
+    eleves["Groupes à faire"] = textes[codes_masques] if len(textes) else ""
+    eleves["Couverture (%)"] = np.round(100 * distincts / max(nb_groupes, 1), 1)
+    eleves["Tour compromis"] = nb_groupes - distincts > restantes
+
+    # --- Par période et par groupe : un code (période, groupe) par case, comptages par bincount
+    nb_niveaux, nb_classes, P = len(niveaux), len(classes), len(periodes)
+    deja = np.zeros((len(df), max(nb_groupes, 1)), dtype=np.int16)
+    repete = np.zeros(groupes.shape, dtype=bool)
+    for j in range(P):
+        lignes = np.flatnonzero(groupes[:, j] >= 0)
+        g = groupes[lignes, j]
+        repete[lignes, j] = deja[lignes, g] > 0
+        deja[lignes, g] += 1
+    lignes, cols = np.nonzero(groupes >= 0)
+    cases = cols * nb_groupes + groupes[lignes, cols]
+    taille = P * nb_groupes
+    effectifs = np.bincount(cases, minlength=taille)
+    repetitions = np.bincount(cases, weights=repete[lignes, cols], minlength=taille).astype(np.int64)
+    par_niveau = np.zeros((taille, nb_niveaux), dtype=np.int64)
+    avec_niveau = codes_niveaux[lignes] >= 0
+    np.add.at(par_niveau, (cases[avec_niveau], codes_niveaux[lignes][avec_niveau]), 1)
+    par_classe = np.zeros((taille, nb_classes), dtype=np.int64)
+    avec_classe = codes_classes[lignes] >= 0
+    np.add.at(par_classe, (cases[avec_classe], codes_classes[lignes][avec_classe]), 1)
+    tableau_groupes = pd.DataFrame({
+        "Période": np.repeat(periodes, nb_groupes).astype(np.int64),
+        "Groupe": np.tile(np.arange(1, nb_groupes + 1), P),
+        "Effectif": effectifs,
+        "Répétitions": repetitions,
+        "Classes représentées": (par_classe > 0).sum(axis=1),
+    })
+    tableau_groupes = pd.concat([
+        tableau_groupes,
+        pd.DataFrame(par_niveau, columns=[f"Niveau {n}" for n in niveaux]),
+        pd.DataFrame(par_classe, columns=[f"Classe {c}" for c in classes]),
+    ], axis=1)
+
+    # --- Par période : couverture atteinte à la fin de chaque période
+    visites = np.zeros((len(df), max(nb_groupes, 1)), dtype=bool)
+    couverture = []
+    for j in range(P):
+        lignes_j = np.flatnonzero(groupes[:, j] >= 0)
+        visites[lignes_j, groupes[lignes_j, j]] = True
+        couverture.append(visites.sum(axis=1).mean() if len(df) else 0.0)
+    places = (groupes >= 0).sum(axis=0)
+    tableau_periodes = pd.DataFrame({
+        "Période": np.asarray(periodes, dtype=np.int64),
+        "Élèves placés": places,
+        "Répétitions": repete.sum(axis=0),
+        "Groupes distincts (moyenne)": np.round(couverture, 2),
+    })
+
+    resume = {
+        "Élèves": len(df),
+        "Groupes": nb_groupes,
+        "Périodes faites": P,
+        "Périodes restantes": restantes,
+        "Répétitions": int(repete.sum()),
+        "Couverture moyenne (%)": round(float(eleves["Couverture (%)"].mean()), 1) if len(df) else 0.0,
+        "Élèves au tour complet": int((distincts >= nb_groupes).sum()),
+        "Élèves au tour compromis": int(eleves["Tour compromis"].sum()),
+    }
+    return {"eleves": eleves, "groupes": tableau_groupes, "periodes": tableau_periodes, "resume": resume}
+
+def exporter_statistiques(statistiques, chemin):
+    """
+    Écrit les statistiques de rotation (voir statistiques_rotation) dans un seul classeur Excel :
+    feuilles Résumé, Élèves, Groupes et Périodes (écriture atomique, voir ecrire_fichiers).
+    """
+    if Path(chemin).suffix.lower() != ".xlsx":
+        raise ValueError(f"Le rapport de statistiques est un classeur Excel (.xlsx) : {os.path.basename(chemin)}")
+    resume = pd.DataFrame(list(statistiques["resume"].items()), columns=["Indicateur", "Valeur"])
+    eleves = statistiques["eleves"].assign(
+        **{"Tour compromis": statistiques["eleves"]["Tour compromis"].map({True: "oui", False: ""})}
+    )
+    feuilles = {"Résumé": resume, "Élèves": eleves, "Groupes": statistiques["groupes"],
+                "Périodes": statistiques["periodes"]}
+    dossier, nom = os.path.split(os.path.abspath(chemin))
+    ecrire_fichiers(dossier, {nom: feuilles})
+    return chemin
+
+# ==============================================================================
+# 8. Analyse d'une répartition saisie (avant génération)
+# ==============================================================================
+
+GROUPES_MAX_ANALYSE = 18     # borne par sous-ensembles (2^G) : ~20 ms par niveau à 18 groupes, tout effectif
+GROUPES_MAX_SUGGESTION = 12  # suggestion de quotas : 2^G sous-ensembles × G² déplacements par étape
+
+@functools.lru_cache(maxsize=None)
+def _sous_ensembles(nb_groupes):
+    """
+    Matrice (2^G × G) d'appartenance : ligne S, colonne g vaut 1 si le groupe g est dans le sous-ensemble S.
+    Mémorisée par nombre de groupes (lecture seule).
+    """
+    appartient = (np.arange(1 << nb_groupes)[:, None] >> np.arange(nb_groupes) & 1).astype(np.int64)
+    appartient.flags.writeable = False
+    return appartient
+
+def _somme_sous_ensembles(valeurs, nb_groupes):
+    """
+    Transformée zêta, en place : valeurs[S] devient la somme des valeurs[T] pour T inclus dans S.
+    """
+    for g in range(nb_groupes):
+        vue = valeurs.reshape(-1, 2, 1 << g)
+        vue[:, 1, :] += vue[:, 0, :]
+    return valeurs
+
+def _exces_par_sous_ensemble(histo_niveau, quotas):
+    """
+    Pour chaque sous-ensemble S de groupes : nombre d'élèves dont tous les groupes jamais faits sont dans S,
+    moins la capacité de S. D'après le théorème de Hall, le plus grand de ces excès (au moins 0, S vide compris)
+    est exactement le nombre minimal de répétitions avec ces quotas.
+    """
+    nb_groupes = len(quotas)
+    masques = (np.asarray(histo_niveau) == 0).astype(np.int64) @ (np.int64(1) << np.arange(nb_groupes, dtype=np.int64))
+    inclus = np.bincount(masques, minlength=1 << nb_groupes)
+    capacites = np.zeros(1 << nb_groupes, dtype=np.int64)
+    capacites[np.int64(1) << np.arange(nb_groupes, dtype=np.int64)] = np.asarray(quotas, dtype=np.int64)
+    return _somme_sous_ensembles(inclus, nb_groupes) - _somme_sous_ensembles(capacites, nb_groupes)
+
+def repetitions_minimales(histo_niveau, quotas):
+    """
+    Nombre minimal de répétitions (élève placé dans un groupe déjà fait) pour un niveau et des quotas donnés,
+    quelle que soit l'affectation : c'est celui qu'atteint la méthode optimale.
+    Au-delà de GROUPES_MAX_ANALYSE groupes, calcul par transport : plusieurs secondes pour quelques milliers
+    d'élèves aux historiques variés (analyser_repartition ne l'utilise donc pas).
+    """
+    histo_niveau = np.asarray(histo_niveau)
+    if len(histo_niveau) == 0:
+        return 0
+    nb_groupes = len(quotas)
+    if nb_groupes <= GROUPES_MAX_ANALYSE:
+        return int(max(_exces_par_sous_ensemble(histo_niveau, quotas).max(), 0))
+    types, comptes = np.unique((histo_niveau > 0).astype(np.int64), axis=0, return_counts=True)
+    flux = _transport_cout_min(comptes, quotas, types)
+    return int((flux * types).sum())
+
+def _suggerer_quotas(histo_niveau, quotas, max_deplacements):
+    """
+    Quotas les plus proches (déplacements d'une place d'un groupe à un autre, un à un) qui diminuent
+    le nombre minimal de répétitions. À chaque étape, le déplacement retenu minimise l'excès maximal
+    (voir _exces_par_sous_ensemble), puis le nombre de sous-ensembles qui l'atteignent.
+    Renvoie (quotas, répétitions minimales, déplacements) ou None si aucun n'est trouvé.
+    """
+    nb_groupes = len(quotas)
+    appartient = _sous_ensembles(nb_groupes)
+    exces = _exces_par_sous_ensemble(histo_niveau, quotas)
+    depart = max(int(exces.max()), 0)
+    quotas = np.array(quotas, dtype=np.int64)
+    actuel = (int(exces.max()), int((exces == exces.max()).sum()))
+    for deplacements in range(1, max_deplacements + 1):
+        # Une place passe du groupe b au groupe a : exces[S] - [a dans S] + [b dans S], pour tous les couples (a, b)
+        candidats = exces[:, None, None] - appartient[:, :, None] + appartient[:, None, :]
+        maxima = candidats.max(axis=0)
+        nb_maxima = (candidats == maxima).sum(axis=0)
+        interdit = np.eye(nb_groupes, dtype=bool) | (quotas[None, :] == 0)
+        score = np.where(interdit, np.iinfo(np.int64).max // 4, maxima * (len(exces) + 1) + nb_maxima)
+        a, b = np.unravel_index(score.argmin(), score.shape)
+        if interdit[a, b] or (maxima[a, b], nb_maxima[a, b]) >= actuel:
+            return None
+        quotas[a] += 1
+        quotas[b] -= 1
+        exces = candidats[:, a, b]
+        actuel = (int(maxima[a, b]), int(nb_maxima[a, b]))
+        if max(actuel[0], 0) < depart:
+            return quotas.tolist(), max(actuel[0], 0), deplacements
+    return None
+
+@tracer
+def analyser_repartition(df, repartition, histo=None, base_historique=None):
+    """
+    Analyse rapide d'une répartition saisie, avant génération (quelques millisecondes) :
+    pour chaque niveau, {"repetitions_min": répétitions inévitables avec ces quotas
+    (None au-delà de GROUPES_MAX_ANALYSE groupes : trop long pour une saisie en direct),
+    "groupes_vides": groupes (numéros 1..N) sans élève de ce niveau,
+    "suggestion": quotas les plus proches avec moins de répétitions (None si aucun),
+    "repetitions_suggestion", "deplacements": places à déplacer pour y arriver}.
+    histo : matrice d'historique alignée sur df (voir historique_groupes_par_eleve), à passer
+    pour les analyses répétées (saisie en direct) ; calculée sinon.
+    """
+    nb_groupes = len(next(iter(repartition.values()))) if repartition else 0
+    if histo is None:
+        histo = historique_groupes_par_eleve(df, nb_groupes, base_historique).to_numpy()
+    histo = np.asarray(histo)[:, :nb_groupes]
+    if histo.shape[1] < nb_groupes:
+        histo = np.pad(histo, ((0, 0), (0, nb_groupes - histo.shape[1])))
+    codes_niveaux, niveaux, _, _ = coder_eleves(df)
+    rangs = _rangs_niveaux(codes_niveaux, niveaux, repartition)
+    analyse = {}
+    for n, (niveau, quotas) in enumerate(repartition.items()):
+        histo_niveau = histo[rangs == n]
+        minimum = repetitions_minimales(histo_niveau, quotas) if nb_groupes <= GROUPES_MAX_ANALYSE else None
+        resultat = {
+            "repetitions_min": minimum,
+            "groupes_vides": [g + 1 for g, q in enumerate(quotas) if q == 0],
+            "suggestion": None,
+            "repetitions_suggestion": None,
+            "deplacements": 0,
+        }
+        if minimum and nb_groupes <= GROUPES_MAX_SUGGESTION:
+            suggestion = _suggerer_quotas(histo_niveau, quotas, max_deplacements=len(histo_niveau))
+            if suggestion is not None:
+                resultat["suggestion"], resultat["repetitions_suggestion"], resultat["deplacements"] = suggestion
+        analyse[niveau] = resultat
+    return analyse
@@ -0,0 +1,196 @@
+"""
+Banc d'essai MakeGroups V3
+--------------------------
+- Génère un établissement fictif (classes, niveaux, périodes passées, homonymes, noms accentués).
+- Mesure séparément chaque étape du backend : chargement, historique, génération, ajout au roster, export.
+- Écrit les résultats en JSON pour comparer deux versions du code.
+
+Exemples :
+    python MakeGroups_Bench.py --eleves 2000 --classes 16 --periodes 6 --sortie bench.json
+    python MakeGroups_Bench.py --sortie nouveau.json --comparer bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import MakeGroups
+from MakeGroups import (
+    charger_fichier,
+    generer_repartition_auto,
+    historique_groupes_par_eleve,
+    generer_groupes,
+    ajouter_groupes_au_df,
+    sauvegarder_groupes,
+)
+
+NOMS = ["Durand", "Leroy", "Hoarau", "Payet", "Técher", "Grondin", "Fontaine", "Rivière",
+        "Lebon", "Boyer", "Maillot", "Dijoux", "Müller", "Éthève", "Nativel", "Séry"]
+PRENOMS = ["Lucas", "Sarah", "Élodie", "Chloé", "Noé", "Inès", "Raphaël", "Maëlys",
+           "Zoé", "Jérémy", "Anaïs", "Loïc", "Léa", "Théo", "Océane", "Ibrahim"]
+
+# ==============================================================================
+# 0. Génération d'un établissement fictif
+# ==============================================================================
+
+def generer_ecole(nb_eleves, nb_classes, nb_niveaux, nb_groupes, nb_periodes, taux_homonymes=0.02, graine=0):
+    """
+    Renvoie un DataFrame élèves au format attendu par charger_fichier (colonnes Nom, Prénom, Classe, Niveau),
+    avec nb_periodes colonnes "Groupe Période X" déjà remplies.
+    Une part taux_homonymes des élèves est un homonyme exact (même nom, prénom et classe) d'un autre élève.
+    """
+    rng = np.random.default_rng(graine)
+    classes = 600 + np.arange(1, nb_classes + 1)
+    noms = rng.choice(NOMS, nb_eleves).astype(object) + " " + rng.integers(0, 10 ** 6, nb_eleves).astype(str)
+    df = pd.DataFrame({
+        "Nom": noms,
+        "Prénom": rng.choice(PRENOMS, nb_eleves),
+        "Classe": rng.choice(classes, nb_eleves),
+        "Niveau": rng.integers(1, nb_niveaux + 1, nb_eleves),
+    })
+    nb_homonymes = int(nb_eleves * taux_homonymes)
+    if nb_homonymes:
+        sources = rng.choice(nb_eleves, nb_homonymes, replace=False)
+        cibles = rng.choice(np.setdiff1d(np.arange(nb_eleves), sources), nb_homonymes, replace=False)
+        df.loc[cibles, ["Nom", "Prénom", "Classe"]] = df.loc[sources, ["Nom", "Prénom", "Classe"]].to_numpy()
+    for periode in range(1, nb_periodes + 1):
+        df[f"Groupe Période {periode}"] = rng.integers(1, nb_groupes + 1, nb_eleves)
+    return df
+
+# ==============================================================================
+# 1. Mesures
+# ==============================================================================
+
+def chronometrer(fonction, repetitions):
+    """
+    Exécute fonction() `repetitions` fois ; renvoie (temps, dernier résultat).
+    """
+    temps, resultat = [], None
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        temps.append(time.perf_counter() - debut)
+    return temps, resultat
+
+def resumer(temps):
+    return {
+        "min": min(temps),
+        "mediane": statistics.median(temps),
+        "max": max(temps),
+        "repetitions": len(temps),
+    }
+
+def lancer(args):
+    """
+    Génère l'établissement, mesure chaque étape et renvoie le dictionnaire de résultats.
+    """
+    df_source = generer_ecole(args.eleves, args.classes, args.niveaux, args.groupes, args.periodes,
+                              args.homonymes, args.graine)
+    etapes = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        MakeGroups.DOSSIER_CACHE = os.path.join(dossier, "cache")
+        chemins = {"csv": os.path.join(dossier, "ecole.csv"), "xlsx": os.path.join(dossier, "ecole.xlsx")}
+        df_source.to_csv(chemins["csv"], index=False)
+        if not args.sans_excel:
+            df_source.to_excel(chemins["xlsx"], index=False)
+        else:
+            del chemins["xlsx"]
+
+        for ext, chemin in chemins.items():
+            temps, df = chronometrer(lambda: charger_fichier(chemin, cache=False), args.repetitions)
+            etapes[f"charger_fichier[{ext}]"] = resumer(temps)
+            temps, _ = chronometrer(lambda: charger_fichier(chemin), args.repetitions + 1)
+            etapes[f"charger_fichier[{ext},cache]"] = resumer(temps[1:])
+
+        temps, _ = chronometrer(lambda: historique_groupes_par_eleve(df, args.groupes), args.repetitions)
+        etapes["historique_groupes_par_eleve"] = resumer(temps)
+
+        repartition = generer_repartition_auto(df, args.groupes)
+        for methode in args.methodes:
+            # Sans mémorisation des résultats : c'est le calcul qui est mesuré
+            temps, (groupes, repetitions) = chronometrer(
+                lambda: generer_groupes(df, args.groupes, repartition, methode=methode, avec_repetitions=True,
+                                        seed=args.graine, cache=False),
+                args.repetitions,
+            )
+            etapes[f"generer_groupes[{methode}]"] = {**resumer(temps), "repetitions_eleves": repetitions}
+
+        # Dossier neuf à chaque mesure : l'écriture complète est mesurée, pas le saut des fichiers inchangés
+        temps, (dossier_periode, nom_classes, periode) = chronometrer(
+            lambda: ajouter_groupes_au_df(df.copy(), groupes, chemins["csv"], tempfile.mkdtemp(dir=dossier)),
+            args.repetitions,
+        )
+        etapes["ajouter_groupes_au_df"] = resumer(temps)
+
+        for format in args.formats:
+            temps, _ = chronometrer(
+                lambda: sauvegarder_groupes(groupes, tempfile.mkdtemp(dir=dossier), nom_classes, periode, format=format),
+                args.repetitions,
+            )
+            etapes[f"sauvegarder_groupes[{format}]"] = resumer(temps)
+
+    return {
+        "parametres": {k: v for k, v in vars(args).items() if k not in ("sortie", "comparer")},
+        "environnement": {
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "plateforme": platform.platform(),
+            "processeurs": os.cpu_count(),
+        },
+        "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "etapes": etapes,
+    }
+
+def comparer(resultats, reference):
+    """
+    Affiche, pour chaque étape commune, le rapport des médianes (nouveau / référence).
+    """
+    print(f"\n{'Étape':45} {'référence':>10} {'nouveau':>10} {'rapport':>8}")
+    for etape, mesure in resultats["etapes"].items():
+        if etape in reference["etapes"]:
+            ancien = reference["etapes"][etape]["mediane"]
+            nouveau = mesure["mediane"]
+            print(f"{etape:45} {ancien:10.4f} {nouveau:10.4f} {nouveau / ancien if ancien else float('nan'):8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Banc d'essai des étapes du backend MakeGroups.")
+    parser.add_argument("--eleves", type=int, default=1000)
+    parser.add_argument("--classes", type=int, default=8)
+    parser.add_argument("--niveaux", type=int, default=4)
+    parser.add_argument("--groupes", type=int, default=9)
+    parser.add_argument("--periodes", type=int, default=4, help="nombre de périodes déjà réalisées")
+    parser.add_argument("--homonymes", type=float, default=0.02, help="part d'homonymes exacts (défaut : 0.02)")
+    parser.add_argument("--methodes", nargs="+", default=["glouton", "optimal"],
+                        choices=list(MakeGroups.METHODES_AFFECTATION))
+    parser.add_argument("--formats", nargs="+", default=["xlsx", "classeur", "csv"],
+                        choices=list(MakeGroups.FORMATS_EXPORT))
+    parser.add_argument("--repetitions", type=int, default=3, help="mesures par étape")
+    parser.add_argument("--graine", type=int, default=0)
+    parser.add_argument("--sans-excel", action="store_true", help="ne pas mesurer le chargement Excel (lent)")
+    parser.add_argument("--sortie", default=None, help="fichier JSON de résultats (défaut : sortie standard)")
+    parser.add_argument("--comparer", default=None, help="fichier JSON de référence à comparer")
+    args = parser.parse_args(argv)
+
+    resultats = lancer(args)
+    texte = json.dumps(resultats, ensure_ascii=False, indent=2)
+    if args.sortie:
+        with open(args.sortie, "w", encoding="utf-8") as f:
+            f.write(texte)
+    else:
+        print(texte)
+    if args.comparer:
+        with open(args.comparer, encoding="utf-8") as f:
+            comparer(resultats, json.load(f))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
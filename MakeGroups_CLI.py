@@ -0,0 +1,365 @@
+"""
+Ligne de commande MakeGroups V3
+-------------------------------
+- Traite en lot des fichiers élèves (dossier ou motif glob), sans interface graphique.
+- Chaque fichier est traité dans un processus séparé, avec une graine déterministe :
+  relancer le même lot relit les groupes mémorisés au lieu de les recalculer.
+- Affiche un résumé et les temps de chaque étape par fichier.
+
+Exemples :
+    python MakeGroups_CLI.py exemples/
+    python MakeGroups_CLI.py "rosters/*.xlsx" --groupes 4 --methode optimal --sortie exports/
+    python MakeGroups_CLI.py exemples/ --plan-annee 6
+    python MakeGroups_CLI.py export_academique.csv --decouper lots/ --lots prefixe:1
+    python MakeGroups_CLI.py nouvel_effectif.csv --precedent 601-602_Période3/601-602_Période3.xlsx
+    python MakeGroups_CLI.py --archives archives/ --historique historique.sqlite
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from MakeGroups import (
+    charger_fichier,
+    vider_cache,
+    homonymes,
+    partitionner_export,
+    generer_repartition_auto,
+    generer_groupes,
+    optimiser_groupes,
+    reaffecter_groupes,
+    planifier_annee,
+    groupes_du_plan,
+    historique_groupes_par_eleve,
+    detecter_prochaine_periode,
+    extraire_nom_classes,
+    ecrire_fichiers,
+    colonnes_periodes,
+    ajouter_groupes_au_df,
+    statistiques_rotation,
+    exporter_statistiques,
+    METHODES_AFFECTATION,
+    FORMATS_EXPORT,
+)
+from MakeGroups_Historique import BaseHistorique
+from MakeGroups_Trace import activer_trace, reinitialiser_trace, evenements_trace, exporter_trace
+
+EXTENSIONS = ('.csv', '.xlsx', '.xls')
+SUFFIXE_PLAN = "_Plan.xlsx"
+SUFFIXE_STATISTIQUES = "_Statistiques.xlsx"
+SORTIES = (SUFFIXE_PLAN, SUFFIXE_STATISTIQUES)  # fichiers écrits par l'outil à côté des fichiers élèves : jamais relus comme tels
+
+# ==============================================================================
+# 0. Recherche des fichiers à traiter
+# ==============================================================================
+
+def lister_fichiers(entrees):
+    """
+    Développe les dossiers (fichiers élèves directement contenus) et les motifs glob
+    en une liste triée et sans doublons de fichiers élèves.
+    Les fichiers que l'outil écrit à côté des fichiers élèves (voir SORTIES) sont ignorés.
+    """
+    fichiers = set()
+    for entree in entrees:
+        if os.path.isdir(entree):
+            candidats = [os.path.join(entree, f) for f in os.listdir(entree)]
+        else:
+            candidats = glob.glob(entree)
+        fichiers.update(
+            os.path.abspath(f) for f in candidats
+            if os.path.isfile(f) and f.lower().endswith(EXTENSIONS) and not f.endswith(SORTIES)
+        )
+    return sorted(fichiers)
+
+def graine_fichier(chemin, graine):
+    """
+    Graine déterministe propre à un fichier : même fichier + même graine = mêmes groupes.
+    """
+    return (graine + zlib.crc32(os.path.basename(chemin).encode('utf-8'))) % 2 ** 32
+
+# ==============================================================================
+# 1. Traitement d'un fichier (exécuté dans un processus du pool)
+# ==============================================================================
+
+def traiter_fichier(chemin, nb_groupes, methode, dossier_sortie, graine, budget, chemin_historique=None,
+                    format="xlsx", trace=False, periodes_plan=None, statistiques=False):
+    """
+    Charge, répartit, génère et enregistre les groupes d'un fichier élèves.
+    Avec periodes_plan, les groupes sont lus dans le plan de l'année (voir groupes_planifies).
+    Avec statistiques=True, le rapport de rotation "<nom_classes>_Statistiques.xlsx" est écrit
+    à côté des dossiers de périodes (voir statistiques_rotation).
+    Avec une base d'historique, le fichier y est importé (une seule fois) et l'historique
+    est lu puis complété dans la base.
+    Avec trace=True, les événements d'instrumentation du traitement sont joints au résumé.
+    Renvoie un dictionnaire résumé (effectifs, période, répétitions, temps par étape).
+    """
+    if trace:
+        activer_trace()
+        reinitialiser_trace()
+    if chemin_historique:
+        with BaseHistorique(chemin_historique) as base:
+            res = _traiter_fichier(chemin, nb_groupes, methode, dossier_sortie, graine, budget, base, format,
+                                   periodes_plan, statistiques)
+    else:
+        res = _traiter_fichier(chemin, nb_groupes, methode, dossier_sortie, graine, budget, None, format,
+                               periodes_plan, statistiques)
+    if trace:
+        res['trace'] = [{**e, 'pid': os.getpid(), 'fichier': os.path.basename(chemin)} for e in evenements_trace()]
+    return res
+
+def groupes_planifies(df, nb_groupes, repartition, nb_periodes, dossier_parent, base, graine=None):
+    """
+    Groupes de la prochaine période lus dans le plan "<nom_classes>_Plan.xlsx" du dossier parent.
+    Le plan (nb_periodes périodes, voir planifier_annee) est calculé et enregistré s'il n'existe pas
+    ou ne couvre pas cette période. Renvoie (groupes, nombre de répétitions).
+    """
+    periode = detecter_prochaine_periode(df)
+    if base is not None:
+        periode = max(periode, base.prochaine_periode(df))
+    nom_plan = f"{extraire_nom_classes(df)}{SUFFIXE_PLAN}"
+    chemin_plan = os.path.join(dossier_parent, nom_plan)
+    plan = charger_fichier(chemin_plan) if os.path.exists(chemin_plan) else None
+    if plan is None or periode not in colonnes_periodes(plan).values():
+        plan = planifier_annee(df, nb_groupes, nb_periodes, repartition, base, seed=graine)
+        ecrire_fichiers(dossier_parent, {nom_plan: {"Plan": plan}})
+    groupes = groupes_du_plan(df, plan, nb_groupes, periode)
+    histo = historique_groupes_par_eleve(df, nb_groupes, base).to_numpy()
+    places = np.flatnonzero(groupes.affectation >= 0)
+    return groupes, int((histo[places, groupes.affectation[places]] > 0).sum())
+
+def _traiter_fichier(chemin, nb_groupes, methode, dossier_sortie, graine, budget, base, format,
+                     periodes_plan=None, statistiques=False):
+    temps = {}
+    debut = time.perf_counter()
+    df = charger_fichier(chemin)
+    if base is not None:
+        base.importer_fichier(chemin)
+    temps['chargement'] = time.perf_counter() - debut
+
+    if nb_groupes is None:
+        nb_groupes = df['Classe'].nunique() + 1
+    debut = time.perf_counter()
+    repartition = generer_repartition_auto(df, nb_groupes)
+    if periodes_plan:
+        groupes, repetitions = groupes_planifies(df, nb_groupes, repartition, periodes_plan,
+                                                 dossier_sortie or os.path.dirname(chemin), base, graine)
+    elif methode == "optimise":
+        # Un seul processus ici : le parallélisme se fait déjà entre fichiers
+        groupes, repetitions = optimiser_groupes(
+            df, nb_groupes, repartition, budget=budget, seed=graine, nb_processus=1, avec_repetitions=True,
+            base_historique=base,
+        )
+    else:
+        groupes, repetitions = generer_groupes(
+            df, nb_groupes, repartition, methode=methode, avec_repetitions=True, base_historique=base,
+            seed=graine,
+        )
+    temps['generation'] = time.perf_counter() - debut
+
+    debut = time.perf_counter()
+    dossier, nom_classes, periode = ajouter_groupes_au_df(
+        df, groupes, chemin, dossier_sortie or os.path.dirname(chemin), base_historique=base, format=format
+    )
+    temps['enregistrement'] = time.perf_counter() - debut
+
+    if statistiques:
+        debut = time.perf_counter()
+        # Hors du dossier de période : le rapport n'est pas pris pour un classeur élèves à la relecture des archives,
+        # ni au prochain lot (voir SORTIES)
+        chemin_rapport = os.path.join(dossier_sortie or os.path.dirname(chemin), f"{nom_classes}{SUFFIXE_STATISTIQUES}")
+        exporter_statistiques(statistiques_rotation(df, nb_groupes, base_historique=base), chemin_rapport)
+        temps['statistiques'] = time.perf_counter() - debut
+
+    return {
+        'fichier': chemin,
+        'eleves': len(df),
+        'homonymes': homonymes(df),
+        'groupes': nb_groupes,
+        'periode': periode,
+        'repetitions': repetitions,
+        'dossier': dossier,
+        'graine': graine,
+        'temps': temps,
+    }
+
+def mettre_a_jour_fichier(chemin, chemin_precedent, nb_groupes, dossier_sortie, graine, chemin_historique=None,
+                         format="xlsx"):
+    """
+    Met à jour la dernière période de chemin_precedent avec l'effectif de chemin (arrivées, départs,
+    changements de niveau), sans regénérer les groupes : voir reaffecter_groupes.
+    Les fichiers de la période sont réécrits dans le dossier "<nom_classes>_PériodeX" d'origine
+    (ou sous dossier_sortie). Renvoie un dictionnaire résumé.
+    """
+    df_precedent = charger_fichier(chemin_precedent)
+    df = charger_fichier(chemin)
+    periodes = colonnes_periodes(df_precedent)
+    if not periodes:
+        raise ValueError(f"Aucune colonne « Groupe Période X » dans {os.path.basename(chemin_precedent)}")
+    colonne = max(periodes, key=periodes.get)
+    if nb_groupes is None:
+        nb_groupes = int(pd.to_numeric(df_precedent[colonne], errors='coerce').max())
+    debut = time.perf_counter()
+    base = BaseHistorique(chemin_historique) if chemin_historique else None
+    try:
+        groupes, details = reaffecter_groupes(df_precedent, df, nb_groupes, colonne=colonne,
+                                              base_historique=base, avec_details=True, seed=graine)
+        dossier_parent = dossier_sortie or os.path.dirname(os.path.dirname(os.path.abspath(chemin_precedent)))
+        dossier, nom_classes, periode = ajouter_groupes_au_df(
+            groupes.df, groupes, chemin, dossier_parent, base_historique=base, periode=periodes[colonne],
+            format=format,
+        )
+    finally:
+        if base is not None:
+            base.fermer()
+    return {**details, 'periode': periode, 'dossier': dossier, 'temps': time.perf_counter() - debut}
+
+# ==============================================================================
+# 2. Lancement en lot
+# ==============================================================================
+
+def afficher_resultat(res):
+    temps = res['temps']
+    print(
+        f"✔ {os.path.basename(res['fichier'])} : {res['eleves']} élèves, {res['groupes']} groupes, "
+        f"période {res['periode']}, {res['repetitions']} répétition(s) (graine {res['graine']})\n"
+        f"    chargement {temps['chargement']:.2f} s | génération {temps['generation']:.2f} s | "
+        f"enregistrement {temps['enregistrement']:.2f} s"
+        + (f" | statistiques {temps['statistiques']:.2f} s" if 'statistiques' in temps else "")
+        + f" -> {res['dossier']}"
+    )
+    if res.get('homonymes'):
+        print(f"    ⚠ homonymes, distingués par leur ordre dans le fichier : {', '.join(res['homonymes'])}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Génère en lot les groupes de la prochaine période pour plusieurs fichiers élèves."
+    )
+    parser.add_argument("entrees", nargs="*", help="dossiers ou motifs glob de fichiers élèves (.csv, .xlsx, .xls)")
+    parser.add_argument("--groupes", type=int, default=None,
+                        help="nombre de groupes (par défaut : nombre de classes + 1, comme dans l'interface)")
+    parser.add_argument("--methode", choices=list(METHODES_AFFECTATION) + ["optimise", "planifie"], default="glouton",
+                        help="méthode d'affectation (défaut : glouton)")
+    parser.add_argument("--budget", type=float, default=3.0,
+                        help="temps de calcul par fichier pour la méthode optimise, en secondes")
+    parser.add_argument("--sortie", default=None,
+                        help="dossier parent des exports (défaut : dossier de chaque fichier)")
+    parser.add_argument("--format", choices=FORMATS_EXPORT, default="xlsx",
+                        help="format des fichiers de groupes (défaut : un fichier xlsx par groupe)")
+    parser.add_argument("--decouper", default=None, metavar="DOSSIER",
+                        help="découpe d'abord chaque export CSV (plusieurs établissements) en fichiers élèves "
+                             "par établissement dans DOSSIER, lus par blocs, puis traite chacun de ces fichiers")
+    parser.add_argument("--lots", default=None,
+                        help="avec --decouper, subdivise chaque établissement en lots de classes : prefixe:N "
+                             "(N premiers caractères du nom de classe, ex : prefixe:1 pour 601, 602...)")
+    parser.add_argument("--plan-annee", type=int, default=None, metavar="PERIODES",
+                        help="planifie en une fois PERIODES périodes (rotation des groupes) dans <classes>_Plan.xlsx, "
+                             "puis lit la prochaine période dans ce plan")
+    parser.add_argument("--precedent", default=None,
+                        help="fichier de la période à mettre à jour : seuls les élèves arrivés ou changés de niveau "
+                             "dans le fichier élèves donné sont (re)placés")
+    parser.add_argument("--historique", default=None,
+                        help="base SQLite d'historique à utiliser et compléter (créée si absente)")
+    parser.add_argument("--statistiques", action="store_true",
+                        help="écrit aussi le rapport de rotation <classes>_Statistiques.xlsx (groupes faits par élève, "
+                             "répétitions, mixité des groupes par période, élèves qui ne pourront pas finir le tour)")
+    parser.add_argument("--archives", default=None, metavar="DOSSIER",
+                        help="avec --historique, reconstruit d'abord la base à partir des dossiers <classes>_PériodeX "
+                             "trouvés sous DOSSIER (seuls les dossiers nouveaux ou modifiés sont relus)")
+    parser.add_argument("--trace", default=None,
+                        help="écrit la trace des étapes : .json = format Chrome trace, sinon JSON lines")
+    parser.add_argument("--graine", type=int, default=0, help="graine de base (défaut : 0)")
+    parser.add_argument("--processus", type=int, default=None,
+                        help="nombre de processus (défaut : nombre de cœurs)")
+    parser.add_argument("--vider-cache", action="store_true",
+                        help="supprime d'abord le cache des fichiers élèves et des groupes générés (~/.makegroups/cache)")
+    args = parser.parse_args(argv)
+
+    if args.vider_cache:
+        vider_cache()
+        print("✔ Cache vidé")
+        if not args.entrees and not args.archives:
+            return 0
+
+    if args.archives:
+        if not args.historique:
+            print("--archives nécessite --historique (base SQLite à reconstruire).", file=sys.stderr)
+            return 1
+        debut = time.perf_counter()
+        try:
+            with BaseHistorique(args.historique) as base:
+                bilan = base.importer_archives(args.archives, nb_processus=args.processus)
+        except Exception as e:
+            print(f"✘ {args.archives} : {e}", file=sys.stderr)
+            return 1
+        print(f"✔ Archives : {bilan['lus']}/{bilan['dossiers']} dossier(s) relu(s), "
+              f"{bilan['eleves']} affectation(s) en {time.perf_counter() - debut:.2f} s -> {args.historique}")
+        if not args.entrees:
+            return 0
+
+    fichiers = lister_fichiers(args.entrees)
+    if not fichiers:
+        print("Aucun fichier élèves trouvé.", file=sys.stderr)
+        return 1
+    if args.decouper:
+        os.makedirs(args.decouper, exist_ok=True)
+        lots = []
+        for chemin in fichiers:
+            try:
+                decoupage = partitionner_export(chemin, args.decouper, regle=args.lots)
+            except Exception as e:
+                print(f"✘ {os.path.basename(chemin)} : {e}", file=sys.stderr)
+                return 1
+            print(f"✂ {os.path.basename(chemin)} : {len(decoupage)} lot(s) dans {args.decouper}")
+            lots.extend(decoupage.values())
+        fichiers = sorted(lots)
+
+    if args.precedent:
+        if len(fichiers) != 1:
+            print("--precedent attend un seul fichier élèves (le nouvel effectif).", file=sys.stderr)
+            return 1
+        try:
+            res = mettre_a_jour_fichier(fichiers[0], args.precedent, args.groupes, args.sortie, args.graine,
+                                        args.historique, args.format)
+        except Exception as e:
+            print(f"✘ {os.path.basename(fichiers[0])} : {e}", file=sys.stderr)
+            return 1
+        print(
+            f"✔ Période {res['periode']} mise à jour : {res['arrives']} arrivée(s), {res['partis']} départ(s), "
+            f"{res['changements_niveau']} changement(s) de niveau, {res['deplaces']} élève(s) déplacé(s), "
+            f"{res['repetitions']} répétition(s) en {res['temps']:.2f} s -> {res['dossier']}"
+        )
+        return 0
+
+    debut = time.perf_counter()
+    erreurs = 0
+    trace = []
+    with ProcessPoolExecutor(max_workers=args.processus) as pool:
+        futures = {
+            pool.submit(traiter_fichier, chemin, args.groupes, args.methode, args.sortie,
+                        graine_fichier(chemin, args.graine), args.budget, args.historique, args.format, bool(args.trace),
+                        args.plan_annee, args.statistiques): chemin
+            for chemin in fichiers
+        }
+        for future in as_completed(futures):
+            try:
+                res = future.result()
+                trace.extend(res.pop('trace', []))
+                afficher_resultat(res)
+            except Exception as e:
+                erreurs += 1
+                print(f"✘ {os.path.basename(futures[future])} : {e}", file=sys.stderr)
+
+    if args.trace:
+        exporter_trace(args.trace, "chrome" if args.trace.lower().endswith(".json") else "jsonl", trace)
+    print(f"\n{len(fichiers) - erreurs}/{len(fichiers)} fichier(s) traité(s) en {time.perf_counter() - debut:.2f} s")
+    return 1 if erreurs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
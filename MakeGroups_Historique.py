@@ -0,0 +1,439 @@
+"""
+Historique persistant MakeGroups V3
+-----------------------------------
+Base SQLite (bibliothèque standard) qui conserve les groupes de chaque élève par période,
+pour ne plus relire un classeur Excel de plus en plus large à chaque période.
+- Identité d'un élève : (Nom, Prenom, Classe, rang) normalisés (accents, casse, espaces),
+  le rang distinguant les homonymes ; recherches et fusions par identifiant entier haché (voir identites)
+- Ajout d'une période au moment de l'enregistrement (voir ajouter_groupes_au_df)
+- Lecture de l'historique d'un niveau par requête indexée
+- Import unique des classeurs de périodes existants, export au format Excel historique
+- Reconstruction à partir d'une arborescence de dossiers "<classes>_PériodeX" (lecture en parallèle,
+  seuls les dossiers nouveaux ou modifiés sont relus)
+"""
+
+import hashlib
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from MakeGroups import (
+    charger_fichier, colonnes_periodes, identites, normaliser_colonne, hacher_identites,
+    normalize_str, normaliser_colonnes,
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS eleves (
+    id      INTEGER PRIMARY KEY,
+    cle     INTEGER,            -- identifiant haché de l'identité normalisée (voir identites)
+    nom     TEXT NOT NULL,
+    prenom  TEXT NOT NULL,
+    classe  TEXT NOT NULL,
+    rang    INTEGER NOT NULL,
+    niveau  TEXT NOT NULL,
+    UNIQUE (nom, prenom, classe, rang)
+);
+CREATE INDEX IF NOT EXISTS eleves_classe_niveau ON eleves (classe, niveau);
+CREATE TABLE IF NOT EXISTS affectations (
+    eleve_id INTEGER NOT NULL REFERENCES eleves (id),
+    periode  INTEGER NOT NULL,
+    groupe   INTEGER NOT NULL,
+    PRIMARY KEY (eleve_id, periode)
+);
+CREATE TABLE IF NOT EXISTS imports (
+    chemin  TEXT PRIMARY KEY,
+    taille  INTEGER NOT NULL,
+    mtime   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS archives (
+    dossier   TEXT PRIMARY KEY,
+    periode   INTEGER NOT NULL,
+    empreinte TEXT NOT NULL
+);
+"""
+
+class BaseHistorique:
+    """
+    Historique des groupes stocké dans un fichier SQLite.
+    S'utilise comme gestionnaire de contexte : with BaseHistorique("historique.sqlite") as base: ...
+    """
+
+    def __init__(self, chemin):
+        self.chemin = chemin
+        self.connexion = sqlite3.connect(chemin, timeout=30)
+        self.connexion.executescript(SCHEMA)
+        self._migrer()
+        self.connexion.execute("CREATE UNIQUE INDEX IF NOT EXISTS eleves_cle ON eleves (cle)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+    def fermer(self):
+        self.connexion.close()
+
+    def _migrer(self):
+        """
+        Mise à niveau d'une base créée avant les identités normalisées : ajoute la colonne cle,
+        normalise les identités enregistrées et fusionne les élèves qui ne différaient
+        que par l'écriture (accents, casse, espaces) en gardant toutes leurs affectations.
+        """
+        colonnes = [ligne[1] for ligne in self.connexion.execute("PRAGMA table_info(eleves)")]
+        with self.connexion:
+            if 'cle' not in colonnes:
+                self.connexion.execute("ALTER TABLE eleves ADD COLUMN cle INTEGER")
+            anciens = pd.read_sql_query(
+                "SELECT id, nom, prenom, classe, rang FROM eleves WHERE cle IS NULL ORDER BY id", self.connexion
+            )
+            if anciens.empty:
+                return
+            for colonne in ('nom', 'prenom', 'classe'):
+                anciens[colonne] = normaliser_colonne(anciens[colonne])
+            anciens['cle'] = hacher_identites(anciens['nom'], anciens['prenom'], anciens['classe'], anciens['rang'])
+            conserve = anciens.groupby('cle')['id'].transform('min')
+            doublons = anciens[anciens['id'] != conserve]
+            paires = list(zip(conserve[doublons.index].tolist(), doublons['id'].tolist()))
+            self.connexion.executemany(
+                "UPDATE OR IGNORE affectations SET eleve_id = ? WHERE eleve_id = ?", paires
+            )
+            ids_doublons = [(i,) for i in doublons['id'].tolist()]
+            self.connexion.executemany("DELETE FROM affectations WHERE eleve_id = ?", ids_doublons)
+            self.connexion.executemany("DELETE FROM eleves WHERE id = ?", ids_doublons)
+            restants = anciens[anciens['id'] == conserve]
+            self.connexion.executemany(
+                "UPDATE eleves SET cle = ?, nom = ?, prenom = ?, classe = ? WHERE id = ?",
+                list(zip(restants['cle'].tolist(), restants['nom'], restants['prenom'], restants['classe'],
+                         restants['id'].tolist())),
+            )
+
+    # ==========================================================================
+    # Écriture
+    # ==========================================================================
+
+    def _ids_eleves(self, df):
+        """
+        Crée au besoin les élèves du DataFrame et renvoie leurs identifiants, alignés sur df.
+        """
+        cles = identites(df)
+        lignes = list(zip(cles['id'].tolist(), cles['nom'], cles['prenom'], cles['classe'],
+                          cles['rang'].tolist(), cles['niveau']))
+        self.connexion.executemany(
+            "INSERT INTO eleves (cle, nom, prenom, classe, rang, niveau) VALUES (?, ?, ?, ?, ?, ?) "
+            "ON CONFLICT (cle) DO UPDATE SET niveau = excluded.niveau",
+            lignes,
+        )
+        return self._lire_ids(cles)
+
+    def _lire_ids(self, cles):
+        """
+        Identifiants des élèves connus (0 pour un élève absent de la base), alignés sur cles.
+        """
+        classes = sorted(cles['classe'].unique())
+        connus = pd.read_sql_query(
+            f"SELECT id, cle FROM eleves WHERE classe IN ({','.join('?' * len(classes))})",
+            self.connexion, params=classes,
+        )
+        positions = pd.Index(connus['cle']).get_indexer(cles['id'])
+        return np.where(positions >= 0, connus['id'].to_numpy(dtype=np.int64)[positions], 0)
+
+    def enregistrer_periode(self, df, periode, colonne):
+        """
+        Ajoute (ou remplace) les groupes d'une période, lus dans la colonne donnée du DataFrame.
+        """
+        groupes = pd.to_numeric(df[colonne], errors='coerce').to_numpy()
+        with self.connexion:
+            ids = self._ids_eleves(df)
+            valides = ~np.isnan(groupes)
+            self.connexion.executemany(
+                "INSERT OR REPLACE INTO affectations (eleve_id, periode, groupe) VALUES (?, ?, ?)",
+                [(int(i), int(periode), int(g)) for i, g in zip(ids[valides], groupes[valides])],
+            )
+
+    def importer_df(self, df):
+        """
+        Importe toutes les colonnes "Groupe Période X" d'un DataFrame.
+        """
+        for colonne, periode in colonnes_periodes(df).items():
+            self.enregistrer_periode(df, periode, colonne)
+
+    def importer_fichier(self, chemin):
+        """
+        Importe un classeur de période existant, une seule fois : un fichier déjà importé
+        (même taille et même date de modification) n'est pas relu. Renvoie True s'il a été lu.
+        """
+        infos = os.stat(chemin)
+        chemin = os.path.abspath(chemin)
+        deja = self.connexion.execute(
+            "SELECT 1 FROM imports WHERE chemin = ? AND taille = ? AND mtime = ?",
+            (chemin, infos.st_size, infos.st_mtime),
+        ).fetchone()
+        if deja:
+            return False
+        self.importer_df(charger_fichier(chemin))
+        with self.connexion:
+            self.connexion.execute(
+                "INSERT OR REPLACE INTO imports (chemin, taille, mtime) VALUES (?, ?, ?)",
+                (chemin, infos.st_size, infos.st_mtime),
+            )
+        return True
+
+    def remplacer_periode_dossier(self, df, periode):
+        """
+        Remplace les groupes d'une période pour les élèves du DataFrame (colonne 'Groupe', vide pour
+        un élève du classeur retiré à la main des fichiers de groupes : il perd son affectation).
+        Seuls ces élèves sont concernés : ceux d'une autre année scolaire, dans des classes de même nom,
+        gardent leur période.
+        """
+        with self.connexion:
+            ids = self._ids_eleves(df)
+            self.connexion.executemany(
+                "DELETE FROM affectations WHERE periode = ? AND eleve_id = ?",
+                [(int(periode), int(i)) for i in ids],
+            )
+        self.enregistrer_periode(df, periode, 'Groupe')
+
+    def importer_archives(self, racine, nb_processus=None, progression=None):
+        """
+        Reconstruit l'historique à partir des dossiers "<classes>_PériodeX" trouvés sous racine
+        (voir lire_dossier_periode). Les dossiers sont lus en parallèle (pool de processus :
+        la lecture des classeurs Excel occupe le processeur) puis enregistrés un par un dans la base.
+        Un dossier dont aucun fichier n'a changé depuis le dernier passage n'est pas relu.
+        progression(fraction) est appelé après chaque dossier enregistré.
+        Renvoie {"dossiers": nombre trouvé, "lus": nombre relu, "eleves": lignes enregistrées}.
+        """
+        dossiers = lister_dossiers_periodes(racine)
+        connus = dict(self.connexion.execute("SELECT dossier, empreinte FROM archives"))
+        empreintes = {dossier: empreinte_dossier(dossier) for dossier in dossiers}
+        a_lire = [d for d in dossiers if connus.get(d) != empreintes[d]]
+        bilan = {"dossiers": len(dossiers), "lus": 0, "eleves": 0}
+
+        def enregistrer(dossier, df):
+            if len(df):
+                self.remplacer_periode_dossier(df, dossiers[dossier])
+            with self.connexion:
+                self.connexion.execute(
+                    "INSERT OR REPLACE INTO archives (dossier, periode, empreinte) VALUES (?, ?, ?)",
+                    (dossier, dossiers[dossier], empreintes[dossier]),
+                )
+            bilan["lus"] += 1
+            bilan["eleves"] += len(df)
+            if progression is not None:
+                progression(bilan["lus"] / len(a_lire))
+
+        # Dossiers enregistrés dans l'ordre (dossier parent, ex : année scolaire, puis période), quel que soit
+        # le processus qui finit le premier : le niveau retenu pour un élève est celui de sa dernière période.
+        # L'écriture SQLite reste ici
+        a_lire.sort(key=lambda d: (os.path.dirname(d), dossiers[d], d))
+        if len(a_lire) <= 1 or nb_processus == 1:
+            for dossier in a_lire:
+                enregistrer(dossier, lire_dossier_periode(dossier, dossiers[dossier]))
+            return bilan
+        with ProcessPoolExecutor(max_workers=nb_processus) as pool:
+            lus = pool.map(lire_dossier_periode, a_lire, [dossiers[d] for d in a_lire])
+            for dossier, df in zip(a_lire, lus):
+                enregistrer(dossier, df)
+        return bilan
+
+    # ==========================================================================
+    # Lecture
+    # ==========================================================================
+
+    def prochaine_periode(self, df):
+        """
+        Prochaine période à créer pour les élèves du DataFrame : les périodes d'une autre année scolaire
+        (mêmes noms de classes, autres élèves) ne comptent pas.
+        """
+        ids = self._lire_ids(identites(df))
+        connus = sorted(set(ids[ids > 0].tolist()))
+        if not connus:
+            return 1
+        (derniere,) = self.connexion.execute(
+            f"SELECT MAX(periode) FROM affectations WHERE eleve_id IN ({','.join('?' * len(connus))})",
+            connus,
+        ).fetchone()
+        return (derniere or 0) + 1
+
+    def matrice_historique(self, df, nb_groupes=None, niveau=None, periode_max=None):
+        """
+        Même résultat que historique_groupes_par_eleve (matrice élèves × groupes alignée sur df),
+        calculé par requête indexée sur les classes (et éventuellement le niveau) du DataFrame.
+        periode_max : seules les périodes jusqu'à celle-ci sont comptées (ex : réécriture d'une période).
+        """
+        cles = identites(df)
+        cles['position'] = np.arange(len(df))
+        if niveau is not None:
+            cles = cles[cles['niveau'] == str(niveau).strip()]
+        classes = sorted(cles['classe'].unique())
+        requete = (
+            f"SELECT e.cle AS id, a.groupe, COUNT(*) AS n "
+            f"FROM eleves e JOIN affectations a ON a.eleve_id = e.id "
+            f"WHERE e.classe IN ({','.join('?' * len(classes))})"
+        )
+        params = list(classes)
+        if niveau is not None:
+            requete += " AND e.niveau = ?"
+            params.append(str(niveau).strip())
+        if periode_max is not None:
+            requete += " AND a.periode <= ?"
+            params.append(int(periode_max))
+        comptes = pd.read_sql_query(requete + " GROUP BY e.id, a.groupe", self.connexion, params=params)
+        if nb_groupes is None:
+            nb_groupes = int(comptes['groupe'].max()) if len(comptes) else 0
+        fusion = cles[['id', 'position']].merge(comptes, on='id')
+        fusion = fusion[(fusion['groupe'] >= 1) & (fusion['groupe'] <= nb_groupes)]
+        matrice = np.zeros((len(df), nb_groupes), dtype=np.int16)
+        np.add.at(matrice, (fusion['position'].to_numpy(dtype=np.intp), fusion['groupe'].to_numpy(dtype=np.intp) - 1),
+                  fusion['n'].to_numpy(dtype=np.int16))
+        return pd.DataFrame(matrice, index=df.index, columns=range(1, nb_groupes + 1))
+
+    def vers_df(self, df):
+        """
+        Reconstitue la présentation Excel historique : le DataFrame élèves
+        suivi d'une colonne "Groupe Période X" par période connue.
+        """
+        cles = identites(df)
+        ids = self._lire_ids(cles)
+        connus = sorted(set(ids[ids > 0].tolist()))
+        if connus:
+            affectations = pd.read_sql_query(
+                f"SELECT eleve_id, periode, groupe FROM affectations "
+                f"WHERE eleve_id IN ({','.join('?' * len(connus))})",
+                self.connexion, params=connus,
+            )
+        else:
+            affectations = pd.DataFrame(columns=['eleve_id', 'periode', 'groupe'])
+        tableau = affectations.pivot(index='eleve_id', columns='periode', values='groupe')
+        resultat = df.drop(columns=list(colonnes_periodes(df)))
+        for periode in tableau.columns:
+            valeurs = tableau[periode].reindex(ids).to_numpy()
+            resultat[f"Groupe Période {periode}"] = pd.Series(
+                [int(v) if not np.isnan(v) else "" for v in valeurs], index=df.index, dtype=object
+            )
+        return resultat
+
+    def exporter_excel(self, df, chemin):
+        """
+        Écrit le classeur au format historique (voir vers_df).
+        """
+        self.vers_df(df).to_excel(chemin, index=False)
+
+# ==============================================================================
+# Lecture des dossiers d'archives (fonctions de module : exécutées dans les processus du pool)
+# ==============================================================================
+
+MOTIF_DOSSIER = re.compile(r"_periode\s*(\d+)$")
+MOTIF_GROUPE = re.compile(r"_groupe\s*(\d+)_periode\s*(\d+)\.(xlsx|xls|csv|parquet)$")
+MOTIF_CLASSEUR = re.compile(r"_groupes_periode\s*(\d+)\.(xlsx|xls)$")
+MOTIF_ROSTER = re.compile(r"_periode\s*(\d+)\.(xlsx|xls|csv)$")
+
+def lister_dossiers_periodes(racine):
+    """
+    Dossiers "<classes>_PériodeX" de l'arborescence (accents et casse ignorés) : {chemin absolu: période}.
+    """
+    dossiers = {}
+    for parent, sous_dossiers, _ in os.walk(os.path.abspath(racine)):
+        for nom in sous_dossiers:
+            m = MOTIF_DOSSIER.search(normalize_str(nom))
+            if m:
+                dossiers[os.path.join(parent, nom)] = int(m.group(1))
+    return dossiers
+
+def empreinte_dossier(dossier):
+    """
+    Empreinte des fichiers d'un dossier (nom, taille, date de modification), sans les lire.
+    """
+    h = hashlib.blake2b(digest_size=16)
+    with os.scandir(dossier) as entrees:
+        for entree in sorted(entrees, key=lambda e: e.name):
+            if entree.is_file() and not entree.name.endswith(".tmp"):
+                infos = entree.stat()
+                h.update(f"{entree.name}\0{infos.st_size}\0{infos.st_mtime_ns}\n".encode('utf-8'))
+    return h.hexdigest()
+
+def _lire_feuilles(chemin):
+    """
+    {nom de feuille: DataFrame} d'un fichier de groupe (.csv / .parquet : une seule feuille).
+    """
+    ext = os.path.splitext(chemin)[1].lower()
+    if ext == ".csv":
+        return {"": pd.read_csv(chemin, encoding='utf-8-sig')}
+    if ext == ".parquet":
+        return {"": pd.read_parquet(chemin)}
+    return pd.read_excel(chemin, sheet_name=None)
+
+def lire_dossier_periode(dossier, periode):
+    """
+    Groupes d'une période lus dans son dossier d'archive : DataFrame Nom, Prenom, Classe, Niveau, Groupe.
+    - Source principale : les fichiers de groupes (<classes>_GroupeX_PériodeY.* ou classeur
+      <classes>_Groupes_PériodeY.xlsx, une feuille "Groupe X" par groupe), jamais retouchés à la main ;
+      les élèves du classeur élèves absents de tous les groupes y figurent avec un groupe vide
+    - À défaut, la colonne "Groupe Période Y" du classeur élèves <classes>_PériodeY.xlsx
+    Renvoie un DataFrame vide si le dossier ne contient ni l'un ni l'autre.
+    """
+    colonnes = ['Nom', 'Prenom', 'Classe', 'Niveau', 'Groupe']
+    morceaux, roster = [], None
+    for nom in os.listdir(dossier):
+        nom_normalise, chemin = normalize_str(nom), os.path.join(dossier, nom)
+        m = MOTIF_GROUPE.search(nom_normalise)
+        if m and int(m.group(2)) == periode:
+            for df in _lire_feuilles(chemin).values():
+                morceaux.append((int(m.group(1)), df))
+            continue
+        m = MOTIF_CLASSEUR.search(nom_normalise)
+        if m and int(m.group(1)) == periode:
+            for feuille, df in _lire_feuilles(chemin).items():
+                numero = re.search(r"(\d+)", str(feuille))
+                if numero:
+                    morceaux.append((int(numero.group(1)), df))
+            continue
+        m = MOTIF_ROSTER.search(nom_normalise)
+        if m and "_groupe" not in nom_normalise and int(m.group(1)) == periode:
+            roster = chemin
+
+    lus = None
+    if roster is not None:
+        df = charger_fichier(roster, cache=False)
+        colonne = next((c for c, p in colonnes_periodes(df).items() if p == periode), None)
+        if colonne is not None:
+            lus = df.assign(Groupe=df[colonne])[colonnes]
+    if morceaux:
+        morceaux.sort(key=lambda morceau: morceau[0])
+        tables = []
+        for groupe, df in morceaux:
+            df = normaliser_colonnes(df)
+            if {'Nom', 'Prenom', 'Classe', 'Niveau'}.issubset(df.columns):
+                tables.append(df.assign(Groupe=groupe)[colonnes].fillna(''))
+        if tables:
+            groupes = pd.concat(tables, ignore_index=True)
+            return groupes if lus is None else _ordre_du_roster(groupes, lus)
+    return lus if lus is not None else pd.DataFrame(columns=colonnes)
+
+def _cles_lignes(df, avec_groupe=True):
+    """
+    Clés (identité normalisée, groupe, occurrence) des lignes, pour rapprocher deux listes des mêmes élèves.
+    """
+    cles = pd.DataFrame({c: normaliser_colonne(df[c]) for c in ('Nom', 'Prenom', 'Classe')})
+    if avec_groupe:
+        cles['Groupe'] = pd.to_numeric(df['Groupe'], errors='coerce').to_numpy()
+    cles['occurrence'] = cles.groupby(list(cles.columns), dropna=False).cumcount().to_numpy()
+    return pd.MultiIndex.from_frame(cles)
+
+def _ordre_du_roster(groupes, roster):
+    """
+    Remet les lignes des fichiers de groupes dans l'ordre du classeur élèves : le rang des homonymes
+    (voir identites) est alors le même que lors de l'enregistrement de la période. Les lignes absentes
+    du classeur (retouché à la main) sont placées à la fin, dans l'ordre des groupes ; les élèves du classeur
+    absents de tous les groupes (retirés à la main) sont gardés à leur place, avec un groupe vide.
+    """
+    positions = _cles_lignes(roster).get_indexer(_cles_lignes(groupes))
+    positions = np.where(positions >= 0, positions, len(roster) + np.arange(len(groupes)))
+    retires = np.flatnonzero(~_cles_lignes(roster, False).isin(_cles_lignes(groupes, False)))
+    lignes = pd.concat([groupes, roster.iloc[retires].assign(Groupe="")], ignore_index=True)
+    positions = np.concatenate([positions, retires])
+    return lignes.iloc[np.argsort(positions, kind='stable')].reset_index(drop=True)
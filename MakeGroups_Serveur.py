@@ -0,0 +1,544 @@
+"""
+Service local MakeGroups V3
+---------------------------
+Serveur HTTP (bibliothèque standard, localhost uniquement) pour que plusieurs postes de l'établissement
+travaillent sur les mêmes fichiers élèves sans tout recharger ni recalculer chacun de leur côté :
+- chargement : les fichiers élèves (et leur historique) restent en mémoire, éviction LRU
+- génération : pool de processus borné ; au-delà de la file d'attente, réponse 503 (réessayer plus tard)
+- édition : les groupes générés sont des brouillons conservés par le serveur, modifiés par déplacements
+- validation : une seule validation à la fois par fichier élèves ; une période déjà enregistrée
+  (par un autre poste, avant ou après la génération du brouillon) est refusée (409) au lieu d'être écrasée
+
+Échanges en JSON (POST avec l'en-tête Content-Type: application/json) :
+    POST /charger                      {"chemin"}
+    POST /generer                      {"chemin", "nb_groupes"?, "repartition"?, "methode"?, "graine"?}
+    GET  /brouillons/<id>
+    POST /brouillons/<id>/deplacer     {"eleves": [id, ...], "destination": numéro de groupe}
+    POST /brouillons/<id>/valider      {"dossier"?, "format"?, "forcer"?}
+    DELETE /brouillons/<id>
+    GET  /etat
+
+Exemples :
+    python MakeGroups_Serveur.py --racine "//serveur/partage/MakeGroups" --historique historique.sqlite
+    python MakeGroups_Serveur.py --port 8765 --processus 2
+"""
+
+import argparse
+import ipaddress
+import json
+import os
+import socket
+import sys
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from MakeGroups import (
+    charger_fichier,
+    compter_niveaux,
+    homonymes,
+    generer_repartition_auto,
+    verifier_coherence_repartition,
+    generer_groupes,
+    optimiser_groupes,
+    detecter_prochaine_periode,
+    extraire_nom_classes,
+    ajouter_groupes_au_df,
+    GroupesAffectes,
+    ModeleGroupes,
+    METHODES_AFFECTATION,
+    FORMATS_EXPORT,
+)
+from MakeGroups_Historique import BaseHistorique
+
+PORT_DEFAUT = 8765
+TAILLE_CACHE_ROSTERS = 16    # fichiers élèves gardés en mémoire
+TAILLE_MAX_BROUILLONS = 64   # brouillons conservés (les plus anciens sont oubliés)
+FILE_ATTENTE = 4             # générations en attente par processus du pool, au-delà : 503
+COLONNES_BROUILLON = ("Nom", "Prenom", "Classe", "Niveau")
+
+class ErreurService(Exception):
+    """
+    Erreur renvoyée au client avec un code HTTP (400 saisie, 404 inconnu, 409 conflit, 415 type de corps,
+    503 surcharge).
+    """
+
+    def __init__(self, statut, message):
+        super().__init__(message)
+        self.statut = statut
+
+# ==============================================================================
+# 0. Fichiers élèves en mémoire (LRU) et verrous par clé
+# ==============================================================================
+
+class VerrousParCle:
+    """
+    Un verrou par clé (chemin de fichier ou de dossier), créé à la première demande.
+    """
+
+    def __init__(self):
+        self._verrous = {}
+        self._garde = threading.Lock()
+
+    def verrou(self, cle):
+        with self._garde:
+            return self._verrous.setdefault(cle, threading.Lock())
+
+class Roster:
+    """
+    Fichier élèves chargé : df tel que lu par charger_fichier, df_historique dont les colonnes
+    "Groupe Période X" sont celles de la base d'historique (ou df lui-même sans base),
+    et signature (taille, date de modification) du fichier au moment du chargement.
+    """
+
+    def __init__(self, chemin, signature, df, df_historique, prochaine_periode):
+        self.chemin = chemin
+        self.signature = signature
+        self.df = df
+        self.df_historique = df_historique
+        self.niveaux = compter_niveaux(df)
+        self.homonymes = homonymes(df)
+        self.prochaine_periode = prochaine_periode
+
+    def description(self):
+        return {
+            "chemin": self.chemin,
+            "eleves": len(self.df),
+            "classes": sorted(str(c) for c in self.df['Classe'].unique()),
+            "niveaux": {str(n): int(e) for n, e in self.niveaux.items()},
+            "nb_groupes_defaut": int(self.df['Classe'].nunique() + 1),
+            "prochaine_periode": self.prochaine_periode,
+            "homonymes": self.homonymes,
+        }
+
+def _signature(chemin):
+    infos = os.stat(chemin)
+    return infos.st_size, infos.st_mtime_ns
+
+class CacheRosters:
+    """
+    Fichiers élèves gardés en mémoire, du plus ancien au plus récemment utilisé (éviction LRU).
+    Un fichier modifié sur le disque depuis son chargement est relu ; deux demandes simultanées
+    du même fichier ne le lisent qu'une fois.
+    """
+
+    def __init__(self, chemin_historique=None, taille_max=TAILLE_CACHE_ROSTERS):
+        self.chemin_historique = chemin_historique
+        self.taille_max = taille_max
+        self._entrees = OrderedDict()
+        self._garde = threading.Lock()
+        self._chargements = VerrousParCle()
+
+    def obtenir(self, chemin):
+        signature = _signature(chemin)
+        with self._chargements.verrou(chemin):
+            with self._garde:
+                roster = self._entrees.get(chemin)
+                if roster is not None and roster.signature == signature:
+                    self._entrees.move_to_end(chemin)
+                    return roster
+            roster = self._charger(chemin, signature)
+            with self._garde:
+                self._entrees[chemin] = roster
+                self._entrees.move_to_end(chemin)
+                while len(self._entrees) > self.taille_max:
+                    self._entrees.popitem(last=False)
+            return roster
+
+    def _charger(self, chemin, signature):
+        df = charger_fichier(chemin)
+        periode = detecter_prochaine_periode(df)
+        if self.chemin_historique is None:
+            return Roster(chemin, signature, df, df, periode)
+        with BaseHistorique(self.chemin_historique) as base:
+            base.importer_fichier(chemin)
+            return Roster(chemin, signature, df, base.vers_df(df), max(periode, base.prochaine_periode(df)))
+
+    def oublier(self, chemin):
+        """
+        Retire un fichier du cache (son historique a changé : période validée).
+        """
+        with self._garde:
+            self._entrees.pop(chemin, None)
+
+    def __len__(self):
+        return len(self._entrees)
+
+# ==============================================================================
+# 1. Génération (pool de processus) et brouillons
+# ==============================================================================
+
+def _generer_affectation(df, nb_groupes, repartition, methode, graine):
+    """
+    Exécutée dans un processus du pool : renvoie (affectation, répétitions) plutôt que les groupes,
+    pour ne pas renvoyer le DataFrame au serveur.
+    """
+    if methode == "optimise":
+        groupes, repetitions = optimiser_groupes(df, nb_groupes, repartition, seed=graine, nb_processus=1,
+                                                 avec_repetitions=True)
+    else:
+        groupes, repetitions = generer_groupes(df, nb_groupes, repartition, methode=methode,
+                                               avec_repetitions=True, seed=graine)
+    return groupes.affectation, repetitions
+
+class Brouillon:
+    """
+    Groupes générés en attente de validation : modèle éditable (voir ModeleGroupes) sur le fichier
+    élèves tel qu'il était à la génération. Un verrou par brouillon sérialise ses modifications.
+    """
+
+    def __init__(self, roster, modele, periode, repetitions, graine, methode):
+        self.id = uuid.uuid4().hex
+        self.roster = roster
+        self.modele = modele
+        self.periode = periode
+        self.repetitions = repetitions
+        self.graine = graine
+        self.methode = methode
+        self.verrou = threading.Lock()
+
+    def description(self):
+        modele = self.modele
+        return {
+            "brouillon": self.id,
+            "chemin": self.roster.chemin,
+            "periode": self.periode,
+            "methode": self.methode,
+            "graine": self.graine,
+            "repetitions": self.repetitions,
+            "effectifs": modele.effectifs(),
+            "groupes": [
+                [dict(zip(["id"] + modele.colonnes, [pos] + modele.ligne(pos))) for pos in membres]
+                for membres in modele.membres
+            ],
+        }
+
+class ServiceGroupes:
+    """
+    Opérations du service, indépendantes du transport HTTP (voir Gestionnaire).
+    racine : seuls les fichiers et dossiers situés sous ce dossier sont accessibles.
+    """
+
+    def __init__(self, racine, chemin_historique=None, nb_processus=None, taille_cache=TAILLE_CACHE_ROSTERS):
+        self.racine = os.path.realpath(racine)
+        self.chemin_historique = chemin_historique
+        self.rosters = CacheRosters(chemin_historique, taille_cache)
+        self.nb_processus = nb_processus or os.cpu_count() or 1
+        self.pool = ProcessPoolExecutor(max_workers=self.nb_processus)
+        self.places = threading.BoundedSemaphore(self.nb_processus * (1 + FILE_ATTENTE))
+        self.brouillons = OrderedDict()
+        self._garde = threading.Lock()
+        self.validations = VerrousParCle()
+
+    def fermer(self):
+        self.pool.shutdown(cancel_futures=True)
+
+    def _chemin(self, chemin, doit_exister=True):
+        """
+        Chemin absolu vérifié : sous la racine du service (et existant, pour un fichier à lire).
+        """
+        if not isinstance(chemin, str) or not chemin:
+            raise ErreurService(400, "Chemin manquant")
+        absolu = os.path.realpath(os.path.join(self.racine, chemin))
+        if os.path.commonpath([absolu, self.racine]) != self.racine:
+            raise ErreurService(400, f"Chemin hors du dossier du service : {chemin}")
+        if doit_exister and not os.path.exists(absolu):
+            raise ErreurService(404, f"Fichier introuvable : {chemin}")
+        return absolu
+
+    # ==========================================================================
+    # Opérations
+    # ==========================================================================
+
+    def charger(self, chemin):
+        return self.rosters.obtenir(self._chemin(chemin)).description()
+
+    def generer(self, chemin, nb_groupes=None, repartition=None, methode="glouton", graine=None):
+        roster = self.rosters.obtenir(self._chemin(chemin))
+        if methode not in tuple(METHODES_AFFECTATION) + ("optimise",):
+            raise ErreurService(400, f"Méthode inconnue : {methode}")
+        nb_groupes = int(nb_groupes or roster.df['Classe'].nunique() + 1)
+        if repartition is None:
+            repartition = generer_repartition_auto(roster.df, nb_groupes)
+        else:
+            if not isinstance(repartition, dict):
+                raise ErreurService(400, "repartition : objet {niveau: [effectif par groupe]} attendu")
+            # Clés JSON (texte) ramenées aux niveaux du fichier
+            par_texte = {str(n): n for n in roster.niveaux}
+            inconnus = [n for n in repartition if n not in par_texte]
+            if inconnus:
+                raise ErreurService(400, f"Niveau(x) inconnu(s) : {', '.join(inconnus)}")
+            repartition = {par_texte[n]: [int(v) for v in valeurs] for n, valeurs in repartition.items()}
+            verifier_coherence_repartition(repartition, roster.niveaux, nb_groupes)
+        graine = None if graine is None else int(graine)
+
+        if not self.places.acquire(blocking=False):
+            raise ErreurService(503, "Service occupé : trop de générations en cours, réessayez dans un instant")
+        try:
+            future = self.pool.submit(_generer_affectation, roster.df_historique, nb_groupes, repartition,
+                                      methode, graine)
+            affectation, repetitions = future.result()
+        finally:
+            self.places.release()
+
+        groupes = GroupesAffectes(roster.df, affectation, nb_groupes)
+        brouillon = Brouillon(roster, ModeleGroupes(roster.df, groupes, COLONNES_BROUILLON),
+                              roster.prochaine_periode, int(repetitions), graine, methode)
+        with self._garde:
+            self.brouillons[brouillon.id] = brouillon
+            while len(self.brouillons) > TAILLE_MAX_BROUILLONS:
+                self.brouillons.popitem(last=False)
+        return brouillon.description()
+
+    def brouillon(self, identifiant):
+        with self._garde:
+            brouillon = self.brouillons.get(identifiant)
+            if brouillon is None:
+                raise ErreurService(404, f"Brouillon inconnu ou expiré : {identifiant}")
+            self.brouillons.move_to_end(identifiant)
+            return brouillon
+
+    def lire_brouillon(self, identifiant):
+        brouillon = self.brouillon(identifiant)
+        with brouillon.verrou:
+            return brouillon.description()
+
+    def deplacer(self, identifiant, eleves, destination):
+        """
+        Déplace des élèves (identifiants donnés par le brouillon) vers le groupe destination (numéro 1..N).
+        """
+        brouillon = self.brouillon(identifiant)
+        with brouillon.verrou:
+            modele = brouillon.modele
+            dest = int(destination) - 1
+            if not 0 <= dest < len(modele):
+                raise ErreurService(400, f"Groupe inconnu : {destination}")
+            groupe_de = {pos: g for g, membres in enumerate(modele.membres) for pos in membres}
+            inconnus = [e for e in eleves if e not in groupe_de]
+            if inconnus:
+                raise ErreurService(400, f"Élève(s) inconnu(s) ou non placé(s) : {inconnus}")
+            for pos in eleves:
+                src = groupe_de[pos]
+                if src != dest:
+                    modele.deplacer(src, modele.membres[src].index(pos), dest)
+                    groupe_de[pos] = dest
+            return brouillon.description()
+
+    def supprimer(self, identifiant):
+        with self._garde:
+            if self.brouillons.pop(identifiant, None) is None:
+                raise ErreurService(404, f"Brouillon inconnu ou expiré : {identifiant}")
+        return {"supprime": identifiant}
+
+    def valider(self, identifiant, dossier=None, format="xlsx", forcer=False):
+        """
+        Enregistre le brouillon comme la période suivante du fichier élèves (voir ajouter_groupes_au_df,
+        qui écrit le fichier élèves et les groupes en une passe). Les validations d'un même fichier élèves
+        passent l'une après l'autre ; sans forcer, une période déjà enregistrée n'est pas écrasée.
+        """
+        if format not in FORMATS_EXPORT:
+            raise ErreurService(400, f"Format d'export non pris en charge : {format}")
+        brouillon = self.brouillon(identifiant)
+        roster = brouillon.roster
+        dossier_parent = (os.path.dirname(roster.chemin) if dossier is None
+                          else self._chemin(dossier, doit_exister=False))
+        nom_classes = extraire_nom_classes(roster.df)
+        periode = brouillon.periode
+        nom_periode = f"{nom_classes}_Période{periode}"
+        fichier_eleves = os.path.join(dossier_parent, nom_periode, f"{nom_periode}.xlsx")
+
+        with self.validations.verrou(os.path.normcase(roster.chemin)), brouillon.verrou:
+            if not forcer and os.path.exists(fichier_eleves):
+                raise ErreurService(409, f"La période {periode} est déjà enregistrée : {fichier_eleves}")
+            base = BaseHistorique(self.chemin_historique) if self.chemin_historique else None
+            try:
+                if base is not None and not forcer and base.prochaine_periode(roster.df) > periode:
+                    raise ErreurService(409, f"La période {periode} est déjà dans l'historique : "
+                                             f"régénérez les groupes à partir du fichier à jour")
+                # Copie : le DataFrame en cache reste celui du fichier sur le disque
+                df = roster.df.copy()
+                edites = brouillon.modele.groupes()
+                groupes = GroupesAffectes(df, edites.affectation, len(edites), edites.ordre)
+                dossier_periode, nom_classes, periode = ajouter_groupes_au_df(
+                    df, groupes, roster.chemin, dossier_parent, base_historique=base, periode=periode,
+                    format=format,
+                )
+                ecrits = sorted(os.path.join(dossier_periode, nom) for nom in os.listdir(dossier_periode)
+                                if not nom.startswith("."))
+            finally:
+                if base is not None:
+                    base.fermer()
+        self.rosters.oublier(roster.chemin)
+        with self._garde:
+            self.brouillons.pop(identifiant, None)
+        return {"dossier": dossier_periode, "periode": periode, "fichiers": ecrits}
+
+    def etat(self):
+        with self._garde:
+            nb_brouillons = len(self.brouillons)
+        return {
+            "racine": self.racine,
+            "historique": self.chemin_historique,
+            "processus": self.nb_processus,
+            "rosters_en_memoire": len(self.rosters),
+            "brouillons": nb_brouillons,
+        }
+
+# ==============================================================================
+# 2. Transport HTTP (JSON)
+# ==============================================================================
+
+def _json_defaut(valeur):
+    if isinstance(valeur, np.integer):
+        return int(valeur)
+    if isinstance(valeur, np.floating):
+        return float(valeur)
+    if isinstance(valeur, np.bool_):
+        return bool(valeur)
+    return str(valeur)
+
+HOTES_LOCAUX = ("127.0.0.1", "localhost", "[::1]")
+
+def _nom_hote(entete):
+    """
+    Nom d'hôte d'un en-tête Host, sans le port ("[::1]:8765" -> "[::1]", "localhost:8765" -> "localhost").
+    """
+    if entete.startswith("["):
+        return entete.split("]")[0] + "]"
+    return entete.rsplit(":", 1)[0]
+
+class Gestionnaire(BaseHTTPRequestHandler):
+    """
+    Traduit les requêtes HTTP en appels au ServiceGroupes du serveur (self.server.service).
+    """
+    server_version = "MakeGroups"
+
+    def log_message(self, format, *args):
+        if self.server.verbeux:
+            super().log_message(format, *args)
+
+    def _repondre(self, statut, contenu):
+        corps = json.dumps(contenu, ensure_ascii=False, default=_json_defaut).encode('utf-8')
+        self.send_response(statut)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(corps)))
+        self.end_headers()
+        self.wfile.write(corps)
+
+    def _corps(self):
+        # Un navigateur n'envoie ce type d'une autre origine qu'après une requête préalable (CORS),
+        # que le service ne valide pas : une page web ne peut donc pas poster à sa place
+        type_contenu = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if type_contenu != "application/json":
+            raise ErreurService(415, "Corps de requête attendu en JSON (Content-Type: application/json)")
+        longueur = int(self.headers.get("Content-Length") or 0)
+        if not longueur:
+            return {}
+        try:
+            corps = json.loads(self.rfile.read(longueur).decode('utf-8'))
+        except ValueError as e:
+            raise ErreurService(400, f"JSON invalide : {e}")
+        if not isinstance(corps, dict):
+            raise ErreurService(400, "Le corps de la requête doit être un objet JSON")
+        return corps
+
+    def _traiter(self, methode):
+        try:
+            # Protection contre les pages web qui viseraient le service via un autre nom d'hôte
+            if _nom_hote(self.headers.get("Host") or "") not in HOTES_LOCAUX:
+                raise ErreurService(403, "Service réservé aux connexions locales")
+            service = self.server.service
+            parties = [p for p in self.path.split("?")[0].split("/") if p]
+            corps = self._corps() if methode == "POST" else {}
+            if methode == "GET" and parties == ["etat"]:
+                resultat = service.etat()
+            elif methode == "POST" and parties == ["charger"]:
+                resultat = service.charger(corps.get("chemin"))
+            elif methode == "POST" and parties == ["generer"]:
+                resultat = service.generer(corps.get("chemin"), corps.get("nb_groupes"), corps.get("repartition"),
+                                           corps.get("methode", "glouton"), corps.get("graine"))
+            elif len(parties) == 2 and parties[0] == "brouillons" and methode == "GET":
+                resultat = service.lire_brouillon(parties[1])
+            elif len(parties) == 2 and parties[0] == "brouillons" and methode == "DELETE":
+                resultat = service.supprimer(parties[1])
+            elif len(parties) == 3 and parties[0] == "brouillons" and methode == "POST" and parties[2] == "deplacer":
+                resultat = service.deplacer(parties[1], corps.get("eleves", []), corps.get("destination"))
+            elif len(parties) == 3 and parties[0] == "brouillons" and methode == "POST" and parties[2] == "valider":
+                resultat = service.valider(parties[1], corps.get("dossier"), corps.get("format", "xlsx"),
+                                           bool(corps.get("forcer", False)))
+            else:
+                raise ErreurService(404, f"Opération inconnue : {methode} {self.path}")
+        except ErreurService as e:
+            self._repondre(e.statut, {"erreur": str(e)})
+        except (ValueError, TypeError) as e:
+            self._repondre(400, {"erreur": str(e)})
+        except Exception as e:
+            self._repondre(500, {"erreur": f"{type(e).__name__} : {e}"})
+        else:
+            self._repondre(200, resultat)
+
+    def do_GET(self):
+        self._traiter("GET")
+
+    def do_POST(self):
+        self._traiter("POST")
+
+    def do_DELETE(self):
+        self._traiter("DELETE")
+
+class ServeurIPv6(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+def creer_serveur(service, hote="127.0.0.1", port=PORT_DEFAUT, verbeux=False):
+    """
+    Serveur HTTP (un thread par requête) du service, limité à une adresse locale.
+    """
+    if not ipaddress.ip_address(hote).is_loopback:
+        raise ValueError(f"Le service n'écoute que sur une adresse locale (127.0.0.1 ou ::1) : {hote}")
+    classe = ServeurIPv6 if ":" in hote else ThreadingHTTPServer
+    serveur = classe((hote, port), Gestionnaire)
+    serveur.daemon_threads = True
+    serveur.service = service
+    serveur.verbeux = verbeux
+    return serveur
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Service local (HTTP, localhost) de génération et d'édition des groupes, partagé entre postes."
+    )
+    parser.add_argument("--racine", default=".",
+                        help="dossier des fichiers élèves accessibles par le service (défaut : dossier courant)")
+    parser.add_argument("--historique", default=None,
+                        help="base SQLite d'historique à utiliser et compléter (créée si absente)")
+    parser.add_argument("--hote", default="127.0.0.1", help="adresse locale d'écoute (défaut : 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT_DEFAUT, help=f"port d'écoute (défaut : {PORT_DEFAUT})")
+    parser.add_argument("--processus", type=int, default=None,
+                        help="processus de génération (défaut : nombre de cœurs)")
+    parser.add_argument("--cache", type=int, default=TAILLE_CACHE_ROSTERS,
+                        help=f"fichiers élèves gardés en mémoire (défaut : {TAILLE_CACHE_ROSTERS})")
+    parser.add_argument("--verbeux", action="store_true", help="affiche chaque requête")
+    args = parser.parse_args(argv)
+
+    service = ServiceGroupes(args.racine, args.historique, args.processus, args.cache)
+    try:
+        serveur = creer_serveur(service, args.hote, args.port, args.verbeux)
+    except (ValueError, OSError) as e:
+        service.fermer()
+        print(f"✘ {e}", file=sys.stderr)
+        return 1
+    print(f"Service MakeGroups sur http://{args.hote}:{args.port} (dossier : {service.racine}) — Ctrl+C pour arrêter")
+    try:
+        serveur.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        serveur.server_close()
+        service.fermer()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+"""
+Instrumentation MakeGroups V3
+-----------------------------
+Mesure facultative des étapes du backend (décorateur @tracer sur les fonctions publiques de MakeGroups.py) :
+- temps réel, nombre de lignes en entrée et en sortie, pic mémoire (tracemalloc) par étape
+- export en JSON lines ou au format Chrome trace (chrome://tracing, https://ui.perfetto.dev)
+Désactivée par défaut : un appel instrumenté ne coûte alors qu'un test de booléen.
+Peut aussi être activée au lancement avec la variable d'environnement MAKEGROUPS_TRACE=1.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+
+_actif = False
+_memoire = False
+_evenements = []
+_verrou = threading.Lock()
+_pile = threading.local()   # étapes en cours, par thread (pour l'imbrication et le pic mémoire)
+_origine = time.perf_counter()
+
+# ==============================================================================
+# 0. Activation
+# ==============================================================================
+
+def activer_trace(memoire=True):
+    """
+    Active l'enregistrement des étapes. Avec memoire=True, le pic mémoire de chaque étape
+    est mesuré par tracemalloc (plus coûteux : à réserver au diagnostic).
+    """
+    global _actif, _memoire
+    _memoire = memoire
+    if memoire and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _actif = True
+
+def desactiver_trace():
+    """
+    Désactive l'enregistrement (les événements déjà enregistrés sont conservés).
+    """
+    global _actif
+    _actif = False
+    if _memoire and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def trace_active():
+    return _actif
+
+def reinitialiser_trace():
+    """
+    Oublie les événements enregistrés : la prochaine lecture ne porte que sur la nouvelle exécution.
+    """
+    with _verrou:
+        _evenements.clear()
+
+def evenements_trace():
+    """
+    Copie des événements enregistrés, dans l'ordre de fin des étapes. Chaque événement est un dict :
+    etape, debut et duree (secondes), profondeur, thread, lignes_entree, lignes_sortie, pic_memoire (octets ou None).
+    """
+    with _verrou:
+        return list(_evenements)
+
+# ==============================================================================
+# 1. Décorateur
+# ==============================================================================
+
+def _compter_lignes(valeur, profondeur=0):
+    """
+    Nombre de lignes d'un DataFrame ou d'un tableau numpy, nombre d'élèves de groupes compacts
+    (attribut nb_eleves), ou total des DataFrames d'une liste/tuple (ex : liste de groupes).
+    """
+    if hasattr(valeur, "columns") and hasattr(valeur, "__len__"):
+        return len(valeur)
+    if hasattr(valeur, "nb_eleves"):
+        return valeur.nb_eleves
+    if getattr(valeur, "ndim", 0) >= 1:
+        return valeur.shape[0]
+    if isinstance(valeur, (list, tuple)) and profondeur < 2:
+        comptes = [_compter_lignes(v, profondeur + 1) for v in valeur]
+        comptes = [c for c in comptes if c is not None]
+        return sum(comptes) if comptes else None
+    return None
+
+def tracer(fonction):
+    """
+    Décorateur d'étape : enregistre un événement par appel quand la trace est active.
+    """
+    @functools.wraps(fonction)
+    def enveloppe(*args, **kwargs):
+        if not _actif:
+            return fonction(*args, **kwargs)
+        pile = getattr(_pile, "etapes", None)
+        if pile is None:
+            pile = _pile.etapes = []
+        memoire = _memoire and tracemalloc.is_tracing()
+        if memoire:
+            # Le pic courant revient à l'étape parente ; on repart de zéro pour celle-ci
+            pic = tracemalloc.get_traced_memory()[1]
+            if pile:
+                pile[-1] = max(pile[-1], pic)
+            tracemalloc.reset_peak()
+        pile.append(0)
+        debut = time.perf_counter()
+        try:
+            resultat = fonction(*args, **kwargs)
+        finally:
+            duree = time.perf_counter() - debut
+            pic = max(pile.pop(), tracemalloc.get_traced_memory()[1]) if memoire else None
+            if memoire and pile:
+                pile[-1] = max(pile[-1], pic)
+        lignes_entree = next((n for n in map(_compter_lignes, args[:1]) if n is not None), None)
+        evenement = {
+            "etape": fonction.__name__,
+            "debut": debut - _origine,
+            "duree": duree,
+            "profondeur": len(pile),
+            "thread": threading.get_ident(),
+            "lignes_entree": lignes_entree,
+            "lignes_sortie": _compter_lignes(resultat),
+            "pic_memoire": pic,
+        }
+        with _verrou:
+            _evenements.append(evenement)
+        return resultat
+    return enveloppe
+
+# ==============================================================================
+# 2. Export
+# ==============================================================================
+
+def exporter_trace(chemin, format="jsonl", evenements=None):
+    """
+    Écrit les événements (par défaut, ceux enregistrés) :
+    - "jsonl" : un objet JSON par ligne
+    - "chrome" : format Chrome trace (événements complets "X", temps en microsecondes)
+    """
+    evenements = evenements_trace() if evenements is None else evenements
+    if format == "jsonl":
+        with open(chemin, "w", encoding="utf-8") as f:
+            for evenement in evenements:
+                f.write(json.dumps(evenement, ensure_ascii=False) + "\n")
+    elif format == "chrome":
+        trace = [
+            {
+                "name": e["etape"],
+                "ph": "X",
+                "ts": e["debut"] * 1e6,
+                "dur": e["duree"] * 1e6,
+                "pid": e.get("pid", os.getpid()),
+                "tid": e["thread"],
+                "args": {k: e[k] for k in ("lignes_entree", "lignes_sortie", "pic_memoire") if e.get(k) is not None},
+            }
+            for e in evenements
+        ]
+        with open(chemin, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    else:
+        raise ValueError(f"Format de trace non pris en charge : {format}\nFormats acceptés : jsonl, chrome")
+
+if os.environ.get("MAKEGROUPS_TRACE"):
+    activer_trace()
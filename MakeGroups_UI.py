@@ -4,26 +4,162 @@ Interface graphique MakeGroups V3
 - UI moderne avec logo cliquable.
 - Fonctionne avec le backend MakeGroups.py.
 - Résumé rapide, aide utilisateur, pop-ups, etc.
+- Démarrage rapide : pandas (via MakeGroups), PIL et tksheet ne sont importés qu'au premier besoin,
+  les logos sont lus depuis des miniatures déjà redimensionnées.
 """
 
+import time
+_DEBUT = time.perf_counter()  # mesure du temps d'apparition de la fenêtre
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk
-from tksheet import Sheet
 import webbrowser
+import hashlib
 import os
-import pandas as pd
-from MakeGroups import (
-    charger_fichier,
-    compter_niveaux,
-    generer_repartition_auto,
-    generer_groupes,
-    ajouter_groupes_au_df,
-    sauvegarder_groupes,
-    verifier_coherence_repartition,
-    extraire_nom_classes,
+import random
+import multiprocessing
+import threading
+import queue
+from MakeGroups_Trace import (
+    activer_trace,
+    desactiver_trace,
+    trace_active,
+    reinitialiser_trace,
+    evenements_trace,
 )
 
+# Méthodes d'affectation proposées : libellé affiché -> méthode du backend
+METHODES = {
+    "Aléatoire (rapide)": "glouton",
+    "Optimale (minimum de répétitions)": "optimal",
+    "Optimisée (répétitions + mixité des classes)": "optimise",
+    "Planifiée (tour complet des groupes)": "planifie",
+}
+
+DOSSIER_MINIATURES = os.path.join(os.path.expanduser("~"), ".makegroups", "miniatures")
+TAILLE_LOGO = (360, 360)
+
+# ==============================================================================
+# Logos : miniatures redimensionnées une seule fois
+# ==============================================================================
+
+def miniature_logo(source, taille=TAILLE_LOGO):
+    """
+    Chemin d'une miniature PNG de l'image source, à la taille demandée.
+    La miniature est conservée dans DOSSIER_MINIATURES sous une clé (taille et empreinte du contenu
+    de la source) : elle n'est recalculée, avec PIL, que si l'image source change.
+    L'empreinte ne dépend pas de la date de modification, qui change à chaque lancement
+    de l'exécutable PyInstaller (fichiers extraits dans un dossier temporaire).
+    """
+    with open(source, "rb") as f:
+        empreinte = hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+    nom = os.path.splitext(os.path.basename(source))[0]
+    chemin = os.path.join(DOSSIER_MINIATURES, f"{nom}_{taille[0]}x{taille[1]}_{empreinte}.png")
+    if os.path.exists(chemin):
+        return chemin
+
+    from PIL import Image
+    os.makedirs(DOSSIER_MINIATURES, exist_ok=True)
+    temporaire = f"{chemin}.{os.getpid()}.tmp"
+    Image.open(source).resize(taille, Image.Resampling.LANCZOS).save(temporaire, format="PNG")
+    os.replace(temporaire, chemin)
+    # Les miniatures d'une ancienne version de la même image ne servent plus
+    for ancien in os.listdir(DOSSIER_MINIATURES):
+        if ancien.startswith(f"{nom}_{taille[0]}x{taille[1]}_") and ancien != os.path.basename(chemin):
+            try:
+                os.remove(os.path.join(DOSSIER_MINIATURES, ancien))
+            except OSError:
+                pass
+    return chemin
+
+# ==============================================================================
+# Tâche de fond : calcul dans un thread, progression et annulation dans Tk
+# ==============================================================================
+
+class TacheDeFond(tk.Toplevel):
+    """
+    Fenêtre de progression modale qui exécute travail(rapport) dans un thread.
+    - rapport(libelle, fraction=None, annulable=True) : appelé par le thread pour signaler l'étape en cours ;
+      lève OperationAnnulee si l'utilisateur a demandé l'annulation (et que l'étape est annulable)
+    - Le thread ne touche jamais à Tk : il dépose ses messages dans une file, lue ici par after()
+    - À la fin, on_succes(resultat) ou on_erreur(exception) est appelé dans le thread de Tk ; un résultat
+      obtenu après une demande d'annulation pendant une étape annulable (ex : lecture d'un fichier, qui ne
+      s'interrompt pas) est abandonné
+    """
+
+    def __init__(self, parent, titre, travail, on_succes, on_erreur):
+        super().__init__(parent)
+        self.title(titre)
+        self.configure(bg="#F7F9FA")
+        self.resizable(False, False)
+        self.transient(parent)
+        self.protocol("WM_DELETE_WINDOW", self.annuler)
+        self.on_succes = on_succes
+        self.on_erreur = on_erreur
+        self.messages = queue.Queue()
+        self.annulation = threading.Event()
+        self.etape_annulable = True  # étape en cours, mise à jour par rapport() depuis le thread
+
+        self.libelle = ttk.Label(self, text=titre, background="#F7F9FA", width=50)
+        self.libelle.pack(padx=20, pady=(18, 8))
+        self.barre = ttk.Progressbar(self, mode="determinate", maximum=1.0, length=380)
+        self.barre.pack(padx=20, pady=4)
+        self.btn_annuler = ttk.Button(self, text="Annuler", command=self.annuler)
+        self.btn_annuler.pack(pady=(8, 16))
+        try:
+            self.grab_set()  # fenêtre modale : pas de double clic pendant le calcul
+        except tk.TclError:
+            pass  # fenêtre pas encore affichée (certains gestionnaires de fenêtres)
+
+        threading.Thread(target=self._executer, args=(travail,), daemon=True).start()
+        self.after(50, self._sonder)
+
+    def rapport(self, libelle, fraction=None, annulable=True):
+        self.etape_annulable = annulable
+        if annulable and self.annulation.is_set():
+            from MakeGroups import OperationAnnulee
+            raise OperationAnnulee()
+        self.messages.put(("progression", libelle, fraction, annulable))
+
+    def annuler(self):
+        if str(self.btn_annuler["state"]) != "disabled":
+            self.annulation.set()
+            self.libelle.configure(text="Annulation en cours…")
+
+    def _executer(self, travail):
+        try:
+            self.messages.put(("fin", travail(self.rapport)))
+        except BaseException as e:
+            self.messages.put(("erreur", e))
+
+    def _sonder(self):
+        try:
+            while True:
+                message = self.messages.get_nowait()
+                if message[0] == "progression":
+                    _, libelle, fraction, annulable = message
+                    self.libelle.configure(text=libelle)
+                    if fraction is None:
+                        self.barre.configure(mode="indeterminate")
+                        self.barre.start(15)
+                    else:
+                        self.barre.stop()
+                        self.barre.configure(mode="determinate", value=fraction)
+                    self.btn_annuler.configure(state="normal" if annulable else "disabled")
+                else:
+                    self.grab_release()
+                    self.destroy()
+                    if message[0] == "fin":
+                        if not (self.annulation.is_set() and self.etape_annulable):
+                            self.on_succes(message[1])
+                    elif not self.annulation.is_set():
+                        # Après une demande d'annulation, l'arrêt (OperationAnnulee) n'est pas une erreur
+                        self.on_erreur(message[1])
+                    return
+        except queue.Empty:
+            pass
+        self.after(50, self._sonder)
+
 # ==============================================================================
 # Classe principale de l'application
 # ==============================================================================
@@ -41,12 +177,20 @@ class Application(tk.Tk):
         self.df = None
         self.chemin_fichier = ""
         self.niveaux = {}
+        self.homonymes = []
         self.nb_groupes = 0
         self.entrees = {}            # {niveau: [Entry, ...]}
+        self.histo = None            # matrice d'historique du fichier chargé (analyse de la saisie)
+        self.label_analyse = None
+        self._analyse_prevue = None
         self.logo_frame = None
         self.resume_label = None
         self.frame_saisie = None
         self.frame_boutons = None
+        self.methode_var = tk.StringVar(value=next(iter(METHODES)))
+        self.trace_var = tk.BooleanVar(value=trace_active())
+        self.graine_var = tk.StringVar()  # même graine et mêmes entrées = mêmes groupes (relus sans recalcul)
+        self.temps_demarrage = None  # secondes entre le lancement et l'affichage de la fenêtre
 
         # Style global
         self.style = ttk.Style()
@@ -56,6 +200,12 @@ class Application(tk.Tk):
         self.style.configure("Title.TLabel", font=("Segoe UI", 15, "bold"), background="#F7F9FA")
 
         self.init_ui()
+        self.bind("<Map>", self._fenetre_affichee, add="+")
+
+    def _fenetre_affichee(self, event):
+        if event.widget is not self or self.temps_demarrage is not None:
+            return
+        self.temps_demarrage = time.perf_counter() - _DEBUT
 
     # ==========================================================================
     # Initialisation interface : header/logo/bouton ouverture fichier
@@ -72,6 +222,13 @@ class Application(tk.Tk):
         btn_ouvrir = ttk.Button(self, text="Ouvrir un fichier élèves (CSV/Excel)", command=self.ouvrir_fichier_eleves)
         btn_ouvrir.pack(pady=25)
 
+        # Diagnostic : mesure facultative des temps de chaque étape du backend
+        frame_trace = tk.Frame(self, bg="#F7F9FA")
+        frame_trace.pack(side="bottom", anchor="e", padx=20, pady=10)
+        ttk.Checkbutton(frame_trace, text="Mesurer les temps d'exécution", variable=self.trace_var,
+                        command=self.basculer_trace).pack(side="left", padx=6)
+        ttk.Button(frame_trace, text="⏱ Temps de la dernière exécution", command=self.afficher_temps).pack(side="left", padx=6)
+
     def afficher_logo(self):
         for widget in self.logo_frame.winfo_children():
             widget.destroy()
@@ -79,10 +236,9 @@ class Application(tk.Tk):
             script_dir = os.path.dirname(os.path.abspath(__file__))
             logo_labo_path = os.path.join(script_dir, "logo_labo.png")
             logo_college_path = os.path.join(script_dir, "logo_college.png")
-            img_labo = Image.open(logo_labo_path).resize((360, 360), Image.Resampling.LANCZOS)
-            img_college = Image.open(logo_college_path).resize((360, 360), Image.Resampling.LANCZOS)
-            self.logo_labo_image = ImageTk.PhotoImage(img_labo)
-            self.logo_college_image = ImageTk.PhotoImage(img_college)
+            # Tk lit directement les PNG : PIL n'est chargé que pour (re)créer une miniature
+            self.logo_labo_image = tk.PhotoImage(file=miniature_logo(logo_labo_path))
+            self.logo_college_image = tk.PhotoImage(file=miniature_logo(logo_college_path))
             logo_labo_label = tk.Label(self.logo_frame, image=self.logo_labo_image, bg="#F7F9FA", cursor="hand2")
             logo_college_label = tk.Label(self.logo_frame, image=self.logo_college_image, bg="#F7F9FA", cursor="hand2")
         except Exception as e:
@@ -107,16 +263,32 @@ class Application(tk.Tk):
         )
         if not chemin:
             return
-        try:
-            self.df = charger_fichier(chemin)
-            self.chemin_fichier = chemin
-            self.niveaux = compter_niveaux(self.df)
-            self.nb_classes = len(self.df['Classe'].unique())
-            self.nb_groupes = self.nb_classes + 1
-            self.afficher_resume()
-            self.afficher_champs_repartition()
-        except Exception as e:
-            self.afficher_message("Erreur lors du chargement du fichier", str(e), type="error")
+        reinitialiser_trace()
+
+        def travail(rapport):
+            rapport(f"Lecture de {os.path.basename(chemin)}…")
+            # Premier import du backend (et de pandas) dans le thread : la fenêtre reste réactive
+            from MakeGroups import charger_fichier
+            return charger_fichier(chemin)
+
+        def succes(df):
+            from MakeGroups import compter_niveaux, homonymes
+            try:
+                self.df = df
+                self.chemin_fichier = chemin
+                self.niveaux = compter_niveaux(self.df)
+                self.homonymes = homonymes(self.df)
+                self.nb_classes = len(self.df['Classe'].unique())
+                self.nb_groupes = self.nb_classes + 1
+                self.histo = None
+                self.graine_var.set(str(random.randrange(10 ** 6)))
+                self.afficher_resume()
+                self.afficher_champs_repartition()
+            except Exception as e:
+                self.afficher_message("Erreur lors du chargement du fichier", str(e), type="error")
+
+        TacheDeFond(self, "Chargement du fichier élèves", travail, succes,
+                    lambda e: self.afficher_message("Erreur lors du chargement du fichier", str(e), type="error"))
 
     # ==========================================================================
     # Affichage du résumé
@@ -136,6 +308,9 @@ class Application(tk.Tk):
                 resume += f"{niveau} ({eff} élèves), "
             resume = resume.rstrip(", ") + "\n"
             resume += f"🧩 Nombre de groupes à créer : {self.nb_groupes}\n"
+            if self.homonymes:
+                resume += (f"⚠️ Homonymes (distingués par leur ordre dans le fichier, à conserver) : "
+                           f"{', '.join(self.homonymes)}\n")
         self.resume_label = tk.Label(self, text=resume, bg="#F7F9FA", font=("Segoe UI", 11), justify="left", anchor="w")
         self.resume_label.pack(pady=(0, 12), fill="x", padx=40)
 
@@ -169,50 +344,132 @@ class Application(tk.Tk):
             for col in range(self.nb_groupes - 1):
                 entry = ttk.Entry(table, width=5, font=("Segoe UI", 11))
                 entry.grid(row=row, column=col + 1, padx=3)
+                entry.bind("<KeyRelease>", self.planifier_analyse)
                 self.entrees[niveau].append(entry)
             lbl_last = ttk.Label(table, text="(auto)", font=("Segoe UI", 10, "italic"), foreground="#888")
             lbl_last.grid(row=row, column=self.nb_groupes, padx=4)
 
+        self.label_analyse = tk.Label(self.frame_saisie, bg="#F7F9FA", font=("Segoe UI", 10), justify="left")
+        self.label_analyse.pack(pady=(8, 0))
+        self.analyser_saisie()
+
         if self.frame_boutons:
             self.frame_boutons.destroy()
         self.frame_boutons = tk.Frame(self, bg="#F7F9FA")
         self.frame_boutons.pack(pady=(18, 8))
+        ttk.Label(self.frame_boutons, text="Méthode :", background="#F7F9FA").pack(side="left", padx=(10, 4))
+        choix_methode = ttk.Combobox(self.frame_boutons, textvariable=self.methode_var, values=list(METHODES),
+                                     state="readonly", width=32, font=("Segoe UI", 11))
+        choix_methode.pack(side="left", padx=(0, 10))
+        ttk.Label(self.frame_boutons, text="Graine :", background="#F7F9FA").pack(side="left", padx=(10, 4))
+        ttk.Entry(self.frame_boutons, textvariable=self.graine_var, width=9, font=("Segoe UI", 11)).pack(side="left")
         btn_recap = ttk.Button(self.frame_boutons, text="Récapitulatif", command=self.afficher_recapitulatif)
         btn_recap.pack(side="left", padx=10)
+        ttk.Button(self.frame_boutons, text="📊 Statistiques", command=self.afficher_statistiques).pack(side="left")
 
     # ==========================================================================
     # Affichage du récapitulatif, édition des groupes
     # ==========================================================================
 
-    def afficher_recapitulatif(self):
+    def lire_repartition(self):
+        """
+        Répartition selon la saisie : automatique si toutes les cases sont vides ; sinon les cases vides
+        d'un niveau se partagent le reste de ses élèves (la dernière colonne complète le total).
+        Lève ValueError pour une saisie incohérente.
+        """
+        from MakeGroups import generer_repartition_auto, verifier_coherence_repartition
+        if all(all(not entry.get().strip() for entry in entrees) for entrees in self.entrees.values()):
+            return generer_repartition_auto(self.df, self.nb_groupes)
+        repartition = {}
+        for niveau, entrees in self.entrees.items():
+            total = self.niveaux[niveau]
+            vals, somme = [], 0
+            for entry in entrees:
+                txt = entry.get().strip()
+                if txt:
+                    val = int(txt)
+                    if val < 0 or val > total:
+                        raise ValueError("Valeur incohérente !")
+                    vals.append(val)
+                    somme += val
+            restants = self.nb_groupes - len(vals)
+            base = (total - somme) // restants if restants > 0 else 0
+            surplus = (total - somme) % restants if restants > 0 else 0
+            for j in range(restants - 1):
+                vals.append(base + (1 if j < surplus else 0))
+            vals.append(total - sum(vals))
+            repartition[niveau] = vals
+        verifier_coherence_repartition(repartition, self.niveaux, self.nb_groupes)
+        return repartition
+
+    def planifier_analyse(self, event=None):
+        # Analyse relancée 150 ms après la dernière frappe (pas à chaque touche d'une saisie rapide)
+        if self._analyse_prevue is not None:
+            self.after_cancel(self._analyse_prevue)
+        self._analyse_prevue = self.after(150, self.analyser_saisie)
+
+    def analyser_saisie(self):
+        """
+        Répétitions inévitables avec la répartition saisie et quotas proches qui en feraient moins,
+        recalculées en direct (quelques millisecondes, historique calculé une fois par fichier).
+        """
+        from MakeGroups import analyser_repartition, historique_groupes_par_eleve, GROUPES_MAX_ANALYSE
+        self._analyse_prevue = None
+        if self.label_analyse is None or not self.label_analyse.winfo_exists():
+            return
         try:
-            # Détermination de la répartition selon la saisie utilisateur
-            if all(all(not entry.get().strip() for entry in entrees) for entrees in self.entrees.values()):
-                repartition = generer_repartition_auto(self.df, self.nb_groupes)
+            repartition = self.lire_repartition()
+        except Exception as e:
+            self.label_analyse.configure(text=f"Saisie incomplète ou incohérente : {e}", fg="#888")
+            return
+        if self.histo is None:
+            self.histo = historique_groupes_par_eleve(self.df, self.nb_groupes).to_numpy()
+        lignes, alerte = [], False
+        for niveau, res in analyser_repartition(self.df, repartition, self.histo).items():
+            if res["repetitions_min"] is None:
+                ligne = (f"Niveau {niveau} : répétitions inévitables non calculées "
+                         f"au-delà de {GROUPES_MAX_ANALYSE} groupes")
             else:
-                repartition = {}
-                for niveau, entrees in self.entrees.items():
-                    total = self.niveaux[niveau]
-                    vals, somme = [], 0
-                    for entry in entrees:
-                        txt = entry.get().strip()
-                        if txt:
-                            val = int(txt)
-                            if val < 0 or val > total:
-                                raise ValueError("Valeur incohérente !")
-                            vals.append(val)
-                            somme += val
-                    restants = self.nb_groupes - len(vals)
-                    base = (total - somme) // restants if restants > 0 else 0
-                    surplus = (total - somme) % restants if restants > 0 else 0
-                    for j in range(restants - 1):
-                        vals.append(base + (1 if j < surplus else 0))
-                    vals.append(total - sum(vals))
-                    repartition[niveau] = vals
-
-            verifier_coherence_repartition(repartition, self.niveaux, self.nb_groupes)
-            groupes = generer_groupes(self.df, self.nb_groupes, repartition)
+                ligne = f"Niveau {niveau} : {res['repetitions_min']} répétition(s) inévitable(s)"
+            if res["groupes_vides"]:
+                ligne += f", groupe(s) vide(s) : {', '.join(map(str, res['groupes_vides']))}"
+                alerte = True
+            if res["suggestion"] is not None:
+                ligne += (f" — avec {res['suggestion']} ({res['deplacements']} place(s) déplacée(s)) : "
+                          f"{res['repetitions_suggestion']}")
+            alerte = alerte or bool(res["repetitions_min"])
+            lignes.append(ligne)
+        self.label_analyse.configure(text="\n".join(lignes), fg="#C75A4A" if alerte else "#2E7D32")
 
+    def afficher_recapitulatif(self):
+        reinitialiser_trace()
+        try:
+            repartition = self.lire_repartition()
+            texte_graine = self.graine_var.get().strip()
+            if texte_graine and not texte_graine.isdigit():
+                raise ValueError("La graine doit être un nombre entier positif (ou vide pour un tirage au hasard).")
+            graine = int(texte_graine) if texte_graine else None
+        except Exception as e:
+            self.afficher_message("Erreur de saisie", str(e), type="error")
+            return
+
+        methode = METHODES[self.methode_var.get()]
+
+        def travail(rapport):
+            from MakeGroups import generer_groupes
+            rapport("Génération des groupes…", 0.0)
+            return generer_groupes(
+                self.df, self.nb_groupes, repartition, methode=methode, avec_repetitions=True, seed=graine,
+                progression=lambda fraction: rapport("Génération des groupes…", fraction)
+            )
+
+        TacheDeFond(self, "Génération des groupes", travail, lambda res: self.ouvrir_recapitulatif(*res),
+                    lambda e: self.afficher_message("Erreur lors de la génération", str(e), type="error"))
+
+    def ouvrir_recapitulatif(self, groupes, repetitions):
+        from MakeGroups import ModeleGroupes, ajouter_groupes_au_df
+        try:
+            from tksheet import Sheet
             # --- Fenêtre récap ---
             recap = tk.Toplevel(self)
             recap.title("Récapitulatif des groupes")
@@ -226,52 +483,58 @@ class Application(tk.Tk):
                        [f"Niveau {n}" for n in sorted(self.niveaux)] + \
                        [f"Classe {c}" for c in sorted(self.df['Classe'].unique())]
 
-            tree = ttk.Treeview(recap, columns=colonnes, show="headings", height=len(groupes))
+            tree = ttk.Treeview(recap, columns=colonnes, show="headings", height=min(len(groupes), 12))
             for col in colonnes:
                 tree.heading(col, text=col)
                 tree.column(col, width=100, anchor="center")
             tree.pack(fill="x", padx=20, pady=10)
 
-            for i, g in enumerate(groupes):
-                ligne = [f"Groupe {i+1}", len(g)]
-                for n in sorted(self.niveaux):
-                    ligne.append(len(g[g["Niveau"] == n]))
-                for c in sorted(self.df["Classe"].unique()):
-                    ligne.append(len(g[g["Classe"] == c]))
-                tree.insert("", "end", values=ligne)
+            # Modèle éditable : compteurs par groupe/niveau/classe tenus à jour à chaque déplacement
+            columns = ["Nom", "Prenom", "Niveau"]
+            modele = ModeleGroupes(self.df, groupes, columns)
+            for i in range(len(modele)):
+                tree.insert("", "end", iid=f"g{i}", values=modele.resume(i))
 
-            effectifs = [len(g) for g in groupes]
+            effectifs = modele.effectifs()
             warning = ""
             if min(effectifs) == 0:
                 warning = "⚠️ Certains groupes sont vides !"
             elif max(effectifs) - min(effectifs) > 2:
                 warning = "⚠️ Les groupes sont déséquilibrés."
+            graine = self.graine_var.get().strip() or "aucune (tirage au hasard)"
+            tk.Label(recap, text=f"🔁 Élèves replacés dans un groupe déjà fait : {repetitions}    🎲 Graine : {graine}",
+                     font=("Segoe UI", 11), bg="#F7F9FA").pack(pady=(0, 4))
             if warning:
                 tk.Label(recap, text=warning, fg="#C75A4A", font=("Segoe UI", 11, "bold"), bg="#F7F9FA").pack(pady=8)
 
-            # --- Tableaux d'édition (tksheet)
+            # --- Tableaux d'édition (tksheet), paginés : seuls les groupes visibles ont une feuille,
+            # remplie à l'affichage ; le nombre de feuilles créées ne dépend pas du nombre de groupes
             edit_frame = tk.Frame(recap, bg="#F7F9FA")
             edit_frame.pack(fill="x", padx=15, pady=8)
 
-            sheets = []
-            group_data = []
-            columns = ["Nom", "Prenom", "Niveau"]
+            nb_visibles = max(1, min(len(modele), recap.winfo_screenwidth() // 520))
+            page = {"debut": 0}
+            sheets, titres = [], []
 
-            for g in groupes:
-                df_g = g.sort_values(by="Nom").reset_index(drop=True)
-                group_data.append(df_g)
+            pager = tk.Frame(edit_frame, bg="#F7F9FA")
+            pager.pack(fill="x")
+            bouton_prec = ttk.Button(pager, text="◀", width=3, command=lambda: afficher(page["debut"] - nb_visibles))
+            bouton_prec.pack(side="left")
+            bouton_suiv = ttk.Button(pager, text="▶", width=3, command=lambda: afficher(page["debut"] + nb_visibles))
+            bouton_suiv.pack(side="right")
+            info_page = tk.Label(pager, font=("Segoe UI", 10), bg="#F7F9FA")
+            info_page.pack()
 
             header_row = tk.Frame(edit_frame, bg="#F7F9FA")
             header_row.pack(fill="x")
-            for idx in range(self.nb_groupes):
-                tk.Label(header_row, text=f"Groupe {idx+1}", font=("Segoe UI", 12, "bold"), bg="#F7F9FA", width=45, anchor="center").pack(side="left", padx=15, pady=(0,4))
-
             table_row = tk.Frame(edit_frame, bg="#F7F9FA")
             table_row.pack(fill="x")
 
-            for idx in range(self.nb_groupes):
+            for emplacement in range(nb_visibles):
+                titre = tk.Label(header_row, font=("Segoe UI", 12, "bold"), bg="#F7F9FA", width=45, anchor="center")
+                titre.pack(side="left", padx=15, pady=(0,4))
+                titres.append(titre)
                 sheet = Sheet(table_row,
-                              data=group_data[idx][columns].values.tolist(),
                               headers=columns,
                               width=450,
                               height=550)
@@ -282,77 +545,201 @@ class Application(tk.Tk):
                 ))
                 sheet.readonly_columns(columns=columns)
                 sheet.extra_bindings("cell_edit", lambda *a, **kw: "break")
-                sheet.grid(row=0, column=2*idx, padx=(0,0), pady=2)
+                sheet.grid(row=0, column=2*emplacement, padx=(0,0), pady=2)
                 sheets.append(sheet)
 
-                if idx < self.nb_groupes-1:
+                if emplacement < nb_visibles-1:
                     btns = tk.Frame(table_row, bg="#F7F9FA")
-                    btns.grid(row=0, column=2*idx+1, sticky="ns", padx=2)
-                    btn_right = ttk.Button(btns, text=">", width=3, command=lambda i=idx: transfer(i, i+1))
-                    btn_left = ttk.Button(btns, text="<", width=3, command=lambda i=idx+1: transfer(i, i-1))
+                    btns.grid(row=0, column=2*emplacement+1, sticky="ns", padx=2)
+                    btn_right = ttk.Button(btns, text=">", width=3, command=lambda e=emplacement: transfer(e, e+1))
+                    btn_left = ttk.Button(btns, text="<", width=3, command=lambda e=emplacement+1: transfer(e, e-1))
                     btn_right.pack(pady=2)
                     btn_left.pack(pady=2)
 
-            def update_treeview():
-                for row in tree.get_children():
-                    tree.delete(row)
-                for i, g in enumerate(group_data):
-                    ligne = [f"Groupe {i+1}", len(g)]
-                    for n in sorted(self.niveaux):
-                        ligne.append(len(g[g["Niveau"] == n]))
-                    for c in sorted(self.df["Classe"].unique()):
-                        ligne.append(len(g[g["Classe"] == c]))
-                    tree.insert("", "end", values=ligne)
+            def afficher(debut):
+                """
+                Affiche les groupes debut, debut+1... dans les feuilles existantes (remplies depuis le modèle).
+                """
+                debut = max(0, min(debut, len(modele) - nb_visibles))
+                page["debut"] = debut
+                for emplacement, sheet in enumerate(sheets):
+                    g = debut + emplacement
+                    titres[emplacement].configure(text=f"Groupe {g+1}")
+                    sheet.set_sheet_data(modele.lignes(g), reset_col_positions=False, redraw=False)
+                    sheet.deselect("all", redraw=False)
+                    sheet.redraw()
+                info_page.configure(text=f"Groupes {debut+1} à {debut+nb_visibles} sur {len(modele)}")
+                bouton_prec.state(["!disabled" if debut > 0 else "disabled"])
+                bouton_suiv.state(["!disabled" if debut + nb_visibles < len(modele) else "disabled"])
 
             def transfer(src, dest):
                 selected = sheets[src].get_selected_rows()
                 if not selected:
                     return
-                idx = list(selected)[0]
-                row_vals = group_data[src].iloc[idx]
-                # Supprimer du src
-                group_data[src] = group_data[src].drop(idx).reset_index(drop=True)
-                # Ajouter au dest
-                group_data[dest] = pd.concat([group_data[dest], pd.DataFrame([row_vals])], ignore_index=True)
-                # Trier les deux groupes
-                group_data[src] = group_data[src].sort_values(by="Nom").reset_index(drop=True)
-                group_data[dest] = group_data[dest].sort_values(by="Nom").reset_index(drop=True)
-                # Mettre à jour l'affichage
-                sheets[src].set_sheet_data(group_data[src][columns].values.tolist())
-                sheets[dest].set_sheet_data(group_data[dest][columns].values.tolist())
-                sheets[src].deselect("all")
-                sheets[dest].deselect("all")
-                update_treeview()
+                g_src, g_dest = page["debut"] + src, page["debut"] + dest
+                # Du bas vers le haut : les positions restant à traiter ne bougent pas
+                for idx in sorted(selected, reverse=True):
+                    eleve, nouvelle = modele.deplacer(g_src, idx, g_dest)
+                    # Mise à jour des seules lignes concernées
+                    sheets[src].delete_row(idx, undo=False, redraw=False)
+                    sheets[dest].insert_row(modele.ligne(eleve), idx=nouvelle, undo=False, redraw=False)
+                for i, g in ((src, g_src), (dest, g_dest)):
+                    sheets[i].deselect("all", redraw=False)
+                    sheets[i].redraw()
+                    tree.item(f"g{g}", values=modele.resume(g))
+
+            def aller_au_groupe(event):
+                # Un clic sur une ligne du tableau récapitulatif amène son groupe à l'écran
+                selection = tree.selection()
+                if selection:
+                    g = int(selection[0][1:])
+                    if not page["debut"] <= g < page["debut"] + nb_visibles:
+                        afficher(g)
+
+            tree.bind("<<TreeviewSelect>>", aller_au_groupe)
+            afficher(0)
 
             # --- Boutons Valider/Retour
             btns = ttk.Frame(recap)
             btns.pack(pady=18)
             def valider_final():
-                groupes_final = [df.copy() for df in group_data]
+                groupes_final = modele.groupes()
                 dossier_complet = filedialog.askdirectory(
                     title="Choisissez le dossier où enregistrer les fichiers de groupes"
                 )
                 if not dossier_complet:
                     return
-                try:
-                    dossier_complet, nom_classes, periode = ajouter_groupes_au_df(
-                        self.df, groupes_final, self.chemin_fichier, dossier_complet
+                reinitialiser_trace()
+
+                def travail(rapport):
+                    # Une fois l'écriture commencée, l'annulation n'est plus proposée :
+                    # le fichier élèves et les groupes d'une période restent cohérents
+                    rapport("Enregistrement des groupes…", 0.0, annulable=False)
+                    dossier, _, _ = ajouter_groupes_au_df(
+                        self.df, groupes_final, self.chemin_fichier, dossier_complet, format="xlsx",
+                        progression=lambda fraction: rapport("Enregistrement des groupes…", fraction, annulable=False)
                     )
-                    sauvegarder_groupes(groupes_final, dossier_complet, nom_classes, periode)
+                    return dossier
+
+                def succes(dossier):
                     recap.destroy()
+                    # self.df a reçu la nouvelle période : l'historique de l'analyse est à recalculer
+                    self.histo = None
                     self.afficher_message(
                         "Groupes créés avec succès",
-                        f"Tous les fichiers ont été enregistrés dans le dossier :\n\n{dossier_complet}",
+                        f"Tous les fichiers ont été enregistrés dans le dossier :\n\n{dossier}",
                         type="info"
                     )
-                except Exception as e:
-                    self.afficher_message("Erreur lors de la génération", str(e), type="error")
+
+                TacheDeFond(recap, "Enregistrement des groupes", travail, succes,
+                            lambda e: self.afficher_message("Erreur lors de la génération", str(e), type="error"))
 
             ttk.Button(btns, text="Valider et Générer", command=valider_final).pack(side="left", padx=8)
             ttk.Button(btns, text="Retour", command=recap.destroy).pack(side="left", padx=8)
 
         except Exception as e:
-            self.afficher_message("Erreur de saisie", str(e), type="error")
+            self.afficher_message("Erreur lors de l'affichage du récapitulatif", str(e), type="error")
+
+    # ==========================================================================
+    # Statistiques de rotation (suivi de chaque élève sur toutes les périodes)
+    # ==========================================================================
+
+    def afficher_statistiques(self):
+        reinitialiser_trace()
+
+        def travail(rapport):
+            from MakeGroups import statistiques_rotation
+            rapport("Calcul des statistiques…")
+            return statistiques_rotation(self.df, self.nb_groupes)
+
+        TacheDeFond(self, "Statistiques de rotation", travail, self.ouvrir_statistiques,
+                    lambda e: self.afficher_message("Erreur lors du calcul des statistiques", str(e), type="error"))
+
+    def ouvrir_statistiques(self, statistiques):
+        from MakeGroups import exporter_statistiques
+        fenetre = tk.Toplevel(self)
+        fenetre.title("Statistiques de rotation")
+        fenetre.configure(bg="#F7F9FA")
+
+        resume = "    ".join(f"{cle} : {valeur}" for cle, valeur in statistiques["resume"].items())
+        ttk.Label(fenetre, text=resume, background="#F7F9FA", font=("Segoe UI", 11)).pack(anchor="w", padx=15, pady=(12, 4))
+
+        def tableau(titre, df, hauteur):
+            ttk.Label(fenetre, text=titre, font=("Segoe UI", 12, "bold"), background="#F7F9FA").pack(anchor="w", padx=15, pady=(10, 2))
+            colonnes = [str(c) for c in df.columns]
+            tree = ttk.Treeview(fenetre, columns=colonnes, show="headings", height=min(len(df), hauteur))
+            for col in colonnes:
+                tree.heading(col, text=col)
+                tree.column(col, width=120, anchor="center")
+            for ligne in df.itertuples(index=False):
+                tree.insert("", "end", values=list(ligne))
+            tree.pack(fill="x", padx=15)
+
+        tableau("Par période", statistiques["periodes"], 8)
+        eleves = statistiques["eleves"]
+        # Seuls les élèves au tour compromis sont listés (le rapport exporté contient tous les élèves)
+        a_risque = eleves[eleves["Tour compromis"]].sort_values(["Couverture (%)", "Classe", "Nom"])
+        tableau(f"Élèves qui ne pourront pas finir le tour ({len(a_risque)})",
+                a_risque.drop(columns=["Tour compromis"]), 15)
+
+        def exporter():
+            chemin = filedialog.asksaveasfilename(
+                title="Enregistrer le rapport de statistiques", defaultextension=".xlsx",
+                filetypes=[("Classeur Excel", "*.xlsx")], initialfile="Statistiques_rotation.xlsx",
+            )
+            if not chemin:
+                return
+            TacheDeFond(fenetre, "Export des statistiques",
+                        lambda rapport: exporter_statistiques(statistiques, chemin),
+                        lambda chemin: self.afficher_message("Rapport enregistré", chemin, type="info"),
+                        lambda e: self.afficher_message("Erreur lors de l'export", str(e), type="error"))
+
+        btns = ttk.Frame(fenetre)
+        btns.pack(pady=12)
+        ttk.Button(btns, text="Exporter le rapport (Excel)", command=exporter).pack(side="left", padx=8)
+        ttk.Button(btns, text="Fermer", command=fenetre.destroy).pack(side="left", padx=8)
+
+    # ==========================================================================
+    # Diagnostic : temps de chaque étape
+    # ==========================================================================
+
+    def basculer_trace(self):
+        if self.trace_var.get():
+            activer_trace()
+        else:
+            desactiver_trace()
+
+    def afficher_temps(self):
+        evenements = sorted(evenements_trace(), key=lambda e: e["debut"])
+        demarrage = ("" if self.temps_demarrage is None
+                     else f"Fenêtre affichée {self.temps_demarrage:.2f} s après le lancement.")
+        if not evenements:
+            self.afficher_message(
+                "Temps d'exécution",
+                (demarrage + "\n\n" if demarrage else "") +
+                "Aucune mesure disponible.\nCochez « Mesurer les temps d'exécution » puis relancez l'opération.",
+                type="info"
+            )
+            return
+        fenetre = tk.Toplevel(self)
+        fenetre.title("Temps de la dernière exécution")
+        fenetre.configure(bg="#F7F9FA")
+        if demarrage:
+            ttk.Label(fenetre, text=demarrage, background="#F7F9FA").pack(anchor="w", padx=15, pady=(12, 0))
+        colonnes = ["Étape", "Durée (ms)", "Lignes en entrée", "Lignes en sortie", "Pic mémoire (Mo)"]
+        tree = ttk.Treeview(fenetre, columns=colonnes, show="headings", height=min(len(evenements), 25))
+        for col in colonnes:
+            tree.heading(col, text=col)
+            tree.column(col, width=260 if col == "Étape" else 130, anchor="w" if col == "Étape" else "center")
+        for e in evenements:
+            tree.insert("", "end", values=[
+                "    " * e["profondeur"] + e["etape"],
+                f"{e['duree'] * 1000:.1f}",
+                "" if e["lignes_entree"] is None else e["lignes_entree"],
+                "" if e["lignes_sortie"] is None else e["lignes_sortie"],
+                "" if e["pic_memoire"] is None else f"{e['pic_memoire'] / 1e6:.1f}",
+            ])
+        tree.pack(fill="both", expand=True, padx=15, pady=15)
 
     # ==========================================================================
     # Messages pop-up : info, warning, erreur
@@ -371,5 +758,6 @@ class Application(tk.Tk):
 # ==============================================================================
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # pool de processus de l'optimiseur dans l'exécutable PyInstaller
     app = Application()
     app.mainloop()
@@ -0,0 +1,417 @@
+"""
+Tests MakeGroups V3
+-------------------
+- calculs exacts comparés, sur de petits cas tirés au hasard, à une énumération exhaustive
+- enregistrement d'une période, identités des élèves (homonymes) et historique
+Le cache des fichiers élèves et des résultats (DOSSIER_CACHE) est redirigé vers un dossier temporaire.
+
+Lancement :
+    python -m pytest -q
+"""
+
+import itertools
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import MakeGroups
+from MakeGroups_CLI import lister_fichiers
+from MakeGroups_Historique import BaseHistorique
+from MakeGroups import (
+    GroupesAffectes,
+    _suggerer_quotas,
+    _transport_cout_min,
+    ajouter_groupes_au_df,
+    analyser_repartition,
+    charger_fichier,
+    colonnes_periodes,
+    ecrire_fichiers,
+    generer_groupes,
+    generer_repartition_auto,
+    historique_groupes_par_eleve,
+    homonymes,
+    identites,
+    reaffecter_groupes,
+    repetitions_minimales,
+)
+
+@pytest.fixture(autouse=True)
+def cache_temporaire(tmp_path, monkeypatch):
+    monkeypatch.setattr(MakeGroups, "DOSSIER_CACHE", str(tmp_path / "cache"))
+
+def _eleves(lignes):
+    """
+    Fichier élèves (Classe, Nom, Prenom, Niveau) à partir de tuples.
+    """
+    return pd.DataFrame(lignes, columns=['Classe', 'Nom', 'Prenom', 'Niveau'])
+
+# ==============================================================================
+# 0. Énumération exhaustive (référence)
+# ==============================================================================
+
+def _affectations(demandes):
+    """
+    Toutes les affectations distinctes d'élèves à des places : tuples des groupes, dans l'ordre des élèves.
+    """
+    places = [g for g, d in enumerate(demandes) for _ in range(d)]
+    return set(itertools.permutations(places))
+
+def _cout_min_exhaustif(offres, demandes, couts):
+    types = [t for t, o in enumerate(offres) for _ in range(o)]
+    return min(sum(couts[t][g] for t, g in zip(types, affectation)) for affectation in _affectations(demandes))
+
+def _repetitions_min_exhaustif(histo_niveau, quotas):
+    if len(histo_niveau) == 0:
+        return 0
+    return min(
+        sum(int(histo_niveau[e][g] > 0) for e, g in enumerate(affectation))
+        for affectation in _affectations(quotas)
+    )
+
+def _tirage_histo(rng, nb_eleves, nb_groupes):
+    return (rng.random((nb_eleves, nb_groupes)) < 0.5) * rng.integers(1, 3, (nb_eleves, nb_groupes))
+
+def _tirage_quotas(rng, nb_eleves, nb_groupes):
+    coupures = np.sort(rng.integers(0, nb_eleves + 1, nb_groupes - 1))
+    return np.diff(np.concatenate([[0], coupures, [nb_eleves]])).tolist()
+
+# ==============================================================================
+# 1. Lecture des fichiers élèves
+# ==============================================================================
+
+@pytest.mark.parametrize("encodage", ["utf-8", "utf-8-sig", "latin1"])
+def test_csv_lu_quel_que_soit_son_encodage(tmp_path, encodage):
+    chemin = tmp_path / "601.csv"
+    chemin.write_bytes("Classe,Nom,Prénom,Niveau\n601,Brûlé,Élodie,6\n".encode(encodage))
+
+    df = charger_fichier(str(chemin))
+
+    assert df[['Nom', 'Prenom']].values.tolist() == [['Brûlé', 'Élodie']]
+    assert charger_fichier(str(chemin)).equals(df)  # relu depuis le cache
+
+# ==============================================================================
+# 2. Transport à coût minimal (méthode optimale)
+# ==============================================================================
+
+@pytest.mark.parametrize("graine", range(200))
+def test_transport_cout_min_egale_enumeration(graine):
+    rng = np.random.default_rng(graine)
+    nb_groupes = int(rng.integers(1, 4))
+    nb_types = int(rng.integers(1, 4))
+    nb_eleves = int(rng.integers(0, 7))
+    offres = _tirage_quotas(rng, nb_eleves, nb_types)
+    demandes = _tirage_quotas(rng, nb_eleves, nb_groupes)
+    couts = rng.integers(0, 5, (nb_types, nb_groupes))
+
+    flux = _transport_cout_min(offres, demandes, couts)
+
+    assert flux.min(initial=0) >= 0
+    assert flux.sum(axis=1).tolist() == offres
+    assert flux.sum(axis=0).tolist() == demandes
+    assert int((flux * couts).sum()) == _cout_min_exhaustif(offres, demandes, couts.tolist())
+
+# ==============================================================================
+# 3. Répétitions inévitables (borne de Hall) et suggestion de quotas
+# ==============================================================================
+
+@pytest.mark.parametrize("graine", range(200))
+def test_repetitions_minimales_egale_enumeration(graine):
+    rng = np.random.default_rng(graine)
+    nb_groupes = int(rng.integers(1, 5))
+    nb_eleves = int(rng.integers(0, 8))
+    histo = _tirage_histo(rng, nb_eleves, nb_groupes)
+    quotas = _tirage_quotas(rng, nb_eleves, nb_groupes)
+
+    assert repetitions_minimales(histo, quotas) == _repetitions_min_exhaustif(histo, quotas)
+
+@pytest.mark.parametrize("graine", range(50))
+def test_repetitions_minimales_par_transport(graine, monkeypatch):
+    # Au-delà de GROUPES_MAX_ANALYSE, la borne est calculée par transport : même résultat
+    monkeypatch.setattr(MakeGroups, "GROUPES_MAX_ANALYSE", 0)
+    rng = np.random.default_rng(graine)
+    nb_groupes = int(rng.integers(1, 5))
+    nb_eleves = int(rng.integers(1, 8))
+    histo = _tirage_histo(rng, nb_eleves, nb_groupes)
+    quotas = _tirage_quotas(rng, nb_eleves, nb_groupes)
+
+    assert repetitions_minimales(histo, quotas) == _repetitions_min_exhaustif(histo, quotas)
+
+@pytest.mark.parametrize("graine", range(100))
+def test_suggestion_de_quotas_atteint_son_minimum(graine):
+    rng = np.random.default_rng(graine)
+    nb_groupes = int(rng.integers(2, 5))
+    nb_eleves = int(rng.integers(1, 8))
+    histo = _tirage_histo(rng, nb_eleves, nb_groupes)
+    quotas = _tirage_quotas(rng, nb_eleves, nb_groupes)
+
+    suggestion = _suggerer_quotas(histo, quotas, max_deplacements=nb_eleves)
+
+    if suggestion is not None:
+        nouveaux, minimum, deplacements = suggestion
+        assert sum(nouveaux) == nb_eleves and min(nouveaux) >= 0
+        assert minimum == _repetitions_min_exhaustif(histo, nouveaux)
+        assert minimum < _repetitions_min_exhaustif(histo, quotas)
+        assert deplacements >= sum(max(n - q, 0) for n, q in zip(nouveaux, quotas))
+
+def test_analyse_de_la_saisie_bornee_en_nombre_de_groupes(monkeypatch):
+    df = _eleves([("601", f"Nom{i}", "Élève", "6") for i in range(6)])
+    histo = np.array([[1, 0, 0], [1, 0, 0], [1, 0, 0], [0, 1, 0], [0, 0, 1], [0, 0, 0]])
+    repartition = {"6": [4, 1, 1]}
+
+    analyse = analyser_repartition(df, repartition, histo)["6"]
+    assert analyse["repetitions_min"] == repetitions_minimales(histo, [4, 1, 1]) == 1
+    assert analyse["suggestion"] is not None
+
+    # Au-delà de GROUPES_MAX_ANALYSE, la borne n'est pas calculée pendant la saisie (transport trop lent)
+    monkeypatch.setattr(MakeGroups, "GROUPES_MAX_ANALYSE", 2)
+    analyse = analyser_repartition(df, repartition, histo)["6"]
+    assert analyse["repetitions_min"] is None and analyse["suggestion"] is None
+
+# ==============================================================================
+# 4. Enregistrement d'une période
+# ==============================================================================
+
+@pytest.mark.parametrize("liste", [False, True])
+def test_homonymes_gardent_chacun_leur_groupe(tmp_path, liste):
+    df = _eleves([
+        ('601', 'Martin', 'Léa', '6'),
+        ('601', 'Durand', 'Paul', '6'),
+        ('601', 'Martin', 'Léa', '6'),
+        ('601', 'Petit', 'Hugo', '6'),
+    ])
+    groupes = GroupesAffectes(df, [0, 1, 1, 0], 2)
+    if liste:
+        # Ancienne interface : liste de DataFrames qui conservent l'index de df
+        groupes = [groupes[0], groupes[1]]
+
+    dossier, nom_classes, periode = ajouter_groupes_au_df(df, groupes, "601.csv", str(tmp_path), format="xlsx")
+
+    assert periode == 1
+    assert df["Groupe Période 1"].tolist() == [1, 2, 2, 1]
+    relu = charger_fichier(os.path.join(dossier, f"{nom_classes}_Période1.xlsx"), cache=False)
+    assert colonnes_periodes(relu) == {"Groupe periode 1": 1}
+    assert relu["Groupe periode 1"].tolist() == [1, 2, 2, 1]
+    for g in (1, 2):
+        groupe = charger_fichier(os.path.join(dossier, f"{nom_classes}_Groupe{g}_Période1.xlsx"), cache=False)
+        assert (groupe["Nom"] == "Martin").sum() == 1
+        assert not colonnes_periodes(groupe)
+
+def test_export_incremental_sans_fichier_annexe(tmp_path):
+    dossier = str(tmp_path / "601_Période1")
+    df = _eleves([('601', 'Martin', 'Léa', '6'), ('601', 'Durand', 'Paul', '6')])
+    fichiers = {"a.csv": {"A": df}, "b.csv": {"B": df.iloc[:1]}}
+
+    assert len(ecrire_fichiers(dossier, fichiers)) == 2
+    assert sorted(os.listdir(dossier)) == ["a.csv", "b.csv"]
+    assert ecrire_fichiers(dossier, fichiers) == []
+    # Un fichier modifié à la main depuis l'export est réécrit, même si le contenu voulu n'a pas changé
+    with open(os.path.join(dossier, "b.csv"), "a", encoding="utf-8") as f:
+        f.write("modifié à la main\n")
+    assert ecrire_fichiers(dossier, fichiers) == [os.path.join(dossier, "b.csv")]
+
+# ==============================================================================
+# 5. Identités des élèves (normalisation, homonymes, migration de la base)
+# ==============================================================================
+
+def test_identite_independante_de_l_ecriture():
+    df = _eleves([
+        ('601', 'Martin', 'Élodie ', '6'),
+        (' 601', 'MARTIN', 'elodie', '6'),
+        ('601', 'Martin', 'Élodie-Anne', '6'),
+        ('601', "D'Arc", 'Jeanne', '6'),
+    ])
+    autre = _eleves([('601', 'martin ', 'ELODIE', '6'), ('601', 'Martin', 'elodie  anne', '6'),
+                     ('601', 'd arc', 'jeanne', '6')])
+
+    cles = identites(df)
+
+    assert cles['prenom'].tolist() == ['elodie', 'elodie', 'elodie anne', 'jeanne']
+    assert cles['nom'].tolist()[3] == 'd arc'
+    # Les deux premières lignes sont la même identité normalisée : deux homonymes de rangs 0 et 1
+    assert cles['rang'].tolist() == [0, 1, 0, 0]
+    assert cles['id'].nunique() == 4
+    assert identites(autre)['id'].tolist() == cles['id'].iloc[[0, 2, 3]].tolist()
+
+def test_homonymes_gardent_rang_et_historique(tmp_path):
+    df = _eleves([
+        ('601', 'Martin', 'Léa', '6'),
+        ('601', 'Durand', 'Paul', '6'),
+        ('601', 'Martin', 'Lea', '6'),
+    ])
+    df['Groupe Période 1'] = [1, 2, 2]
+    df['Groupe Période 2'] = [2, 1, 1]
+
+    assert homonymes(df) == ["Léa Martin (601) ×2"]
+    assert identites(df)['rang'].tolist() == [0, 0, 1]
+    attendu = [[1, 1], [1, 1], [1, 1]]
+    assert historique_groupes_par_eleve(df, 2).to_numpy().tolist() == attendu
+    with BaseHistorique(str(tmp_path / "h.sqlite")) as base:
+        base.importer_df(df)
+        (nb_eleves,) = base.connexion.execute("SELECT COUNT(*) FROM eleves").fetchone()
+        assert nb_eleves == 3
+        assert base.matrice_historique(df, 2).to_numpy().tolist() == attendu
+        # Chaque homonyme garde ses propres groupes, dans l'ordre du fichier
+        periode1 = base.vers_df(df.drop(columns=['Groupe Période 1', 'Groupe Période 2']))
+        assert pd.to_numeric(periode1[next(iter(colonnes_periodes(periode1)))]).tolist() == [1, 2, 2]
+
+def test_migration_fusionne_les_ecritures_sans_perdre_d_affectation(tmp_path):
+    chemin = str(tmp_path / "ancienne.sqlite")
+    # Base créée avant les identités normalisées : pas de colonne cle, noms tels que saisis
+    ancienne = sqlite3.connect(chemin)
+    ancienne.executescript("""
+        CREATE TABLE eleves (
+            id INTEGER PRIMARY KEY, nom TEXT NOT NULL, prenom TEXT NOT NULL, classe TEXT NOT NULL,
+            rang INTEGER NOT NULL, niveau TEXT NOT NULL, UNIQUE (nom, prenom, classe, rang)
+        );
+        CREATE TABLE affectations (
+            eleve_id INTEGER NOT NULL REFERENCES eleves (id), periode INTEGER NOT NULL,
+            groupe INTEGER NOT NULL, PRIMARY KEY (eleve_id, periode)
+        );
+        INSERT INTO eleves VALUES (1, 'Martin', 'Élodie ', '601', 0, '6');
+        INSERT INTO eleves VALUES (2, 'MARTIN', 'elodie', '601', 0, '6');
+        INSERT INTO eleves VALUES (3, 'Durand', 'Paul', '601', 0, '6');
+        INSERT INTO eleves VALUES (4, 'Durand', 'Paul', '601', 1, '6');
+        INSERT INTO affectations VALUES (1, 1, 1), (1, 2, 2), (2, 3, 3), (2, 2, 2), (3, 1, 2), (4, 1, 3);
+    """)
+    ancienne.commit()
+    ancienne.close()
+
+    with BaseHistorique(chemin) as base:
+        eleves = base.connexion.execute("SELECT id, nom, prenom FROM eleves ORDER BY id").fetchall()
+        affectations = base.connexion.execute(
+            "SELECT eleve_id, periode, groupe FROM affectations ORDER BY eleve_id, periode").fetchall()
+        df = _eleves([('601', 'Martin', 'Elodie', '6'), ('601', 'Durand', 'Paul', '6'),
+                      ('601', 'Durand', 'Paul', '6')])
+        matrice = base.matrice_historique(df, 3).to_numpy().tolist()
+
+    assert eleves == [(1, 'martin', 'elodie'), (3, 'durand', 'paul'), (4, 'durand', 'paul')]
+    assert affectations == [(1, 1, 1), (1, 2, 2), (1, 3, 3), (3, 1, 2), (4, 1, 3)]
+    assert matrice == [[1, 1, 1], [0, 1, 0], [0, 0, 1]]
+
+def _archiver_annee(dossier, df, nb_periodes, nb_groupes=3):
+    """
+    Dossiers <classes>_PériodeX d'une année, comme l'outil les écrit (classeur élèves et fichiers de groupes).
+    """
+    for p in range(1, nb_periodes + 1):
+        groupes = generer_groupes(df, nb_groupes, generer_repartition_auto(df, nb_groupes), seed=p, cache=False)
+        ajouter_groupes_au_df(df, groupes, "601.csv", dossier, format="xlsx")
+    return df
+
+def test_archives_de_plusieurs_annees_separees(tmp_path):
+    annee_2024 = _archiver_annee(str(tmp_path / "2024"), _eleves(
+        [("601", f"Ancien{i}", "Élève", "6") for i in range(9)]), 3)
+    annee_2025 = _archiver_annee(str(tmp_path / "2025"), _eleves(
+        [("601", f"Nouveau{i}", "Élève", "6") for i in range(9)]), 1)
+
+    with BaseHistorique(str(tmp_path / "h.sqlite")) as base:
+        bilan = base.importer_archives(str(tmp_path), nb_processus=1)
+        assert bilan["dossiers"] == 4 and bilan["eleves"] == 4 * 9
+        # Même classe, autres élèves : chaque année garde ses périodes
+        assert base.prochaine_periode(annee_2025) == 2
+        assert base.prochaine_periode(annee_2024) == 4
+        assert base.matrice_historique(annee_2024, 3).to_numpy().sum(axis=1).tolist() == [3] * 9
+        assert base.matrice_historique(annee_2025, 3).to_numpy().sum(axis=1).tolist() == [1] * 9
+
+        # Élève retiré à la main d'un fichier de groupe de 2025 : seule son affectation disparaît
+        dossier = tmp_path / "2025" / "601_Période1"
+        groupe = annee_2025["Groupe Période 1"].iloc[0]
+        chemin = dossier / f"601_Groupe{groupe}_Période1.xlsx"
+        retouche = pd.read_excel(chemin)
+        retouche[retouche["Nom"] != "Nouveau0"].to_excel(chemin, index=False)
+        assert base.importer_archives(str(tmp_path), nb_processus=1)["lus"] == 1
+        assert base.matrice_historique(annee_2025, 3).to_numpy().sum(axis=1).tolist() == [0] + [1] * 8
+        assert base.matrice_historique(annee_2024, 3).to_numpy().sum(axis=1).tolist() == [3] * 9
+
+# ==============================================================================
+# 6. Mise à jour d'une période après un changement d'effectif
+# ==============================================================================
+
+def _annee(nb_periodes, nb_groupes=3):
+    """
+    Deux classes, deux niveaux, et nb_periodes périodes déjà générées.
+    """
+    df = _eleves([(f"60{1 + i % 2}", f"Nom{i}", f"Prénom{i}", "6" if i < 18 else "5") for i in range(27)])
+    for p in range(1, nb_periodes + 1):
+        groupes = generer_groupes(df, nb_groupes, generer_repartition_auto(df, nb_groupes), seed=p, cache=False)
+        df[f"Groupe Période {p}"] = groupes.affectation + 1
+    return df
+
+def _groupes_par_niveau(df, affectation, nb_groupes=3):
+    return {
+        niveau: np.bincount(affectation[(df['Niveau'] == niveau).to_numpy()], minlength=nb_groupes).tolist()
+        for niveau in ("6", "5")
+    }
+
+def test_mise_a_jour_ne_deplace_que_les_eleves_concernes():
+    precedent = _annee(2)
+    anciens = precedent["Groupe Période 2"].to_numpy() - 1
+    # Départ d'un élève de 6e, arrivée d'un autre en 6e, passage d'un élève de 5e en 6e et d'un élève de 6e en 5e
+    nouveau = precedent.drop(columns=["Groupe Période 1", "Groupe Période 2"]).drop(index=0)
+    nouveau.loc[20, "Niveau"] = "6"
+    nouveau.loc[5, "Niveau"] = "5"
+    nouveau = pd.concat([nouveau, _eleves([("601", "Nouvel", "Élève", "6")])], ignore_index=True)
+
+    groupes, details = reaffecter_groupes(precedent, nouveau, 3, avec_details=True, seed=0)
+
+    assert details["arrives"] == 1 and details["partis"] == 1 and details["changements_niveau"] == 2
+    # Quotas respectés : ceux de la répartition automatique, à une permutation des groupes près
+    comptes = _groupes_par_niveau(nouveau, groupes.affectation)
+    for niveau, quotas in generer_repartition_auto(nouveau, 3).items():
+        assert sorted(comptes[niveau]) == sorted(quotas)
+    # Les élèves restés dans leur niveau gardent leur groupe, à part les details["deplaces"] retirés d'un groupe trop plein
+    restes = [i for i in range(1, 27) if i not in (5, 20)]
+    avant = anciens[restes]
+    apres = groupes.affectation[[i - 1 for i in restes]]
+    assert (avant != apres).sum() == details["deplaces"] <= 1
+    # L'historique des périodes précédentes est repris dans groupes.df
+    assert list(colonnes_periodes(groupes.df).values()) == [1]
+
+def test_mise_a_jour_avec_repartition_imposee():
+    precedent = _annee(1)
+    nouveau = precedent.drop(columns=["Groupe Période 1"]).drop(index=[0, 1])
+    repartition = {"6": [6, 5, 5], "5": [3, 3, 3]}
+
+    groupes = reaffecter_groupes(precedent, nouveau, 3, repartition=repartition, seed=0)
+
+    assert _groupes_par_niveau(groupes.df, groupes.affectation) == repartition
+
+def test_historique_borne_a_periode_max(tmp_path):
+    df = _annee(3)
+    attendu = historique_groupes_par_eleve(df.drop(columns=["Groupe Période 3"]), 3).to_numpy()
+
+    assert (historique_groupes_par_eleve(df, 3, periode_max=2).to_numpy() == attendu).all()
+    with BaseHistorique(str(tmp_path / "h.sqlite")) as base:
+        base.importer_df(df)
+        assert (historique_groupes_par_eleve(df, 3, base, periode_max=2).to_numpy() == attendu).all()
+        assert historique_groupes_par_eleve(df, 3, base).to_numpy().sum() == 3 * len(df)
+
+def test_mise_a_jour_ignore_la_periode_reecrite_dans_la_base(tmp_path):
+    precedent = _annee(3)
+    # Tous les élèves de 5e passent en 6e : ils sont replacés d'après leur historique
+    nouveau = precedent.drop(columns=[c for c in colonnes_periodes(precedent)]).assign(Niveau="6")
+
+    sans_base, details = reaffecter_groupes(precedent, nouveau, 3, avec_details=True, seed=0)
+    with BaseHistorique(str(tmp_path / "h.sqlite")) as base:
+        base.importer_df(precedent)
+        avec_base, details_base = reaffecter_groupes(precedent, nouveau, 3, base_historique=base,
+                                                     avec_details=True, seed=0)
+
+    # La période 3, déjà dans la base, ne compte pas comme un groupe déjà fait
+    assert details_base["repetitions"] == details["repetitions"]
+    assert (avec_base.affectation == sans_base.affectation).all()
+
+# ==============================================================================
+# 7. Ligne de commande
+# ==============================================================================
+
+def test_lister_fichiers_ignore_les_sorties_de_l_outil(tmp_path):
+    for nom in ("601-602.csv", "505.xlsx", "601-602_Plan.xlsx", "601-602_Statistiques.xlsx", "notes.txt"):
+        (tmp_path / nom).write_bytes(b"")
+    (tmp_path / "601-602_Période1").mkdir()
+
+    attendus = [str(tmp_path / "505.xlsx"), str(tmp_path / "601-602.csv")]
+    assert lister_fichiers([str(tmp_path)]) == attendus
+    assert lister_fichiers([str(tmp_path / "*.*")]) == attendus